@@ -1,29 +1,26 @@
-import math
 import time
-import re
-import io
-import glob
 import os
-import zipfile
-import tempfile
-import subprocess
 from datetime import datetime, timedelta
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 import streamlit as st
-import openpyxl
-from openpyxl.styles import Alignment, Font, Border, Side
-from pptx import Presentation
-from pptx.util import Inches, Pt as Ppt_Pt
-from pptx.enum.text import PP_ALIGN
-from docx import Document
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.text import WD_LINE_SPACING
+from payslip_utils import DEFAULT_PAYSLIP_WORKERS, PAYSLIP_ENGINES, PDF_BACKENDS, PDF_MODES, PROGRESS_STAGES
+from pdf_converter import get_converter
+from payslip_jobs import get_job_queue, QUEUED, RUNNING, DONE, FAILED
+from payslip_metrics import configure_logging as configure_metrics_logging
+from report_export import get_custom_excel, build_meeting_deck
+from issue_text import renumber_issues
+from report_queries import HISTORY_QUERY, report_center_rows
+from report_search import SEARCH_LIMIT, SEARCH_ORDERS, search_reports, highlighted_markdown
+from meeting_order import vessel_key, read_order_file, load_meeting_order, save_meeting_order
+from query_cache import get_query_cache, SHIPS, REPORTS, MEETING_ORDER
+from db import get_engine
 
 # --- 1. Basic Configuration & CSS ---
 st.set_page_config(page_title="TSM Summary of Weekly Ship Reports", layout="wide")
+# 工资单生成的统计行是 INFO 级别，页面这边没有别的 logging 配置，单独给它开一个输出
+configure_metrics_logging()
 
 st.markdown("""
     <style>
@@ -46,783 +43,68 @@ if 'drafts' not in st.session_state: st.session_state.drafts = {}
 if 'editing_id' not in st.session_state: st.session_state.editing_id = None
 if 'confirm_del_id' not in st.session_state: st.session_state.confirm_del_id = None
 
-@st.cache_resource
-def get_engine():
-    return sqlalchemy.create_engine(st.secrets["postgres_url"])
-
-
-# --- 2. Report Generation Tools ---
 
 # --- 2. Report Generation Tools ---
 
-def generate_custom_excel(df, order_list=None):
-    """
-    生成 Excel：支持按自定义列表排序，逐行写入并动态合并相邻相同负责人的单元格
-    """
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Ship Report"
-
-    font_yahei = Font(name='微软雅黑', size=10)
-    font_yahei_bold = Font(name='微软雅黑', size=10, bold=True)
-    thin_side = Side(style='thin', color='000000')
-    black_border = Border(top=thin_side, left=thin_side, right=thin_side, bottom=thin_side)
-
-    ws.merge_cells('A1:C1')
-    ws['A1'] = f"Report Date: {datetime.now().strftime('%Y-%m-%d')}"
-    ws['A1'].font = Font(name='微软雅黑', size=12, bold=True)
-    ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-
-    headers = ['Manager Name', 'Vessel Name', 'Issue']
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=2, column=col_num, value=header)
-        cell.font = font_yahei_bold
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-        cell.border = black_border
-
-    def clean_and_reformat_issue(series):
-        all_lines = []
-        for content in series:
-            if content:
-                lines = str(content).split('\n')
-                for line in lines:
-                    clean_line = re.sub(r'^\d+[\.、\s]*', '', line.strip())
-                    if clean_line:
-                        all_lines.append(clean_line)
-        if not all_lines: return ""
-        return "\n".join([f"{i + 1}. {text}" for i, text in enumerate(all_lines)])
-
-    df_grouped = df.groupby(['manager_name', 'ship_name'])['this_week_issue'].apply(
-        clean_and_reformat_issue).reset_index()
-
-    # 💡 核心排序逻辑
-    if order_list is not None and len(order_list) > 0:
-        # 将顺序表转化为字典映射，忽略大小写和空格以防填错
-        order_map = {str(name).strip().upper(): i for i, name in enumerate(order_list)}
-        df_grouped['sort_order'] = df_grouped['ship_name'].astype(str).str.strip().str.upper().map(order_map)
-        # 顺序表里没有的船，排到最后面
-        df_grouped['sort_order'] = df_grouped['sort_order'].fillna(9999)
-        df_grouped = df_grouped.sort_values(by=['sort_order', 'ship_name'])
-    else:
-        df_grouped = df_grouped.sort_values(by=['manager_name', 'ship_name'])
-
-    current_row = 3
-    start_merge_row = 3
-    prev_manager = None
-
-    for idx, row_data in df_grouped.iterrows():
-        manager = row_data['manager_name']
-        ship = row_data['ship_name']
-        issue = row_data['this_week_issue']
-
-        cell_a = ws.cell(row=current_row, column=1, value=manager)
-        cell_b = ws.cell(row=current_row, column=2, value=ship)
-        cell_c = ws.cell(row=current_row, column=3, value=issue)
-
-        for cell in [cell_a, cell_b, cell_c]:
-            cell.font = font_yahei
-            cell.border = black_border
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-        cell_c.alignment = Alignment(wrap_text=True, horizontal='left', vertical='center')
-
-        # 动态合并相邻的负责人单元格
-        if prev_manager != manager:
-            if prev_manager is not None and current_row - 1 > start_merge_row:
-                ws.merge_cells(start_row=start_merge_row, start_column=1, end_row=current_row - 1, end_column=1)
-            start_merge_row = current_row
-            prev_manager = manager
-
-        current_row += 1
-
-    # 循环结束后，处理最后一块需要合并的单元格
-    if prev_manager is not None and current_row - 1 > start_merge_row:
-        ws.merge_cells(start_row=start_merge_row, start_column=1, end_row=current_row - 1, end_column=1)
-
-    ws.column_dimensions['A'].width = 20
-    ws.column_dimensions['B'].width = 25
-    ws.column_dimensions['C'].width = 70
-
-    output = io.BytesIO()
-    wb.save(output)
-    return output.getvalue()
-
-
-def create_ppt_report(df, start_date, end_date, order_list=None):
-    prs = Presentation()
-
-    slide_layout_title = prs.slide_layouts[0]
-    slide = prs.slides.add_slide(slide_layout_title)
-
-    try:
-        slide.shapes.add_picture("TSM_Logo.png", left=Inches(4.25), top=Inches(1.2), width=Inches(1.8))
-    except:
-        pass
-
-    title = slide.shapes.title
-    subtitle = slide.placeholders[1]
-    title.top = Inches(3.5)
-    title.text = "TSM Summary of Weekly Ship Reports"
-    subtitle.text = f"Creation Date: {datetime.now().strftime('%Y-%m-%d')}"
-    subtitle.top = Inches(4.5)
-
-    def clean_and_reformat_ppt(series):
-        all_lines = []
-        for content in series:
-            if content:
-                lines = str(content).split('\n')
-                for line in lines:
-                    clean_line = re.sub(r'^\d+[\.、\s]*', '', line.strip())
-                    if clean_line: all_lines.append(clean_line)
-        if not all_lines: return ""
-        return "\n".join([f"{i + 1}. {text}" for i, text in enumerate(all_lines)])
-
-    df_ppt = df.groupby(['manager_name', 'ship_name'], sort=False)['this_week_issue'].apply(
-        clean_and_reformat_ppt).reset_index()
-
-    # 💡 核心排序逻辑
-    if order_list is not None and len(order_list) > 0:
-        order_map = {str(name).strip().upper(): i for i, name in enumerate(order_list)}
-        df_ppt['sort_order'] = df_ppt['ship_name'].astype(str).str.strip().str.upper().map(order_map)
-        df_ppt['sort_order'] = df_ppt['sort_order'].fillna(9999)
-        df_ppt = df_ppt.sort_values(by=['sort_order', 'ship_name'])
-    else:
-        df_ppt = df_ppt.sort_values(by=['manager_name', 'ship_name'])
-
-    for _, row in df_ppt.iterrows():
-        manager = row['manager_name']
-        ship = row['ship_name']
-        issue_content = row['this_week_issue']
-
-        slide_layout_content = prs.slide_layouts[1]
-        slide = prs.slides.add_slide(slide_layout_content)
-
-        slide.shapes.title.text = f" {ship} ({manager})"
-        tf = slide.placeholders[1].text_frame
-        tf.word_wrap = True
-
-        if issue_content:
-            for line in issue_content.split('\n'):
-                p = tf.add_paragraph()
-                p.text = line
-                p.level = 0
-                p.font.size = Ppt_Pt(24)
-                p.font.name = '微软雅黑'
-
-    slide_layout_blank = prs.slide_layouts[6]
-    end_slide = prs.slides.add_slide(slide_layout_blank)
-    tx_box = end_slide.shapes.add_textbox(Inches(3), Inches(3.5), Inches(4), Inches(2))
-    tf_end = tx_box.text_frame
-    tf_end.text = "Thank you for watching."
-    p_end = tf_end.paragraphs[0]
-    p_end.alignment = PP_ALIGN.CENTER
-    p_end.font.size = Ppt_Pt(44)
-    p_end.font.bold = True
-    p_end.font.name = '微软雅黑'
-
-    ppt_out = io.BytesIO()
-    prs.save(ppt_out)
-    ppt_out.seek(0)
-    return ppt_out
-
-
-# ---------------------------------------------------------
-# payslips Generator Logic (工资单生成逻辑)
-# ---------------------------------------------------------
-def normalize_key(key):
-    if pd.isna(key): return ""
-    return re.sub(r'\s+', '', str(key)).lower()
-
-
-def clean_filename(name):
-    # 先转字符串，再去掉两端空格，再去掉 Windows/Linux 不允许的特殊字符
-    name = str(name).strip()
-    return re.sub(r'[\\/*?:"<>|]', "", name).strip()
-
-
-def get_rank_priority(rank_str):
-    """根据规定的职位顺序，将 Rank 转化为 1 到 99 的排序序号（仅供系统内部排序使用）"""
-    if not rank_str or pd.isna(rank_str): return 99
-    r = str(rank_str).upper().strip()
-
-    if 'MASTER' in r: return 1
-    if 'CHIEF OFFICER' in r: return 2
-    if '2ND OFFICER' in r or 'SECOND OFFICER' in r: return 3
-    if 'CHIEF ENGINEER' in r: return 4
-    if '2ND ENGINEER' in r or 'SECOND ENGINEER' in r: return 5
-    if '3RD ENGINEER' in r or 'THIRD ENGINEER' in r: return 6
-    if 'ASST BOSUN' in r or 'ASSISTANT BOSUN' in r: return 8
-    if 'BOSUN' in r and 'ASST' not in r: return 7
-    if 'COOK' in r: return 9
-    if r == 'AB' or ' A.B' in f" {r}" or 'ABLE SEAMAN' in r: return 10
-    if 'OILER' in r: return 11
-
-    return 99
-
-
-def format_currency(val):
-    if pd.isna(val) or val == "": return ""
-    try:
-        s_val = str(val).replace(',', '').strip()
-        if not s_val: return ""
-        return "{:,.2f}".format(float(s_val))
-    except (ValueError, TypeError):
-        return str(val)
-
-
-def format_date_custom(val):
-    if pd.isna(val) or val == "": return ""
-    try:
-        if hasattr(val, 'strftime'): return val.strftime('%d/%m/%Y')
-        s_val = str(val).split()[0].strip()
-        if '-' in s_val:
-            parts = s_val.split('-')
-            if len(parts) == 3 and len(parts[0]) == 4:
-                return f"{parts[2]}/{parts[1]}/{parts[0]}"
-        return s_val
-    except:
-        return str(val)
-
-
-def set_cell_text(cell, text, custom_spacing=1.0):
-    if text is None: text = ""
-    text = str(text)
-    if text.endswith(".0"): text = text[:-2]
-
-    cell.text = ""
-    p = cell.paragraphs[0]
-    run = p.add_run(text)
-
-    run.font.size = Pt(9)
-    run.font.name = 'Arial Narrow'
-    run.font.bold = True
-
-    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    p.paragraph_format.space_before = Pt(0)
-    p.paragraph_format.space_after = Pt(0)
-
-    # 接收传进来的行距参数（默认为 1.0）
-    p.paragraph_format.line_spacing = custom_spacing
-
-
-def shrink_empty_lines(doc):
-    for p in doc.paragraphs:
-        if not p.text.strip():
-            p_fmt = p.paragraph_format
-            p_fmt.space_before = Pt(0)
-            p_fmt.space_after = Pt(0)
-            p_fmt.line_spacing = 1.0
-            if p.runs:
-                for r in p.runs: r.font.size = Pt(1)
-            else:
-                p.add_run(" ").font.size = Pt(1)
-
-
-def insert_spacer_before_payslip(doc):
-    for p in doc.paragraphs:
-        if "PAY SLIP" in p.text:
-            spacer = p.insert_paragraph_before(" ")
-            spacer.paragraph_format.space_after = Pt(0)
-            spacer.paragraph_format.line_spacing = 1.0
-            # 💡 将字体大小从 Pt(12) 增大到 Pt(36)，利用这个隐藏的空行把标题往下挤
-            if spacer.runs:
-                spacer.runs[0].font.size = Pt(18)
-            else:
-                spacer.add_run(" ").font.size = Pt(18)
-            break
-
-
-def generate_payslip_zip(uploaded_excel):
-    """读取上传的 Excel，生成包含内港 Word 和 PDF 工资单的双版本 ZIP 压缩包"""
-    uploaded_excel.seek(0)
-
-    # 1. 智能查找目标 Sheet (无视大小写和空格防报错)
-    xl = pd.ExcelFile(uploaded_excel)
-    target_sheet = None
-    for sheet in xl.sheet_names:
-        if 'SUM-SAL' in sheet.upper().replace(' ', ''):
-            target_sheet = sheet
-            break
-
-    if not target_sheet:
-        df_raw = pd.read_excel(xl, sheet_name=0, header=None)
-    else:
-        df_raw = pd.read_excel(xl, sheet_name=target_sheet, header=None)
-
-    employees = []
-    current_vessel = "Unknown Vessel"
-    i = 0
-
-    # 2. 提取数据 (保留内港专属的清洗逻辑)
-    while i < len(df_raw):
-        row = df_raw.iloc[i].tolist()
-        first_cell = str(row[0]).strip() if pd.notna(row[0]) else ""
-
-        if i + 1 < len(df_raw):
-            next_row_first = str(df_raw.iloc[i + 1][0]).strip()
-            if next_row_first == 'S/N':
-                if "Vessel Name:" in first_cell:
-                    current_vessel = row[1]
-                elif first_cell and first_cell.lower() != 'nan':
-                    current_vessel = first_cell
-                raw_headers = df_raw.iloc[i + 1].tolist()
-                headers_map = {normalize_key(h): idx for idx, h in enumerate(raw_headers) if pd.notna(h)}
-                i += 2
-                continue
-
-        if 's/n' not in locals().get('headers_map', {}) and 'name' not in locals().get('headers_map', {}):
-            i += 1;
-            continue
-
-        if first_cell.isdigit():
-            emp = {'Vessel Name': current_vessel}
-
-            def get_val(col_keywords):
-                for key in headers_map:
-                    if normalize_key(col_keywords) in key:
-                        val = row[headers_map[key]]
-                        return val if pd.notna(val) else ""
-                return ""
-
-            emp['Name'] = get_val('Name')
-            emp['Rank'] = get_val('Rank')
-            emp['From'] = format_date_custom(get_val('From(Date)'))
-            emp['To'] = format_date_custom(get_val('To(Date)'))
-            emp['Day on Board'] = get_val('Day on Board')
-            emp['Basic Salary'] = format_currency(get_val('Basic Salary'))
-            emp['Fixed OT'] = format_currency(get_val('Fixed OT'))
-            emp['Leave Pay'] = format_currency(get_val('Leave Pay'))
-            emp['Allowance'] = format_currency(get_val('Allowance'))
-            emp['Net Salary'] = format_currency(get_val('Net Salary'))
-            emp['Reimbursement'] = format_currency(get_val('Reimbursement'))
-            emp['Subtotal'] = format_currency(get_val('Subtotal'))
-            emp['Deduction'] = format_currency(get_val('Deduction'))
-            emp['Release'] = format_currency(get_val('Release'))
-            emp['Retaining'] = format_currency(get_val('Retaining'))
-
-            rem_foreign = get_val('Remittance - Foreign')
-            rem_sg = get_val('Remittance - Singapore')
-            use_foreign = False
-            try:
-                if rem_foreign and float(str(rem_foreign).replace(',', '')) > 0: use_foreign = True
-            except:
-                pass
-
-            emp['Remittance'] = format_currency(rem_foreign if use_foreign else rem_sg)
-            emp['Remarks'] = get_val('Remarks')
-            employees.append(emp)
-        i += 1
-
-    # 💡 核心修改：在开始生成 Word/PDF 之前，在内存中直接对人员名单进行排序
-    # 规则：先按“船名”分组，然后按“职位优先级”从高到低排列
-    employees.sort(key=lambda x: (x['Vessel Name'], get_rank_priority(x['Rank'])))
-
-    # 3. 启动临时安全屋生成双版本文档 (引入批量 PDF 提速逻辑)
-    zip_buffer = io.BytesIO()
-    with tempfile.TemporaryDirectory() as temp_dir:
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-
-            # --- 阶段一：极速生成所有的 Word 过渡文件 ---
-            for emp in employees:
-                # ⚠️ 内港使用内港专属的模版
-                doc = Document('payslip模版.docx')
-                insert_spacer_before_payslip(doc)
-
-                section = doc.sections[0]
-                section.top_margin, section.bottom_margin = Cm(2.2), Cm(0.2)
-                section.left_margin, section.right_margin = Cm(1.0), Cm(1.0)
-                tables = doc.tables
-
-                def fill_simple(table, label, value):
-                    for row in table.rows:
-                        for c, cell in enumerate(row.cells):
-                            if label in cell.text and c + 1 < len(row.cells):
-                                if label in ["Rank", "FROM", "TO", "Day on Board"]:
-                                    set_cell_text(row.cells[c + 1], value, custom_spacing=1.5)
-                                else:
-                                    set_cell_text(row.cells[c + 1], value, custom_spacing=1.0)
-                                return
-
-                fill_simple(tables[0], "Employee's Name", emp['Name'])
-                fill_simple(tables[0], "Vessel Name", emp['Vessel Name'])
-                fill_simple(tables[1], "Rank", emp['Rank'])
-                fill_simple(tables[1], "FROM", emp['From'])
-                fill_simple(tables[1], "TO", emp['To'])
-                fill_simple(tables[1], "Day on Board", emp['Day on Board'])
-
-                t2 = tables[2]
-                header_row_idx, col_earn, col_deduct = -1, -1, -1
-                for r_idx in range(min(5, len(t2.rows))):
-                    amount_indices = [c_idx for c_idx, cell in enumerate(t2.rows[r_idx].cells) if 'Amount' in cell.text]
-                    if len(amount_indices) >= 2:
-                        header_row_idx, col_earn, col_deduct = r_idx, amount_indices[0], amount_indices[-1]
-                        break
-
-                if col_earn != -1 and col_deduct != -1:
-                    def fill_left(label, val):
-                        for r in range(header_row_idx + 1, len(t2.rows)):
-                            if normalize_key(label) in normalize_key(
-                                    "".join([c.text for c in t2.rows[r].cells[:col_earn]])):
-                                set_cell_text(t2.rows[r].cells[col_earn], val)
-                                break
-
-                    def fill_right(label, val):
-                        for r in range(header_row_idx + 1, len(t2.rows)):
-                            if normalize_key(label) in normalize_key("".join([c.text for c in t2.rows[r].cells])):
-                                set_cell_text(t2.rows[r].cells[col_deduct], val)
-                                break
-
-                    fill_left('Basic Salary', emp['Basic Salary'])
-                    fill_left('Fixed OT', emp['Fixed OT'])
-                    fill_left('Leave Pay', emp['Leave Pay'])
-                    fill_left('Allowance', emp['Allowance'])
-                    fill_left('Total Earnings', emp['Net Salary'])
-                    fill_left('Reimbursement', emp['Reimbursement'])
-                    fill_left('Net Amount', emp['Subtotal'])
-                    fill_right('Total Deductions', emp['Deduction'])
-                    fill_right('Release', emp['Release'])
-                    fill_right('Retaining', emp['Retaining'])
-                    fill_right('Remittance', emp['Remittance'])
-
-                remarks_content = str(emp['Remarks']).strip()
-                if remarks_content and remarks_content.lower() != 'nan' and remarks_content != '0':
-                    for p in doc.paragraphs:
-                        if "Remarks:" in p.text:
-                            run = p.add_run(" " + remarks_content)
-                            run.font.size, run.font.name, run.font.bold = Pt(9), 'Arial Narrow', False
-                            p.paragraph_format.line_spacing = 1.0
-                            break
-
-                shrink_empty_lines(doc)
-
-                safe_vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
-                safe_emp = clean_filename(emp['Name'])
-                temp_file_base = f"{safe_vessel}===SEP==={safe_emp}"
-
-                # 1. 保存正常排版的 Word
-                temp_docx_path = os.path.join(temp_dir, f"{temp_file_base}.docx")
-                doc.save(temp_docx_path)
-
-                # 2. 修改边距，保存为专供 PDF 渲染的过渡 Word
-                pdf_section = doc.sections[0]
-                pdf_section.top_margin = Cm(1.5)  # 控制内港 PDF 的整体高度
-                temp_pdf_docx_path = os.path.join(temp_dir, f"{temp_file_base}_for_pdf.docx")
-                doc.save(temp_pdf_docx_path)
-
-
-
-            # 🚀 第二阶段：增强版批量 PDF 转换 (解决文件损坏问题)
-            # ==========================================
-            docs_to_convert = glob.glob(os.path.join(temp_dir, "*_for_pdf.docx"))
-
-            if docs_to_convert:
-                # 💡 核心改进：添加 -env:UserInstallation 参数
-                # 这会为每次转换创建一个独立的临时环境，防止多用户并发时 LibreOffice 崩溃或生成损坏文件
-                user_profile_path = f"file://{temp_dir}/libo_user"
-
-                cmd = [
-                          'libreoffice',
-                          f'-env:UserInstallation={user_profile_path}',  # 强制独立环境
-                          '--headless',
-                          '--convert-to', 'pdf',
-                          '--outdir', temp_dir
-                      ] + docs_to_convert
-
-                # 执行转换
-                process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-                # 如果你想调试，可以取消下面这行的注释来查看服务器报错日志
-                # st.write(process.stderr.decode())
-
-            # ==========================================
-            # 🚀 第三阶段：打包 (增加文件完整性检查)
-
-            for emp in employees:
-                safe_vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
-                safe_emp = clean_filename(emp['Name'])
-                temp_file_base = f"{safe_vessel}===SEP==={safe_emp}"
-
-                # 💡 核心修改：获取职位对应的数字序号，并加到文件名前面
-                rank_prio = get_rank_priority(emp['Rank'])
-                # 格式例如：01_张三 (数字在前，保证 Windows/Mac 乖乖按数字大小排序)
-                final_filename = f"{rank_prio:02d}_{safe_emp}"
-
-                # 写入正常的 Word 版本
-                temp_docx_path = os.path.join(temp_dir, f"{temp_file_base}.docx")
-                if os.path.exists(temp_docx_path):
-                    with open(temp_docx_path, 'rb') as f:
-                        zip_file.writestr(f"Word_Version/{safe_vessel}/{final_filename}.docx", f.read())
-
-                # 写入 PDF 版本（带防损坏空文件检查）
-                temp_pdf_path = os.path.join(temp_dir, f"{temp_file_base}_for_pdf.pdf")
-                if os.path.exists(temp_pdf_path):
-                    if os.path.getsize(temp_pdf_path) > 100:
-                        with open(temp_pdf_path, 'rb') as f:
-                            zip_file.writestr(f"PDF_Version/{safe_vessel}/{final_filename}.pdf", f.read())
-                    else:
-                        st.error(f"Warning: PDF for {safe_emp} generated but appears corrupted (too small).")
-
-    zip_buffer.seek(0)
-    return zip_buffer
-
-
-# =========================================================
-# 新增功能：进阶版 payslips 生成逻辑 (动态计算 + Word + PDF 双版本)
-# =========================================================
-def generate_advanced_payslips_zip(uploaded_excel):
-    """读取上传的 Excel，动态计算薪资，并在安全屋中生成 Word 和 PDF 双版本 ZIP 压缩包"""
-    # 每次调用时将指针重置到开头
-    uploaded_excel.seek(0)
-
-    # 1. 智能查找目标 Sheet
-    xl = pd.ExcelFile(uploaded_excel)
-    target_sheet = None
-    for sheet in xl.sheet_names:
-        # 忽略大小写、去掉空格进行匹配
-        if 'SUM-SAL' in sheet.upper().replace(' ', ''):
-            target_sheet = sheet
-            break
-
-    if not target_sheet:
-        # 如果连名字都不对，直接强行读取第一个 Sheet 兜底
-        df_raw = pd.read_excel(xl, sheet_name=0, header=None)
-    else:
-        df_raw = pd.read_excel(xl, sheet_name=target_sheet, header=None)
-
-    employees = []
-    current_vessel = "Unknown Vessel"
-    headers_map = {}
-    i = 0
-    # ... (下方保留你原有的 while i < len(df_raw): 代码不变) ...
-
-    while i < len(df_raw):
-        row_vals = [str(x).strip() for x in df_raw.iloc[i].tolist()]
-        if 'S/N' in row_vals:
-            if i > 0:
-                prev_row = [str(x).strip() for x in df_raw.iloc[i - 1].tolist() if
-                            pd.notna(x) and str(x).strip() not in ['', 'nan']]
-                if prev_row:
-                    v_name = prev_row[0]
-                    current_vessel = v_name.split(":", 1)[1].strip() if "Vessel Name:" in v_name else v_name
-            headers_map = {normalize_key(h): idx for idx, h in enumerate(row_vals) if h not in ['nan', '']}
-            i += 1;
-            continue
-
-        first_cell = str(df_raw.iloc[i][0]).strip()
-        if first_cell.isdigit() and headers_map:
-            row_data = df_raw.iloc[i].tolist()
-
-            def get_val(col_keywords):
-                norm_key = normalize_key(col_keywords)
-                for key, idx in headers_map.items():
-                    if norm_key in key:
-                        return row_data[idx] if pd.notna(row_data[idx]) else ""
-                return ""
-
-            # 💡 1. 提取并清洗数据
-            try:
-                m_str = str(get_val('MonthlySalary')).replace(',', '').strip()
-                m_val = float(m_str) if m_str else 0.0
-            except:
-                m_val = 0.0
-
-            try:
-                inc_str = str(get_val('Incentive')).replace(',', '').strip()
-                inc_val = float(inc_str) if inc_str else 0.0
-            except:
-                inc_val = 0.0
-
-            try:
-                reim_str = str(get_val('Reimbursement')).replace(',', '').strip()
-                reim_val = float(reim_str) if reim_str else 0.0
-            except:
-                reim_val = 0.0
-
-            # 💡 2. 应用进位/退位数学规则
-            # 58% 正常计算
-            basic_val = m_val * 0.58
-            # 37% 进一位 (ceil: 向上取整)
-            fixed_ot = math.ceil(m_val * 0.37) if m_val > 0 else 0.0
-            # 5% 退一位 (floor: 向下取整)
-            leave_pay = math.floor(m_val * 0.05) if m_val > 0 else 0.0
-
-            total_earnings = m_val + inc_val
-            net_amount = total_earnings + reim_val
-            total_deductions = 0.0  # 恒为零
-            # 💡 3. 构建规范化的员工数据字典
-            emp = {
-                'Vessel Name': current_vessel, 'Name': get_val('Name'), 'Rank': get_val('Rank'),
-                'From': format_date_custom(get_val('FromDate') or get_val('From')),
-                'To': format_date_custom(get_val('ToDate') or get_val('To')),
-                'Day on Board': str(get_val('DayonBoard')),
-
-                'Basic Salary': format_currency(basic_val),
-                'Fixed OT': format_currency(fixed_ot),
-                'Leave Pay': format_currency(leave_pay),
-                'Bonus/Incentive': format_currency(inc_val),
-                'Total Earnings': format_currency(total_earnings),
-                'Reimbursement': format_currency(reim_val),
-                'Net Amount': format_currency(net_amount),
-                'Total Deductions': format_currency(total_deductions),
-
-                'Release': format_currency(get_val('ReleaseofSalary')),
-                'Retaining': format_currency(get_val('Retaining')),
-                'Remittance': format_currency(get_val('RemittanceForeignBank') or get_val('Remittance')),
-                'Remarks': get_val('Remarks')
-            }
-            employees.append(emp)
-        i += 1
-
-    # 💡 核心修改：在开始生成 Word/PDF 之前，在内存中直接对人员名单进行排序
-    # 规则：先按“船名”分组，然后按“职位优先级”从高到低排列
-    employees.sort(key=lambda x: (x['Vessel Name'], get_rank_priority(x['Rank'])))
-
-
-    zip_buffer = io.BytesIO()
-
-    # 开启安全屋，利用 LibreOffice 生成 PDF
-    # 开启安全屋，利用 LibreOffice 生成 PDF
-    with tempfile.TemporaryDirectory() as temp_dir:
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-
-            # ==========================================
-            # 🚀 第一阶段：极速生成所有的 Word 过渡文件
-            # ==========================================
-            for emp in employees:
-                # ⚠️ 确保服务器里上传了这个新模版文件
-                doc = Document('Out_port paylist 模版.docx')
-                insert_spacer_before_payslip(doc)
-
-                section = doc.sections[0]
-                section.top_margin, section.bottom_margin = Cm(2.2), Cm(0.2)
-                section.left_margin, section.right_margin = Cm(1.0), Cm(1.0)
-
-                def fill_simple(table, label, value):
-                    for row in table.rows:
-                        for c, cell in enumerate(row.cells):
-                            txt = cell.text.strip()
-                            if label in ["TO", "FROM", "Rank"] and txt not in [label, f"{label}:",
-                                                                               f"{label} :"]: continue
-                            if label in cell.text and c + 1 < len(row.cells):
-                                if label in ["Rank", "FROM", "TO", "Day on Board"]:
-                                    set_cell_text(row.cells[c + 1], value, custom_spacing=1.5)
-                                else:
-                                    set_cell_text(row.cells[c + 1], value, custom_spacing=1.0)
-                                return
-
-                for table in doc.tables[:2]:
-                    fill_simple(table, "Employee's Name", emp['Name'])
-                    fill_simple(table, "Vessel Name", emp['Vessel Name'])
-                    fill_simple(table, "Rank", emp['Rank'])
-                    fill_simple(table, "FROM", emp['From'])
-                    fill_simple(table, "TO", emp['To'])
-                    fill_simple(table, "Day on Board", emp['Day on Board'])
-
-                if len(doc.tables) >= 3:
-                    t_fin = doc.tables[2]
-                    col_earn, col_deduct = 4, 9
-                    for r in range(min(5, len(t_fin.rows))):
-                        amts = [idx for idx, c in enumerate(t_fin.rows[r].cells) if 'Amount' in c.text]
-                        if len(amts) >= 2:
-                            col_earn, col_deduct = amts[0], amts[-1]
-                            break
-
-                    for row in t_fin.rows:
-                        label = row.cells[0].text.strip()
-                        if col_earn < len(row.cells):
-                            if "Basic Salary" in label:
-                                set_cell_text(row.cells[col_earn], emp['Basic Salary'])
-                            elif "Fixed OT" in label:
-                                set_cell_text(row.cells[col_earn], emp['Fixed OT'])
-                            elif "Leave Pay" in label:
-                                set_cell_text(row.cells[col_earn], emp['Leave Pay'])
-                            elif "Bonus" in label or "Incentive" in label:
-                                set_cell_text(row.cells[col_earn], emp['Bonus/Incentive'])
-                            elif "Total Earnings" in label:
-                                set_cell_text(row.cells[col_earn], emp['Total Earnings'])
-                            elif "Reimbursement" in label:
-                                set_cell_text(row.cells[col_earn], emp['Reimbursement'])
-                            elif "Net Amount" in label:
-                                set_cell_text(row.cells[col_earn], emp['Net Amount'])
-
-                        for idx, cell in enumerate(row.cells):
-                            c_txt = cell.text.strip()
-                            if col_deduct < len(row.cells):
-                                if "Total Deductions" in c_txt:
-                                    set_cell_text(row.cells[col_deduct], emp['Total Deductions'])
-                                elif "Release" in c_txt:
-                                    set_cell_text(row.cells[col_deduct], emp['Release'])
-                                elif "Retaining" in c_txt:
-                                    set_cell_text(row.cells[col_deduct], emp['Retaining'])
-                                elif "Remittance - Bank" in c_txt:
-                                    set_cell_text(row.cells[col_deduct], emp['Remittance'])
-                rem = str(emp['Remarks']).strip()
-                if rem and rem.lower() != 'nan' and rem != '0':
-                    for p in doc.paragraphs:
-                        if "Remarks:" in p.text:
-                            run = p.add_run(" " + rem)
-                            run.font.size, run.font.name, run.font.bold = Pt(9), 'Arial Narrow', False
-                            p.paragraph_format.line_spacing = 1.0
-                            break
-
-                shrink_empty_lines(doc)
-
-                safe_vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
-                safe_emp = clean_filename(emp['Name'])
-
-                # 给临时文件加个前缀，防止同名同姓的员工发生文件覆盖冲突
-                temp_file_base = f"{safe_vessel}===SEP==={safe_emp}"
-
-                # 1. 保存正常排版的 Word
-                temp_docx_path = os.path.join(temp_dir, f"{temp_file_base}.docx")
-                doc.save(temp_docx_path)
-
-                # 2. 修改边距，保存为专供 PDF 渲染的过渡 Word
-                pdf_section = doc.sections[0]
-                pdf_section.top_margin = Cm(1.5)
-                temp_pdf_docx_path = os.path.join(temp_dir, f"{temp_file_base}_for_pdf.docx")
-                doc.save(temp_pdf_docx_path)
-
-            # ==========================================
-            # ==========================================
-            # 获取所有以 _for_pdf.docx 结尾的临时文件
-            docs_to_convert = glob.glob(os.path.join(temp_dir, "*_for_pdf.docx"))
-
-            if docs_to_convert:
-                # 把所有文件作为参数一次性塞给 LibreOffice，它会不间断地一口气处理完
-                cmd = ['libreoffice', '--headless', '--convert-to', 'pdf', '--outdir', temp_dir] + docs_to_convert
-                subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            # ==========================================
-            # 🚀 第三阶段：将所有生成好的文件统一打包
-
-            for emp in employees:
-                safe_vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
-                safe_emp = clean_filename(emp['Name'])
-                temp_file_base = f"{safe_vessel}===SEP==={safe_emp}"
-
-                # 💡 核心修改：获取职位对应的数字序号，并加到文件名前面
-                rank_prio = get_rank_priority(emp['Rank'])
-                # 格式例如：01_张三 (数字在前，保证 Windows/Mac 乖乖按数字大小排序)
-                final_filename = f"{rank_prio:02d}_{safe_emp}"
-
-                # 写入正常的 Word 版本
-                temp_docx_path = os.path.join(temp_dir, f"{temp_file_base}.docx")
-                if os.path.exists(temp_docx_path):
-                    with open(temp_docx_path, 'rb') as f:
-                        zip_file.writestr(f"Word_Version/{safe_vessel}/{final_filename}.docx", f.read())
-
-                # 写入 PDF 版本（带防损坏空文件检查）
-                temp_pdf_path = os.path.join(temp_dir, f"{temp_file_base}_for_pdf.pdf")
-                if os.path.exists(temp_pdf_path):
-                    if os.path.getsize(temp_pdf_path) > 100:
-                        with open(temp_pdf_path, 'rb') as f:
-                            zip_file.writestr(f"PDF_Version/{safe_vessel}/{final_filename}.pdf", f.read())
-                    else:
-                        st.error(f"Warning: PDF for {safe_emp} generated but appears corrupted (too small).")
+def read_file_on_download(path):
+    """download_button 的延迟数据源：用户点击下载时才从磁盘读出文件内容"""
+    def read():
+        with open(path, 'rb') as f:
+            return f.read()
+    return read
+
+
+PAYSLIP_JOB_LABELS = {'in_port': "In Port", 'out_port': "Out Port"}
+
+
+@st.fragment
+def show_payslip_job(job_id, owner=None):
+    """显示一个工资单任务的各阶段进度，没跑完就每秒只刷新这一块；完成后提供下载。owner 不为空时只能看自己的任务"""
+    job = get_job_queue().get(job_id, owner)
+    if job is None:
+        st.warning(f"Payslip job {job_id} not found (it may have expired).")
+        return
+
+    label = PAYSLIP_JOB_LABELS[job['kind']]
+    total = job['total']
+    if job['status'] == QUEUED:
+        st.info(f"Job {job_id} is waiting in the queue...")
+    for stage in PROGRESS_STAGES:
+        done = job[stage]
+        st.progress(done / total if total else 0.0, text=f"{stage.capitalize()}: {done} / {total}")
+
+    for warning in job['warnings']:
+        st.error(warning)
+
+    if job['status'] in (QUEUED, RUNNING):
+        time.sleep(1)
+        st.rerun(scope="fragment")
+    elif job['status'] == FAILED:
+        st.error(f"Error generating {label} Payslips: {job['error']}")
+    elif job['status'] == DONE:
+        zip_path = get_job_queue().result_path(job_id, owner)
+        if zip_path is None:
+            st.warning(f"The ZIP for job {job_id} is no longer available.")
+            return
+        st.success(f"Successfully generated {label} Word & PDF Payslips!")
+        created = datetime.fromtimestamp(job['created_at']).strftime('%Y%m%d')
+        st.download_button(
+            label=f"Download {label} Payslips (.zip)",
+            data=read_file_on_download(zip_path),
+            file_name=f"{label.replace(' ', '_')}_Payslips_{created}.zip",
+            mime="application/zip",
+            on_click="ignore",
+            use_container_width=True,
+            key=f"dl_{job_id}"
+        )
+        if job['metrics']:
+            with st.expander("Timing & memory", expanded=True):
+                st.dataframe(pd.DataFrame(job['metrics']['stages']), hide_index=True, use_container_width=True)
+                render_time = job['metrics']['render_time']
+                st.caption(f"Total {job['metrics']['total_wall_s']:.2f}s · {job['metrics']['rendered']} rendered · "
+                           + " · ".join(f"{k.replace('_ms', '')} {v} ms" for k, v in render_time.items()
+                                        if v is not None))
 
-    zip_buffer.seek(0)
-    return zip_buffer
 
 # --- 3. Login UI ---
 def login_ui():
@@ -863,14 +145,184 @@ if st.sidebar.button("Log Out Safely"):
 
 # --- 5. Data Retrieval & Tabs ---
 # --- 5. Data Retrieval & Tabs ---
-@st.cache_data(ttl=60)
 def get_ships_list(role, user):
+    # 💡 把新角色 'supervisor' 加进特权名单里，这样他就能获取整个公司的船舶列表
+    privileged = role in ['admin', 'payroll', 'supervisor']
+
+    def load():
+        with get_engine().connect() as conn:
+            if privileged:
+                return pd.read_sql_query(text("SELECT id, ship_name FROM ships ORDER BY ship_name"), conn)
+            return pd.read_sql_query(text("SELECT id, ship_name FROM ships WHERE manager_name = :u ORDER BY ship_name"),
+                                     conn, params={"u": user})
+
+    # 所有会话共享，有特权的角色看到的是同一份列表
+    return get_query_cache().get(SHIPS, ('all',) if privileged else ('manager', user), load)
+
+
+def get_report_center_data(role, user, start_d, end_d):
+    """
+    报表中心的导出行（report_queries.report_center_rows），每条船一行、按会议顺序排好。
+    按 (角色, 用户, 日期范围, 会议顺序版本) 缓存，填报 / 修改 / 删除时立即作废
+    """
+    cache = get_query_cache()
+
+    def load():
+        manager = None if role in ['admin', 'supervisor'] else user
+        with get_engine().connect() as conn:
+            return report_center_rows(conn, start_d, end_d, manager)
+
+    return cache.get(REPORTS, ('report_center', role, user, start_d, end_d, cache.version(MEETING_ORDER)), load,
+                     date_range=(start_d, end_d))
+
+
+def replace_meeting_order(names):
+    """整表替换会议顺序，报表中心按新顺序重新查询"""
+    with get_engine().begin() as conn:
+        saved = save_meeting_order(conn, names)
+    get_query_cache().invalidate(MEETING_ORDER)
+    return saved
+
+
+def get_meeting_order():
+    def load():
+        with get_engine().connect() as conn:
+            return load_meeting_order(conn)
+
+    return get_query_cache().get(MEETING_ORDER, ('all',), load)
+
+
+def search_all_reports(role, user, query, order):
+    """全文检索所有船、所有日期的周报；结果不带日期范围缓存，任何一次填报 / 修改 / 删除都会让它作废"""
+    manager = None if role in ['admin', 'supervisor'] else user
+
+    def load():
+        with get_engine().connect() as conn:
+            return search_reports(conn, query, manager, order)
+
+    return get_query_cache().get(REPORTS, ('search', manager, query.strip(), order), load)
+
+
+# 管理员控制台每页显示多少条
+ADMIN_PAGE_SIZE = 50
+
+
+def get_manager_list():
+    def load():
+        with get_engine().connect() as conn:
+            return pd.read_sql_query(text("SELECT DISTINCT manager_name FROM ships ORDER BY manager_name"), conn)
+
+    return get_query_cache().get(SHIPS, ('managers',), load)['manager_name'].tolist()
+
+
+def fetch_admin_page(ship_ids, managers, date_range, after=None, page_size=ADMIN_PAGE_SIZE):
+    """
+    管理员控制台的一页：按 (report_date, id) 倒序做 keyset 分页，after 是上一页最后一行的 (report_date, id)。
+    筛选条件全部在 SQL 里完成，每页耗时与表的总行数无关。多取一行用来判断还有没有下一页
+    """
+    query = """
+        SELECT r.id, s.manager_name as "Manager", s.ship_name as "Vessel", 
+               r.report_date as "Date", r.this_week_issue as "Content"
+        FROM reports r JOIN ships s ON r.ship_id = s.id 
+        WHERE 1 = 1
+    """
+    params = {"n": page_size + 1}
+    expanding = []
+    if ship_ids:
+        query += " AND r.ship_id IN :ship_ids"
+        params["ship_ids"] = list(ship_ids)
+        expanding.append(bindparam("ship_ids", expanding=True))
+    if managers:
+        query += " AND s.manager_name IN :managers"
+        params["managers"] = list(managers)
+        expanding.append(bindparam("managers", expanding=True))
+    if len(date_range) == 2:
+        query += " AND r.report_date BETWEEN :d_from AND :d_to"
+        params["d_from"], params["d_to"] = date_range
+    if after is not None:
+        query += " AND (r.report_date, r.id) < (:after_date, :after_id)"
+        params["after_date"], params["after_id"] = after
+    query += " ORDER BY r.report_date DESC, r.id DESC LIMIT :n"
+
+    with get_engine().connect() as conn:
+        page = pd.read_sql_query(text(query).bindparams(*expanding), conn, params=params)
+    return page.head(page_size), len(page) > page_size
+
+
+# 填报页每条船显示最近几条历史记录
+HISTORY_LIMIT = 10
+
+
+def fetch_history(ship_ids, limit=HISTORY_LIMIT):
+    """一条窗口函数查询取回多条船各自最近 limit 条未删除的记录，返回 {ship_id: DataFrame}"""
+    query = text(HISTORY_QUERY).bindparams(bindparam("sids", expanding=True))
     with get_engine().connect() as conn:
-        # 💡 把新角色 'supervisor' 加进特权名单里，这样他就能获取整个公司的船舶列表
-        if role in ['admin', 'payroll', 'supervisor']:
-            return pd.read_sql_query(text("SELECT id, ship_name FROM ships ORDER BY ship_name"), conn)
-        return pd.read_sql_query(text("SELECT id, ship_name FROM ships WHERE manager_name = :u ORDER BY ship_name"),
-                                 conn, params={"u": user})
+        df = pd.read_sql_query(query, conn, params={"sids": list(ship_ids), "n": limit})
+    groups = {int(sid): g.drop(columns="ship_id").reset_index(drop=True) for sid, g in df.groupby("ship_id")}
+    empty = df.drop(columns="ship_id").iloc[0:0]
+    return {sid: groups.get(sid, empty) for sid in ship_ids}
+
+
+def get_session_history(ship_ids):
+    """
+    本会话缓存的各船历史记录，第一次用时一次性预取名下所有船，翻船（Previous/Next）不再查库。
+    别的会话写过 reports 后整体重新预取一次
+    """
+    version = get_query_cache().version(REPORTS)
+    if st.session_state.get('history_version') != version:
+        st.session_state.history = {}
+        st.session_state.history_version = version
+    missing = [sid for sid in ship_ids if sid not in st.session_state.history]
+    if missing:
+        st.session_state.history.update(fetch_history(missing))
+    return st.session_state.history
+
+
+def after_report_write(ship_ids, dates):
+    """本会话改了某几条船的记录：作废共享缓存里受影响的报表，本会话只重新取这几条船的历史"""
+    cache = get_query_cache()
+    up_to_date = st.session_state.get('history_version') == cache.version(REPORTS)
+    cache.invalidate(REPORTS, dates)
+    if up_to_date:
+        st.session_state.history_version = cache.version(REPORTS)
+        st.session_state.history.update(fetch_history(ship_ids))
+
+
+REPORTS_TABLE = sqlalchemy.table("reports", sqlalchemy.column("ship_id"), sqlalchemy.column("report_date"),
+                                 sqlalchemy.column("this_week_issue"), sqlalchemy.column("remarks"))
+GRID_MODE = "All vessels (grid)"
+
+
+def bulk_entry_grid(ships_df):
+    """
+    一张表格填完名下所有船：每条船预填上一次的内容，改过的行用一条多行 INSERT、在一个事务里一起提交
+    """
+    history = get_session_history([int(sid) for sid in ships_df['id']])
+    last_issue = [history[int(sid)]['this_week_issue'].iloc[0] if not history[int(sid)].empty else ""
+                  for sid in ships_df['id']]
+    grid = pd.DataFrame({"Vessel": ships_df['ship_name'], "This week's issue": last_issue, "Remarks": ""})
+
+    st.caption("Each row is pre-filled with the vessel's latest report. Only edited rows are submitted.")
+    edited = st.data_editor(grid, hide_index=True, use_container_width=True, disabled=["Vessel"], key="bulk_grid",
+                            column_config={"This week's issue": st.column_config.TextColumn(width="large")})
+
+    issues = edited["This week's issue"].fillna("").astype(str)
+    remarks = edited["Remarks"].fillna("").astype(str)
+    changed = ((issues != grid["This week's issue"]) | (remarks != "")) & (issues.str.strip() != "")
+    st.write(f"{int(changed.sum())} vessel(s) changed.")
+
+    if st.button("Submit All Changed Vessels", use_container_width=True, disabled=not changed.any()):
+        report_date = datetime.now().date()
+        ship_ids = [int(sid) for sid in ships_df['id'][changed]]
+        rows = [{"ship_id": sid, "report_date": report_date, "this_week_issue": iss, "remarks": rem}
+                for sid, iss, rem in zip(ship_ids, issues[changed], remarks[changed])]
+        # 💡 一条 INSERT ... VALUES (...), (...) 语句，一个事务，一次往返
+        with get_engine().begin() as conn:
+            conn.execute(sqlalchemy.insert(REPORTS_TABLE).values(rows))
+        after_report_write(ship_ids, [report_date])
+        del st.session_state["bulk_grid"]
+        st.toast(f"Submitted {len(rows)} vessel reports.")
+        st.rerun()
 
 
 ships_df = get_ships_list(st.session_state.role, st.session_state.username)
@@ -905,8 +357,34 @@ tab_idx = 0  # 用于追踪当前该渲染第几个 Tab
 # =========================================================
 if st.session_state.role != 'payroll':
     with tabs[tab_idx]:
+        # 💡 跨船、跨日期全文检索问题和备注，走数据库的全文索引（Postgres GIN / SQLite FTS5），按相关度或日期排序
+        with st.expander("Search All Reports", expanded=bool(st.session_state.get("report_search", "").strip())):
+            sc1, sc2 = st.columns([3, 1])
+            with sc1:
+                search_q = st.text_input('Keywords (use "double quotes" for an exact phrase)', key="report_search")
+            with sc2:
+                search_order = st.selectbox("Sort by", list(SEARCH_ORDERS), key="report_search_order",
+                                            format_func=str.capitalize)
+            if search_q.strip():
+                hits = search_all_reports(st.session_state.role, st.session_state.username, search_q, search_order)
+                if hits.empty:
+                    st.info("No reports match these keywords.")
+                else:
+                    st.caption(f"{len(hits)} matching reports" +
+                               (f" (top {SEARCH_LIMIT} shown)" if len(hits) == SEARCH_LIMIT else ""))
+                    for _, hit in hits.iterrows():
+                        st.markdown(f"**{hit['report_date']} · {highlighted_markdown(hit['ship_name'])}** "
+                                    f"({highlighted_markdown(hit['manager_name'])})")
+                        st.markdown(highlighted_markdown(hit['this_week_issue']))
+                        remarks_md = highlighted_markdown(hit['remarks'])
+                        if remarks_md:
+                            st.caption("Remarks: " + remarks_md)
+
         if ships_df.empty:
             st.warning("No vessels have been assigned yet.")
+        elif st.radio("Entry mode:", ["One vessel at a time", GRID_MODE], horizontal=True,
+                      key="entry_mode") == GRID_MODE:
+            bulk_entry_grid(ships_df)
         else:
             selected_ship = st.selectbox("Select a vessel", ships_df['ship_name'].tolist(),
                                          index=st.session_state.ship_index)
@@ -924,8 +402,9 @@ if st.session_state.role != 'payroll':
                     with d_col1:
                         if st.button("Confirm deletion", key="confirm_real_del"):
                             with get_engine().begin() as conn:
-                                conn.execute(text("DELETE FROM reports WHERE id = :id"),
-                                             {"id": st.session_state.confirm_del_id})
+                                deleted = conn.execute(text("DELETE FROM reports WHERE id = :id RETURNING report_date"),
+                                                       {"id": st.session_state.confirm_del_id}).fetchall()
+                            after_report_write([ship_id], [r[0] for r in deleted])
                             st.session_state.confirm_del_id = None
                             st.success("The record has been permanently deleted.")
                             time.sleep(1)
@@ -936,12 +415,11 @@ if st.session_state.role != 'payroll':
                             st.rerun()
                     st.divider()
 
-                with get_engine().connect() as conn:
-                    h_df = pd.read_sql_query(text(
-                        "SELECT id, report_date, this_week_issue, remarks FROM reports WHERE ship_id = :sid AND is_deleted_by_user = FALSE ORDER BY report_date DESC LIMIT 10"),
-                        conn, params={"sid": ship_id})
+                # 💡 历史记录从本会话的预取缓存里读，翻船不再查库
+                h_df = get_session_history([int(sid) for sid in ships_df['id']])[ship_id]
 
                 if not h_df.empty:
+                    issue_texts = renumber_issues(h_df['this_week_issue'])
                     for idx, row in h_df.iterrows():
                         is_editing = st.session_state.editing_id == row['id']
                         with st.expander(f"{row['report_date']} Content Details", expanded=is_editing):
@@ -952,13 +430,11 @@ if st.session_state.role != 'payroll':
                                     with get_engine().begin() as conn:
                                         conn.execute(text("UPDATE reports SET this_week_issue = :t WHERE id = :id"),
                                                      {"t": new_val, "id": row['id']})
+                                    after_report_write([ship_id], [row['report_date']])
                                     st.session_state.editing_id = None
                                     st.rerun()
                             else:
-                                raw_content = row['this_week_issue']
-                                clean_lines = [re.sub(r'^\d+[\.、\s]*', '', l.strip()) for l in raw_content.split('\n')
-                                               if l.strip()]
-                                st.text("\n".join([f"{i + 1}. {text}" for i, text in enumerate(clean_lines)]))
+                                st.text(issue_texts[idx])
 
                                 cb1, cb2 = st.columns(2)
                                 with cb1:
@@ -981,10 +457,12 @@ if st.session_state.role != 'payroll':
                     latest_issue = st.session_state.get(f"ta_{sid}", "")
                     latest_remark = st.session_state.get(f"rem_{sid}", "")
                     if latest_issue.strip():
+                        report_date = datetime.now().date()
                         with get_engine().begin() as conn:
                             conn.execute(text(
                                 "INSERT INTO reports (ship_id, report_date, this_week_issue, remarks) VALUES (:sid, :dt, :iss, :rem)"),
-                                {"sid": sid, "dt": datetime.now().date(), "iss": latest_issue, "rem": latest_remark})
+                                {"sid": sid, "dt": report_date, "iss": latest_issue, "rem": latest_remark})
+                        after_report_write([sid], [report_date])
                         st.session_state[f"ta_{sid}"] = ""
                         st.session_state[f"rem_{sid}"] = ""
                         st.session_state.drafts[sid] = ""
@@ -993,17 +471,15 @@ if st.session_state.role != 'payroll':
 
                 if st.button("Import information about the ship from last week.", key=f"import_{ship_id}",
                              use_container_width=True):
-                    with get_engine().connect() as conn:
-                        last_rec = conn.execute(text(
-                            "SELECT this_week_issue FROM reports WHERE ship_id = :sid AND is_deleted_by_user = FALSE ORDER BY report_date DESC LIMIT 1"),
-                            {"sid": ship_id}).fetchone()
-                        if last_rec:
-                            st.session_state[f"ta_{ship_id}"] = last_rec[0]
-                            st.success("The latest content has been loaded; you can continue editing.")
-                            time.sleep(0.5)
-                            st.rerun()
-                        else:
-                            st.warning("No history found.")
+                    # 最近一条记录就是预取缓存里这条船的第一行
+                    last_rec = get_session_history([ship_id])[ship_id]
+                    if not last_rec.empty:
+                        st.session_state[f"ta_{ship_id}"] = last_rec['this_week_issue'].iloc[0]
+                        st.success("The latest content has been loaded; you can continue editing.")
+                        time.sleep(0.5)
+                        st.rerun()
+                    else:
+                        st.warning("No history found.")
 
                 if f"ta_{ship_id}" not in st.session_state: st.session_state[f"ta_{ship_id}"] = ""
                 if f"rem_{ship_id}" not in st.session_state: st.session_state[f"rem_{ship_id}"] = ""
@@ -1032,26 +508,97 @@ if st.session_state.role == 'admin':
     with tabs[tab_idx]:
         st.subheader("Global Management View")
 
-        m_df = pd.read_sql_query(text("""
-            SELECT r.id, s.manager_name as "Manager", s.ship_name as "Vessel", 
-                   r.report_date as "Date", r.this_week_issue as "Content"
-            FROM reports r JOIN ships s ON r.ship_id = s.id 
-            ORDER BY r.report_date DESC
-        """), get_engine())
+        # 筛选条件：全部下推到 SQL
+        f1, f2, f3 = st.columns(3)
+        with f1:
+            f_vessels = st.multiselect("Vessel", ships_df['ship_name'].tolist(), key="admin_f_vessels")
+        with f2:
+            f_managers = st.multiselect("Manager", get_manager_list(), key="admin_f_managers")
+        with f3:
+            f_dates = st.date_input("Date range", value=(), key="admin_f_dates")
+        f_ship_ids = ships_df[ships_df['ship_name'].isin(f_vessels)]['id'].astype(int).tolist()
+
+        # 💡 分页游标：每一页开头之前那一行的 (report_date, id)，第一页为 None；筛选一变就回到第一页，
+        # 同时清空勾选，免得删掉当前筛选已经看不到的记录
+        filter_sig = (tuple(f_vessels), tuple(f_managers), tuple(f_dates))
+        if st.session_state.get('admin_filter_sig') != filter_sig:
+            st.session_state.admin_filter_sig = filter_sig
+            st.session_state.admin_cursors = [None]
+            st.session_state.admin_selected = set()
+        cursors = st.session_state.admin_cursors
+
+        m_df, has_next = fetch_admin_page(f_ship_ids, f_managers, f_dates, after=cursors[-1])
 
         if not m_df.empty:
-            m_df.insert(0, "Select", False)
-            ed_df = st.data_editor(m_df, hide_index=True, use_container_width=True)
+            # 勾选状态存在 session 里，同一筛选条件下翻页后仍然保留，可以跨页批量删除
+            m_df.insert(0, "Select", m_df["id"].isin(st.session_state.admin_selected))
+            ed_df = st.data_editor(m_df, hide_index=True, use_container_width=True,
+                                   disabled=[c for c in m_df.columns if c != "Select"],
+                                   key=f"admin_editor_{hash(filter_sig)}_{len(cursors)}")
+            page_ids = set(ed_df["id"].tolist())
+            st.session_state.admin_selected = (st.session_state.admin_selected - page_ids) | set(
+                ed_df[ed_df["Select"] == True]["id"].tolist())
+
+            p1, p2, p3 = st.columns([1, 4, 1])
+            with p1:
+                if len(cursors) > 1 and st.button("Previous page", key="admin_prev"):
+                    cursors.pop()
+                    st.rerun()
+            with p2:
+                st.caption(f"Page {len(cursors)} · {len(st.session_state.admin_selected)} selected")
+            with p3:
+                if has_next and st.button("Next page", key="admin_next"):
+                    last = m_df.iloc[-1]
+                    cursors.append((last["Date"], int(last["id"])))
+                    st.rerun()
 
-            to_del = ed_df[ed_df["Select"] == True]["id"].tolist()
-            if to_del and st.button("Delete Selected Records"):
+            to_del = sorted(st.session_state.admin_selected)
+            if to_del and st.button(f"Delete Selected Records ({len(to_del)})"):
                 with get_engine().begin() as conn:
-                    conn.execute(text("DELETE FROM reports WHERE id IN :ids"), {"ids": tuple(to_del)})
-                st.success(f"Successfully deleted {len(to_del)} records.")
+                    deleted = conn.execute(
+                        text("DELETE FROM reports WHERE id IN :ids RETURNING report_date").bindparams(
+                            bindparam("ids", expanding=True)), {"ids": to_del}).fetchall()
+                get_query_cache().invalidate(REPORTS, [r[0] for r in deleted])
+                st.session_state.admin_selected = set()
+                st.session_state.admin_cursors = [None]
+                st.success(f"Successfully deleted {len(deleted)} records.")
                 st.rerun()
+        elif len(cursors) > 1:
+            # 当前页的记录被别处删光了，回到第一页
+            st.session_state.admin_cursors = [None]
+            st.rerun()
         else:
             st.info("No global report data available.")
 
+        st.write("---")
+        st.subheader("Meeting Order (会议船舶顺序)")
+        # 💡 会议顺序存在数据库里，报表中心的 Excel / PPT 直接在 SQL 里按它排序；这里保存后所有人立即生效
+        order_upload = st.file_uploader("Replace with an uploaded '会议船舶顺序.xlsx' (xlsx / csv)",
+                                        type=["xlsx", "csv"], key="meeting_order_upload")
+        if order_upload is not None and st.button("Import Uploaded Order", key="meeting_order_import"):
+            try:
+                saved = replace_meeting_order(read_order_file(order_upload))
+                st.success(f"Meeting order replaced with {saved} vessels. (已导入上传的顺序表)")
+            except Exception as e:
+                st.error(f"Error reading order file: {e}")
+
+        order_df = get_meeting_order().rename(columns={"position": "Position", "vessel_name": "Vessel Name"})
+        ed_order = st.data_editor(
+            order_df, num_rows="dynamic", hide_index=True, use_container_width=True,
+            column_config={"Position": st.column_config.NumberColumn(min_value=1, step=1),
+                           "Vessel Name": st.column_config.TextColumn(required=True)},
+            key=f"meeting_order_editor_{get_query_cache().version(MEETING_ORDER)}")
+        listed = set(ed_order["Vessel Name"].dropna().map(vessel_key))
+        unlisted = [name for name in ships_df['ship_name'] if vessel_key(name) not in listed]
+        st.caption(f"{len(listed)} vessels in order · edit Position to move a vessel · "
+                   f"{len(unlisted)} vessels not listed go last, sorted by name")
+        if st.button("Save Meeting Order", key="meeting_order_save"):
+            # 按 Position 排，新加的行没填 Position 时排在最后；保存时重新从 1 连续编号
+            saved = replace_meeting_order(
+                ed_order.sort_values("Position", kind="stable", na_position="last")["Vessel Name"].tolist())
+            st.success(f"Meeting order saved: {saved} vessels.")
+            st.rerun()
+
     tab_idx += 1
 
 # =========================================================
@@ -1067,53 +614,67 @@ if st.session_state.role in ['admin', 'payroll']:
             ["In Port Payslips", "Out Port Payslips"],
             horizontal=True
         )
+
+        # 💡 并行填写 Word 的进程数，设为 1 即退回原来的单进程串行模式
+        payslip_workers = st.number_input("Parallel workers (1 = serial)", min_value=1,
+                                          max_value=os.cpu_count() or 1, value=DEFAULT_PAYSLIP_WORKERS,
+                                          step=1, key="payslip_workers")
+        payslip_engine = PAYSLIP_ENGINES[st.radio("Rendering engine:", list(PAYSLIP_ENGINES), horizontal=True,
+                                                   key="payslip_engine")]
+        # 💡 内置后端直接按模版坐标画 PDF，服务器没装 LibreOffice 也能用
+        payslip_pdf_backend = PDF_BACKENDS[st.radio("PDF backend:", list(PDF_BACKENDS), horizontal=True,
+                                                    key="payslip_pdf_backend")]
+        if payslip_pdf_backend == 'soffice':
+            # 💡 选了 LibreOffice 才在后台预热转换池，点生成时不用再等冷启动；用内置后端时一个 soffice 都不启动
+            get_converter()
+        # 💡 按船合并转换：每条船只启动一次 LibreOffice，转换完再按页拆回每个人的 PDF
+        payslip_pdf_mode = PDF_MODES[st.radio("PDF conversion:", list(PDF_MODES), horizontal=True,
+                                              key="payslip_pdf_mode",
+                                              help="Combining only applies to the LibreOffice backend.")]
+        # 💡 记录每个阶段的耗时、CPU 和内存峰值，关闭时几乎没有额外开销
+        payslip_instrument = st.checkbox("Record timing & memory", key="payslip_instrument")
         st.write("")
 
-        # 模式 A: 内港
+        # 模式 A: 内港 / 模式 B: 外港 —— 生成任务交给后台队列，页面只显示进度
         if payslips_mode == "In Port Payslips":
             st.info("In Port Mode: Generates BOTH Word and PDF documents")
-            uploaded_in_port = st.file_uploader("Upload 'SUM-SAL' Excel file (In Port)", type=["xlsx"], key="upload_in")
-
-            if uploaded_in_port is not None:
-                if st.button("Generate In Port Payslips (Word & PDF ZIP)", use_container_width=True):
-                    with st.spinner("Please wait"):
-                        try:
-                            uploaded_in_port.seek(0)
-                            zip_data_in = generate_payslip_zip(uploaded_in_port)
-                            st.success("Successfully generated In Port Word & PDF Payslips!")
-                            st.download_button(
-                                label="Download In Port Payslips (.zip)",
-                                data=zip_data_in,
-                                file_name=f"In_Port_Payslips_{datetime.now().strftime('%Y%m%d')}.zip",
-                                mime="application/zip",
-                                use_container_width=True
-                            )
-                        except Exception as e:
-                            st.error(f"Error generating In Port Payslips: {e}")
-
-        # 模式 B: 外港
+            job_kind, button_label = 'in_port', "Generate In Port Payslips (Word & PDF ZIP)"
+            uploaded_payslip = st.file_uploader("Upload 'SUM-SAL' Excel file (In Port)", type=["xlsx"],
+                                                key="upload_in")
         else:
             st.info("Out Port Mode: Generates BOTH Word and PDF documents")
-            uploaded_out_port = st.file_uploader("Upload 'SUM-SAL' Excel file (Out Port)", type=["xlsx"],
-                                                 key="upload_out")
-
-            if uploaded_out_port is not None:
-                if st.button("Generate Out Port Payslips (Word & PDF ZIP)", use_container_width=True):
-                    with st.spinner(
-                            "Please wait"):
-                        try:
-                            uploaded_out_port.seek(0)
-                            zip_data_out = generate_advanced_payslips_zip(uploaded_out_port)
-                            st.success("Successfully generated Out Port Word & PDF payslips!")
-                            st.download_button(
-                                label="Download Out Port Payslips (.zip)",
-                                data=zip_data_out,
-                                file_name=f"Out_Port_Payslips_{datetime.now().strftime('%Y%m%d')}.zip",
-                                mime="application/zip",
-                                use_container_width=True
-                            )
-                        except Exception as e:
-                            st.error(f"Error generating Out Port Payslips: {e}")
+            job_kind, button_label = 'out_port', "Generate Out Port Payslips (Word & PDF ZIP)"
+            uploaded_payslip = st.file_uploader("Upload 'SUM-SAL' Excel file (Out Port)", type=["xlsx"],
+                                                key="upload_out")
+
+        if uploaded_payslip is not None:
+            if st.button(button_label, use_container_width=True):
+                job_id = get_job_queue().submit(job_kind, uploaded_payslip, owner=st.session_state.username,
+                                                workers=payslip_workers, engine=payslip_engine,
+                                                pdf_mode=payslip_pdf_mode, pdf_backend=payslip_pdf_backend,
+                                                instrument=payslip_instrument)
+                # 任务编号放进网址，刷新页面后还能找回进度和下载
+                st.query_params["payslip_job"] = job_id
+
+        recent_jobs = get_job_queue().list_jobs(owner=st.session_state.username)
+        current_job = st.query_params.get("payslip_job")
+        # 工资单是敏感数据：除管理员外只能打开自己提交的任务，拿到别人的链接也找不到
+        job_owner = None if st.session_state.role == 'admin' else st.session_state.username
+        # 网址里带的任务不在最近列表里（比如更早提交的，或管理员打开别人的链接），也把它加进来
+        if current_job and current_job not in [j['id'] for j in recent_jobs]:
+            linked_job = get_job_queue().get(current_job, job_owner)
+            if linked_job is not None:
+                recent_jobs.insert(0, linked_job)
+        if recent_jobs:
+            job_ids = [j['id'] for j in recent_jobs]
+            picked_job = st.selectbox(
+                "Payslip jobs:", job_ids,
+                index=job_ids.index(current_job) if current_job in job_ids else 0,
+                format_func=lambda jid: next(
+                    f"{jid} · {PAYSLIP_JOB_LABELS[j['kind']]} · {j['file_name'] or ''} · {j['status']}"
+                    for j in recent_jobs if j['id'] == jid))
+            st.query_params["payslip_job"] = picked_job
+            show_payslip_job(picked_job, job_owner)
 
     tab_idx += 1
 
@@ -1130,77 +691,39 @@ if st.session_state.role != 'payroll':
         with c2:
             end_d = st.date_input("End Date", value=datetime.now(), key="rep_end")
 
-        with get_engine().connect() as conn:
-            query = """
-                    SELECT r.report_date as "Date", s.ship_name as "Vessel", 
-                           r.this_week_issue as "Report Content", s.manager_name as "Manager"
-                    FROM reports r 
-                    JOIN ships s ON r.ship_id = s.id
-                    WHERE r.report_date BETWEEN :s AND :e 
-                    AND r.is_deleted_by_user = FALSE
-                """
-            params = {"s": start_d, "e": end_d}
-
-            if st.session_state.role not in ['admin', 'supervisor']:
-                query += " AND s.manager_name = :u"
-                params["u"] = st.session_state.username
-            query += " ORDER BY r.report_date DESC"
-            export_df = pd.read_sql_query(text(query), conn, params=params)
+        # 💡 改日期、点按钮引起的重跑直接命中共享缓存，不再每次都查 Postgres；
+        # 查出来的已经是每条船一行、按会议顺序排好的导出行，Excel / PPT 直接照着写
+        export_rows = get_report_center_data(st.session_state.role, st.session_state.username, start_d, end_d)
 
         st.write("---")
         st.subheader("Report Export Settings")
-        order_list = None
-
-        order_file = st.file_uploader("Upload '会议船舶顺序.xlsx' to set report order (上传顺序表 - 可选)",
-                                      type=["xlsx", "csv"], key="order_uploader")
-
-        if order_file is not None:
-            try:
-                if order_file.name.endswith('.csv'):
-                    order_df = pd.read_csv(order_file)
-                else:
-                    order_df = pd.read_excel(order_file)
-
-                if 'Vessel Name' in order_df.columns:
-                    order_list = order_df['Vessel Name'].dropna().astype(str).tolist()
-                elif len(order_df.columns) >= 2:
-                    order_list = order_df.iloc[:, 1].dropna().astype(str).tolist()
-                st.success(f"Successfully loaded order list with {len(order_list)} vessels. (已成功读取上传的顺序表)")
-            except Exception as e:
-                st.error(f"Error reading order file: {e}")
+        meeting_order_count = len(get_meeting_order())
+        if meeting_order_count:
+            st.info(f"Using the meeting order from the Admin Console: {meeting_order_count} vessels.")
         else:
-            local_order_path = "会议船舶顺序.xlsx"
-            if os.path.exists(local_order_path):
-                try:
-                    order_df = pd.read_excel(local_order_path)
-                    if 'Vessel Name' in order_df.columns:
-                        order_list = order_df['Vessel Name'].dropna().astype(str).tolist()
-                    elif len(order_df.columns) >= 2:
-                        order_list = order_df.iloc[:, 1].dropna().astype(str).tolist()
-                    st.info(
-                        f"Using server's default vessel order: {len(order_list)} vessels.")
-                except:
-                    pass
+            st.info("No meeting order has been set; vessels are sorted by manager and name.")
 
         st.write("---")
 
-        if not export_df.empty:
-            excel_prep_df = export_df.rename(
-                columns={"Manager": "manager_name", "Vessel": "ship_name", "Report Content": "this_week_issue"})
+        if not export_rows.empty:
             bc1, bc2 = st.columns(2)
             with bc1:
-                excel_bin = generate_custom_excel(excel_prep_df, order_list)
+                # 💡 只有点下载时才生成 Excel，数据和会议顺序没变时直接用缓存的文件
                 st.download_button(
                     label="Download Excel Report",
-                    data=excel_bin,
+                    data=lambda: get_custom_excel(export_rows),
                     file_name=f"Trust_Ship_Report_{start_d}.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    on_click="ignore",
                     use_container_width=True
                 )
             if st.session_state.role == 'admin':
                 with bc2:
                     if st.button("Generate PPT Summary Preview", use_container_width=True):
-                        ppt_bin = create_ppt_report(excel_prep_df, start_d, end_d, order_list)
+                        # 💡 PPT 骨架只做一次；同样的数据和会议顺序再点一次直接返回上次生成的文件
+                        ppt_bin, ppt_secs, ppt_cached = build_meeting_deck(export_rows)
+                        st.caption(f"{len(export_rows)} vessels · generated in {ppt_secs:.2f}s"
+                                   + (" (cached)" if ppt_cached else ""))
                         st.download_button(
                             label="Click to Download PPT File",
                             data=ppt_bin,
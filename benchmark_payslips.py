@@ -0,0 +1,195 @@
+import os
+import io
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import openpyxl
+from payslip_utils import (read_sum_sal_sheet, parse_in_port_employees, parse_out_port_employees,
+                           iter_render_payslips, load_template, payslip_file_base, payslip_zip_names,
+                           generate_payslip_zip, generate_advanced_payslips_zip, PAYSLIP_RENDERER_VERSION)
+from pdf_converter import get_converter, find_soffice
+
+# 不需要 Streamlit、也不连数据库：用随机生成的 SUM-SAL 表把整条工资单流水线跑一遍并计时
+RANKS = ['MASTER', 'CHIEF OFFICER', '2ND OFFICER', '3RD OFFICER', 'CHIEF ENGINEER', '2ND ENGINEER',
+         '3RD ENGINEER', 'ETO', 'BOSUN', 'AB', 'OS', 'OILER', 'WIPER', 'COOK', 'MESSMAN']
+VESSELS = ['UNI SUPPLY', 'OCEAN PRIDE', 'TRUST STAR', 'SEA VENTURE', '远洋雄狮号', 'PACIFIC HARMONY']
+IN_PORT_HEADERS = ['S/N', 'Name', 'Rank', 'From (Date)', 'To (Date)', 'Day on Board', 'Basic Salary', 'Fixed OT',
+                   'Leave Pay', 'Allowance', 'Net Salary', 'Reimbursement', 'Subtotal', 'Deduction', 'Release',
+                   'Retaining', 'Remittance - Foreign', 'Remittance - Singapore', 'Remarks']
+OUT_PORT_HEADERS = ['S/N', 'Name', 'Rank', 'From Date', 'To Date', 'Day on Board', 'Monthly Salary', 'Incentive',
+                    'Reimbursement', 'Release of Salary', 'Retaining', 'Remittance Foreign Bank', 'Remarks']
+LAYOUTS = {
+    'in_port': (IN_PORT_HEADERS, parse_in_port_employees, generate_payslip_zip),
+    'out_port': (OUT_PORT_HEADERS, parse_out_port_employees, generate_advanced_payslips_zip),
+}
+DEFAULT_SIZES = [10, 100, 1000]
+CREW_PER_VESSEL = 18
+
+
+def make_sum_sal_workbook(layout, crew, seed=0):
+    """
+    生成一份 SUM-SAL 工资表（xlsx 字节）。内港：船名行写 'Vessel Name:' + 船名，下一行是 S/N 表头；
+    外港：S/N 表头的上一行是船名（交替使用 'Vessel Name: xxx' 和只写船名两种写法）
+    """
+    rng = random.Random(seed)
+    headers = LAYOUTS[layout][0]
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = 'SUM-SAL'
+    ws.append(['TRUST SHIP MANAGEMENT - CREW SALARY SUMMARY'])
+    ws.append([f'Period: {datetime(2026, 9, 1):%B %Y}'])
+
+    n_vessels = max(1, round(crew / CREW_PER_VESSEL))
+    for v in range(n_vessels):
+        on_board = crew // n_vessels + (1 if v < crew % n_vessels else 0)
+        vessel = f"{VESSELS[v % len(VESSELS)]} {v // len(VESSELS) + 1}"
+        ws.append([])
+        if layout == 'in_port':
+            ws.append(['Vessel Name:', vessel])
+        else:
+            ws.append([f'Vessel Name: {vessel}'] if v % 2 else [vessel])
+        ws.append(headers)
+        for sn in range(1, on_board + 1):
+            days = rng.choice([30, 30, 30, rng.randint(5, 29)])
+            start = datetime(2026, 9, 31 - days) if days < 30 else datetime(2026, 9, 1)
+            salary = rng.randint(900, 9500)
+            remarks = rng.choice(['', '', '', 'Bonus paid in September', '0', 'Sign-off 15/09'])
+            if layout == 'in_port':
+                basic, fixed_ot, leave = round(salary * 0.58, 2), round(salary * 0.37, 2), round(salary * 0.05, 2)
+                reimb, deduction = rng.choice([0, 0, 55.5, 120]), rng.choice([0, 0, 20])
+                foreign = rng.choice([0, 0, round(salary * 0.7, 2)])
+                ws.append([sn, f'Crew {v}-{sn}', rng.choice(RANKS), start, datetime(2026, 9, 30), days,
+                           basic, fixed_ot, leave, rng.choice([0, 100, '']), salary, reimb, salary + reimb,
+                           deduction, 100, 200, foreign, salary + reimb - deduction - 300, remarks])
+            else:
+                ws.append([sn, f'Crew {v}-{sn}', rng.choice(RANKS), start, datetime(2026, 9, 30), days, salary,
+                           rng.choice([0, 0, 250]), rng.choice([0, 0, 33.3]), 100, 200, salary - 300, remarks])
+        ws.append(['Total'])
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def _timed(fn, *args, **kwargs):
+    cpu, wall = time.process_time(), time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+
+def _zip_outputs(employees, temp_dir):
+    """与正式打包相同的目录结构，把 Word 和 PDF 写进一个内存 ZIP"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for emp in employees:
+            safe_vessel, _, final_filename = payslip_zip_names(emp)
+            base = os.path.join(temp_dir, payslip_file_base(emp))
+            if os.path.exists(f"{base}.docx"):
+                zip_file.write(f"{base}.docx", f"Word_Version/{safe_vessel}/{final_filename}.docx")
+            if os.path.exists(f"{base}_for_pdf.pdf"):
+                zip_file.write(f"{base}_for_pdf.pdf", f"PDF_Version/{safe_vessel}/{final_filename}.pdf",
+                               compress_type=zipfile.ZIP_STORED)
+    return buffer.getbuffer().nbytes
+
+
+def bench_case(layout, crew, engine, pdf_backend, workers):
+    """单个组合：分阶段计时一次，再端到端计时一次；返回结果记录列表"""
+    _, parse_employees, generate = LAYOUTS[layout]
+    kind = layout
+    workbook = make_sum_sal_workbook(layout, crew)
+    records = []
+
+    def record(stage, wall, cpu, **extra):
+        records.append({'layout': layout, 'crew': crew, 'engine': engine, 'pdf_backend': pdf_backend,
+                        'workers': workers, 'stage': stage, 'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4),
+                        'per_employee_ms': round(wall * 1000 / crew, 3) if crew else None, **extra})
+
+    employees, wall, cpu = _timed(lambda: parse_employees(read_sum_sal_sheet(io.BytesIO(workbook))))
+    record('parse', wall, cpu, parsed=len(employees))
+
+    # 模版解析只在第一次调用时发生，提前做掉，不算进填写阶段
+    load_template(kind)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        _, wall, cpu = _timed(lambda: list(iter_render_payslips(kind, employees, temp_dir, workers=workers,
+                                                                 engine=engine, pdf_backend=pdf_backend)))
+        # 内置后端在填写阶段就顺带画好了 PDF，下面再单独量一遍纯画 PDF 的时间
+        record('fill', wall, cpu, includes_pdf=pdf_backend == 'native')
+
+        if pdf_backend == 'soffice':
+            docs = glob.glob(os.path.join(temp_dir, "*_for_pdf.docx"))
+            _, wall, cpu = _timed(get_converter().convert, docs, temp_dir)
+        else:
+            template = load_template(kind)
+            _, wall, cpu = _timed(lambda: [template.render_pdf(emp) for emp in employees])
+        record('pdf', wall, cpu, pdfs=len(glob.glob(os.path.join(temp_dir, "*_for_pdf.pdf"))))
+
+        size, wall, cpu = _timed(_zip_outputs, employees, temp_dir)
+        record('zip', wall, cpu, zip_bytes=size)
+
+    spool, wall, cpu = _timed(generate, io.BytesIO(workbook), workers=workers, engine=engine,
+                              pdf_backend=pdf_backend, use_cache=False)
+    spool.close()
+    record('end_to_end', wall, cpu)
+    return records
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the payslip pipeline on synthetic SUM-SAL workbooks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="crew counts to generate")
+    parser.add_argument("--layouts", nargs="+", choices=list(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument("--engines", nargs="+", choices=['docx', 'xml'], default=['docx', 'xml'])
+    parser.add_argument("--pdf-backends", nargs="+", choices=['soffice', 'native'], default=['soffice', 'native'])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    args = parser.parse_args(argv)
+
+    pdf_backends = list(args.pdf_backends)
+    if 'soffice' in pdf_backends and shutil.which(find_soffice()) is None:
+        print("⚠️ LibreOffice not found, skipping the soffice PDF backend.")
+        pdf_backends.remove('soffice')
+
+    results = []
+    for layout in args.layouts:
+        for crew in args.sizes:
+            for engine in args.engines:
+                for pdf_backend in pdf_backends:
+                    for rec in bench_case(layout, crew, engine, pdf_backend, args.workers):
+                        results.append(rec)
+                        print(f"  [{layout}] crew={crew:<5} engine={engine:<4} pdf={pdf_backend:<7} "
+                              f"{rec['stage']:<10} {rec['wall_s']:>9.3f}s  ({rec['per_employee_ms']} ms/crew)")
+
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'renderer_version': PAYSLIP_RENDERER_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n📄 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    # 模版文件用的是相对路径，和 Main_app.py 一样从项目根目录运行
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main(sys.argv[1:])
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+import sqlalchemy
+from sqlalchemy import text
+from db_migrations import migrate
+from meeting_order import save_meeting_order
+from report_queries import report_center_rows
+from report_export import get_custom_excel, build_meeting_deck, get_deck_template
+
+# 不需要 Streamlit：把随机生成的周报写进临时的 SQLite 库，走和报表中心完全一样的路径计时——
+# SQL 按船合并 + 重新编号，再生成 Excel / PPT
+MANAGERS = ['张三', '李四', '王五', 'Captain Lee', 'Captain Tan', 'Chief Wong']
+FIRST_WEEK = date(2026, 1, 5)
+
+
+def make_reports(vessels, weeks, seed=0):
+    """每条船每周一条周报，内容为几行带编号（编号格式不统一）的问题；返回 (ships 行, reports 行)"""
+    rng = random.Random(seed)
+    ships, reports = [], []
+    for v in range(vessels):
+        ships.append({"id": v + 1, "ship_name": f"VESSEL {v + 1:03d}", "manager_name": MANAGERS[v % len(MANAGERS)]})
+        for w in range(weeks):
+            lines = [f"{i + 1}{rng.choice(['.', '、', ' ', ''])} Issue {rng.randint(1, 999)} reported"
+                     for i in range(rng.randint(1, 6))]
+            reports.append({"sid": v + 1, "d": FIRST_WEEK + timedelta(weeks=w), "i": "\n".join(lines)})
+    return ships, reports
+
+
+def seed_database(engine, ships, reports):
+    """建表并写入数据，会议顺序设成船名倒序（顺序表生效时的排序路径）"""
+    migrate(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM reports"))
+        conn.execute(text("DELETE FROM ships"))
+        conn.execute(text("INSERT INTO ships (id, ship_name, manager_name) VALUES (:id, :ship_name, :manager_name)"),
+                     ships)
+        conn.execute(text("INSERT INTO reports (ship_id, report_date, this_week_issue) VALUES (:sid, :d, :i)"),
+                     reports)
+        save_meeting_order(conn, [s["ship_name"] for s in reversed(ships)])
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Report Center query, Excel and PPT exports.")
+    parser.add_argument("--vessels", type=int, default=60)
+    parser.add_argument("--weeks", type=int, nargs="+", default=[1, 4, 26])
+    args = parser.parse_args(argv)
+
+    _, secs = _timed(get_deck_template)
+    print(f"PPT template prepared once in {secs:.3f}s")
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        for weeks in args.weeks:
+            ships, reports = make_reports(args.vessels, weeks)
+            seed_database(engine, ships, reports)
+            with engine.connect() as conn:
+                rows, query_secs = _timed(report_center_rows, conn, FIRST_WEEK, FIRST_WEEK + timedelta(weeks=weeks))
+            _, excel_secs = _timed(get_custom_excel, rows)
+            _, excel_repeat = _timed(get_custom_excel, rows)
+            (_, cold, _), _ = _timed(build_meeting_deck, rows)
+            (_, warm, cached), _ = _timed(build_meeting_deck, rows)
+            print(f"  vessels={args.vessels:<4} weeks={weeks:<3} reports={len(reports):<6} query {query_secs:7.3f}s   "
+                  f"excel {excel_secs:7.3f}s (repeat {excel_repeat:7.4f}s)   "
+                  f"ppt {cold:7.3f}s   ppt repeat {warm:7.4f}s{' (cached)' if cached else ''}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    # Logo 用的是相对路径，和 Main_app.py 一样从项目根目录运行
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    main(sys.argv[1:])
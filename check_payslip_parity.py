@@ -0,0 +1,73 @@
+import io
+import sys
+import zipfile
+from docx import Document
+from docx.shared import Cm
+from payslip_utils import load_template, PAYSLIP_TEMPLATES
+
+# 覆盖各种容易出错的取值：空值、.0 浮点、XML 特殊字符、首尾空格、制表符、换行、无效备注
+SAMPLE_EMPLOYEES = [
+    {'Vessel Name': 'UNI SUPPLY 1', 'Name': 'John Tan', 'Rank': 'MASTER', 'From': '01/09/2026',
+     'To': '30/09/2026', 'Day on Board': 30.0, 'Basic Salary': '5,220.00', 'Fixed OT': '3,330.00',
+     'Leave Pay': '450.00', 'Allowance': '', 'Net Salary': '9,000.00', 'Reimbursement': '55.50',
+     'Subtotal': '9,055.50', 'Deduction': '0.00', 'Release': '100.00', 'Retaining': '200.00',
+     'Remittance': '8,755.50', 'Bonus/Incentive': '250.00', 'Total Earnings': '9,250.00',
+     'Net Amount': '9,305.50', 'Total Deductions': '0.00', 'Remarks': 'Bonus paid in Sept'},
+    {'Vessel Name': 'A&B <Marine>', 'Name': '  Lee "Ah" Kow ', 'Rank': 'AB', 'From': '', 'To': None,
+     'Day on Board': '', 'Basic Salary': '', 'Fixed OT': '', 'Leave Pay': '', 'Allowance': '-',
+     'Net Salary': '', 'Reimbursement': '', 'Subtotal': '', 'Deduction': '', 'Release': '',
+     'Retaining': '', 'Remittance': '', 'Bonus/Incentive': '', 'Total Earnings': '', 'Net Amount': '',
+     'Total Deductions': '', 'Remarks': '0'},
+    {'Vessel Name': '远洋雄狮号', 'Name': '张三', 'Rank': 'CHIEF\tENGINEER', 'From': '2026-09-01',
+     'To': '2026-09-30', 'Day on Board': 15, 'Basic Salary': 'N/A', 'Fixed OT': '1,000.00',
+     'Leave Pay': '50.00', 'Allowance': '100.00', 'Net Salary': '1,150.00', 'Reimbursement': '0.00',
+     'Subtotal': '1,150.00', 'Deduction': '20.00', 'Release': '0.00', 'Retaining': '0.00',
+     'Remittance': '1,130.00', 'Bonus/Incentive': '0.00', 'Total Earnings': '1,150.00',
+     'Net Amount': '1,150.00', 'Total Deductions': '20.00', 'Remarks': 'line one\nline two & <three>'},
+]
+
+
+def extract(docx_bytes):
+    """提取正文段落文字和所有表格单元格的文字"""
+    doc = Document(io.BytesIO(docx_bytes))
+    paragraphs = [p.text for p in doc.paragraphs]
+    cells = [[[cell.text for cell in row.cells] for row in table.rows] for table in doc.tables]
+    return paragraphs, cells, doc.sections[0].top_margin
+
+
+def document_xml(docx_bytes):
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as z:
+        return z.read('word/document.xml')
+
+
+def check(kind, emp, top_margin):
+    template = load_template(kind)
+    buffer = io.BytesIO()
+    doc = template.fill(emp)
+    doc.sections[0].top_margin = top_margin
+    doc.save(buffer)
+    via_docx = buffer.getvalue()
+    via_xml = template.render_xml(emp, top_margin)
+
+    if extract(via_docx) != extract(via_xml):
+        return "text / cell values differ"
+    if document_xml(via_docx) != document_xml(via_xml):
+        return "document.xml bytes differ"
+    return None
+
+
+if __name__ == "__main__":
+    print("🔍 Comparing python-docx and direct XML payslip renderers...\n")
+    failures = 0
+    for kind in PAYSLIP_TEMPLATES:
+        for emp in SAMPLE_EMPLOYEES:
+            for label, margin in [("Word", Cm(2.2)), ("PDF", Cm(1.5))]:
+                problem = check(kind, emp, margin)
+                status = f"❌ {problem}" if problem else "✅"
+                print(f"  [{kind}] {emp['Name'].strip()} ({label}): {status}")
+                failures += bool(problem)
+
+    if failures:
+        print(f"\n⚠️ {failures} mismatches found.")
+        sys.exit(1)
+    print("\n🎉 Both renderers produce identical payslips.")
@@ -0,0 +1,96 @@
+import os
+import threading
+from urllib.parse import urlsplit, parse_qs
+import sqlalchemy
+from sqlalchemy import event
+from db_migrations import migrate
+
+# 页面和导出工具共用的数据库连接：整个服务进程只建一个引擎，连接在两边之间复用，
+# 不再每次导出都重新握手。各项参数都可以用环境变量覆盖
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))  # 设为 0 则不做连接池，每次用完就关
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))  # 秒，早于服务端 / 连接池的空闲断开
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") != "0"
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))  # 0 表示不限
+DB_CONNECT_TIMEOUT = int(os.environ.get("DB_CONNECT_TIMEOUT", 10))
+# URL 里没写 sslmode 时，Postgres 默认和原来的导出连接一样用 require（Supabase 只该走加密连接）；
+# 环境变量可以改成别的值，设为空则交给 libpq 默认值。URL 里写了的（verify-full、本地的 disable 等）一律以 URL 为准
+DB_SSLMODE = os.environ.get("DB_SSLMODE", "require")
+# auto：端口 6543 或主机名含 pooler 时按 Supabase 事务池模式处理；也可以直接写 transaction / session
+DB_POOLER_MODE = os.environ.get("DB_POOLER_MODE", "auto")
+
+TRANSACTION_POOLER_PORT = 6543
+
+
+def normalize_url(url):
+    """SQLAlchemy 不认旧式的 postgres:// 前缀；没写驱动时固定用 requirements 里的 psycopg2"""
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+psycopg2://", 1)
+    return url
+
+
+def is_transaction_pooler(url, mode=DB_POOLER_MODE):
+    if mode != "auto":
+        return mode == "transaction"
+    parts = urlsplit(url)
+    return parts.port == TRANSACTION_POOLER_PORT or "pooler" in (parts.hostname or "")
+
+
+def create_db_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE,
+                     pre_ping=DB_POOL_PRE_PING, statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS,
+                     pooler_mode=DB_POOLER_MODE):
+    """
+    按配置建引擎。Postgres 走事务池（Supabase 6543 端口）时，连接会在事务之间被换给别的客户端，
+    不能带会话级的设置：语句超时改成每个事务开头 SET LOCAL，而不是通过启动参数设置
+    """
+    url = normalize_url(url)
+    kwargs = {"pool_pre_ping": pre_ping}
+    if pool_size == 0:
+        kwargs["poolclass"] = sqlalchemy.pool.NullPool
+    elif not url.startswith("sqlite"):
+        kwargs.update(pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle)
+
+    if not url.startswith("postgresql"):
+        return sqlalchemy.create_engine(url, **kwargs)
+
+    pooled_by_server = is_transaction_pooler(url, pooler_mode)
+    connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    # 连接参数会覆盖 URL 里的同名设置，所以只在 URL 没写 sslmode 时才补上
+    if DB_SSLMODE and "sslmode" not in parse_qs(urlsplit(url).query):
+        connect_args["sslmode"] = DB_SSLMODE
+    if statement_timeout_ms and not pooled_by_server:
+        connect_args["options"] = f"-c statement_timeout={statement_timeout_ms}"
+    engine = sqlalchemy.create_engine(url, connect_args=connect_args, **kwargs)
+
+    if statement_timeout_ms and pooled_by_server:
+        @event.listens_for(engine, "begin")
+        def _set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout_ms)}")
+    return engine
+
+
+def database_url():
+    """优先用环境变量 DATABASE_URL，否则读 Streamlit 的 secrets（和原来一样）"""
+    url = os.environ.get("DATABASE_URL")
+    if url:
+        return url
+    import streamlit as st
+    return st.secrets["postgres_url"]
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(url=None):
+    """整个服务进程共享的引擎，第一次使用时把表结构升级到最新版本"""
+    url = normalize_url(url or database_url())
+    with _engines_lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = create_db_engine(url)
+            # 💡 每个服务进程启动时把表结构和索引升级到最新版本，已是最新时只查一次版本号
+            migrate(engine)
+            _engines[url] = engine
+        return engine
@@ -0,0 +1,253 @@
+import os
+import sys
+import argparse
+from datetime import datetime
+from contextlib import contextmanager
+import sqlalchemy
+from sqlalchemy import text, bindparam
+
+# 本地 SQLite 和云端 Postgres 共用同一套按版本号顺序执行的迁移，每个版本只执行一次，
+# 执行记录写在 schema_migrations 表里。新增迁移时只往 MIGRATIONS 末尾追加，不要改已发布的版本
+LOCAL_DB_URL = "sqlite:///ships.db"
+
+
+def _columns(conn, table):
+    return {c['name'] for c in sqlalchemy.inspect(conn).get_columns(table)}
+
+
+def _create_base_tables(conn, dialect):
+    id_column = "SERIAL PRIMARY KEY" if dialect == 'postgresql' else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS ships (
+            id {id_column},
+            ship_name TEXT NOT NULL,
+            manager_name TEXT NOT NULL
+        )
+    """))
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS reports (
+            id {id_column},
+            ship_id INTEGER REFERENCES ships (id),
+            report_date DATE,
+            this_week_issue TEXT,
+            remarks TEXT
+        )
+    """))
+
+
+def _create_users_table(conn, dialect):
+    # 登录界面按 username + password 查 role
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL
+        )
+    """))
+
+
+def _add_soft_delete_flag(conn, dialect):
+    if 'is_deleted_by_user' not in _columns(conn, 'reports'):
+        conn.execute(text("ALTER TABLE reports ADD COLUMN is_deleted_by_user BOOLEAN NOT NULL DEFAULT FALSE"))
+
+
+def _add_report_indexes(conn, dialect):
+    # 历史记录 / 导入上周：按船查未删除的记录，按日期倒序取前几条
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reports_ship_live "
+                      "ON reports (ship_id, report_date DESC, id DESC) WHERE is_deleted_by_user = FALSE"))
+    # 报表中心：按日期范围查未删除的记录
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reports_date_live "
+                      "ON reports (report_date DESC, id DESC) WHERE is_deleted_by_user = FALSE"))
+    # 管理员控制台：按 (report_date, id) 做 keyset 分页，包含已删除的记录
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reports_date_id ON reports (report_date DESC, id DESC)"))
+    # 船舶管理人只看自己的船
+    conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ships_manager ON ships (manager_name, ship_name)"))
+
+
+def _create_meeting_order_table(conn, dialect):
+    # 会议 / 报表中心导出的船舶顺序，vessel_key 是 UPPER(TRIM(ship_name)) 的形式，用来和 ships 表对应
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS meeting_order (
+            position INTEGER PRIMARY KEY,
+            vessel_name TEXT NOT NULL,
+            vessel_key TEXT NOT NULL UNIQUE
+        )
+    """))
+    # 服务器上原来放着顺序表的，建表时导入一次
+    from meeting_order import MEETING_ORDER_FILE, read_order_file, save_meeting_order
+    if os.path.exists(MEETING_ORDER_FILE) and not conn.execute(text("SELECT 1 FROM meeting_order LIMIT 1")).first():
+        save_meeting_order(conn, read_order_file(MEETING_ORDER_FILE))
+
+
+def _add_report_search_index(conn, dialect):
+    # 全文检索周报的问题和备注（report_search.py），新增 / 修改 / 删除记录时索引自动跟着变
+    if dialect == 'postgresql':
+        # 生成列由 Postgres 在每次写入时自己算，问题权重 A、备注权重 B；检索时用同一个 'english' 配置
+        conn.execute(text("""
+            ALTER TABLE reports ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', COALESCE(this_week_issue, '')), 'A') ||
+                setweight(to_tsvector('english', COALESCE(remarks, '')), 'B')
+            ) STORED
+        """))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reports_search ON reports USING GIN (search_vector)"))
+        return
+
+    # SQLite：外部内容的 FTS5 表，只存索引不存第二份文本，由触发器和 reports 保持同步
+    conn.execute(text("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS reports_fts USING fts5(
+            this_week_issue, remarks, content='reports', content_rowid='id', tokenize='porter unicode61'
+        )
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS reports_fts_insert AFTER INSERT ON reports BEGIN
+            INSERT INTO reports_fts (rowid, this_week_issue, remarks) VALUES (new.id, new.this_week_issue, new.remarks);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS reports_fts_delete AFTER DELETE ON reports BEGIN
+            INSERT INTO reports_fts (reports_fts, rowid, this_week_issue, remarks)
+            VALUES ('delete', old.id, old.this_week_issue, old.remarks);
+        END
+    """))
+    conn.execute(text("""
+        CREATE TRIGGER IF NOT EXISTS reports_fts_update AFTER UPDATE OF this_week_issue, remarks ON reports BEGIN
+            INSERT INTO reports_fts (reports_fts, rowid, this_week_issue, remarks)
+            VALUES ('delete', old.id, old.this_week_issue, old.remarks);
+            INSERT INTO reports_fts (rowid, this_week_issue, remarks) VALUES (new.id, new.this_week_issue, new.remarks);
+        END
+    """))
+    # 已有的记录一次性建进索引
+    conn.execute(text("INSERT INTO reports_fts (reports_fts) VALUES ('rebuild')"))
+
+
+MIGRATIONS = [
+    (1, "ships and reports tables", _create_base_tables),
+    (2, "users table", _create_users_table),
+    (3, "reports.is_deleted_by_user", _add_soft_delete_flag),
+    (4, "indexes for history, report center and admin queries", _add_report_indexes),
+    (5, "meeting_order table", _create_meeting_order_table),
+    (6, "full-text search index on reports", _add_report_search_index),
+]
+
+
+# 迁移锁：两个服务进程同时启动、面对同一个空库时，只让一个去建表，另一个等它做完再看版本号
+MIGRATION_LOCK_KEY = 20260316
+
+
+def _applied_version(conn):
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def current_version(engine):
+    with engine.connect() as conn:
+        if not sqlalchemy.inspect(conn).has_table('schema_migrations'):
+            return 0
+        return _applied_version(conn)
+
+
+@contextmanager
+def _locked_transaction(engine):
+    """
+    拿着迁移锁的事务。Postgres 用事务级的 advisory lock，随提交自动释放，走 Supabase 事务池也不会串到别的连接；
+    SQLite 用 BEGIN IMMEDIATE 一开始就拿写锁，另一个进程在 busy timeout 内排队等
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK_KEY})
+        elif engine.dialect.name == 'sqlite':
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def migrate(engine):
+    """
+    把数据库升级到最新版本，每个迁移单独一个事务；返回本次执行的版本号列表。
+    每个事务都先拿迁移锁、再重新读版本号，别的进程已经做过的迁移直接跳过
+    """
+    dialect = engine.dialect.name
+    latest = MIGRATIONS[-1][0]
+    # 已是最新时只查一次版本号，不去抢锁
+    if current_version(engine) >= latest:
+        return []
+
+    with _locked_transaction(engine) as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TEXT NOT NULL
+            )
+        """))
+
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        with _locked_transaction(engine) as conn:
+            if _applied_version(conn) >= version:
+                continue
+            apply(conn, dialect)
+            conn.execute(text("INSERT INTO schema_migrations (version, description, applied_at) "
+                              "VALUES (:v, :d, :t)"),
+                         {"v": version, "d": description, "t": datetime.now().isoformat(timespec='seconds')})
+        applied.append(version)
+    return applied
+
+
+def explain_queries(dialect):
+    """
+    要检查执行计划的热点查询（和 Main_app.py 跑的是 report_queries 里的同一批语句）：
+    {名称: (语句, 参数, 预期用到的索引)}，列表参数按 IN 展开
+    """
+    from report_queries import HISTORY_QUERY, report_center_sql
+    return {
+        'History Record': (HISTORY_QUERY, {"sids": [1, 2], "n": 10}, 'idx_reports_ship_live'),
+        'Report Center': (report_center_sql(dialect), {"s": "2026-01-01", "e": "2026-01-07"}, 'idx_reports_date_live'),
+    }
+
+
+def explain_check(engine):
+    """
+    对每条热点查询跑一遍 EXPLAIN，返回 {名称: (是否用到预期索引, 执行计划文本)}。
+    Postgres 在小表上会直接顺序扫描，所以检查时关掉 seqscan，只看索引能不能被用上
+    """
+    results = {}
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            prefix = "EXPLAIN "
+        else:
+            prefix = "EXPLAIN QUERY PLAN "
+        for name, (query, params, index) in explain_queries(engine.dialect.name).items():
+            statement = text(prefix + query).bindparams(
+                *(bindparam(k, expanding=True) for k, v in params.items() if isinstance(v, list)))
+            plan = "\n".join(str(row[-1]) for row in conn.execute(statement, params))
+            results[name] = (index in plan, plan)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check the query plans.")
+    parser.add_argument("--url", default=LOCAL_DB_URL, help="SQLAlchemy database URL (default: local ships.db)")
+    parser.add_argument("--check", action="store_true", help="run the EXPLAIN check after migrating")
+    args = parser.parse_args(argv)
+
+    engine = sqlalchemy.create_engine(args.url)
+    applied = migrate(engine)
+    print(f"✅ Schema at version {current_version(engine)}" +
+          (f" (applied {', '.join(map(str, applied))})" if applied else " (already up to date)"))
+
+    if args.check:
+        ok = True
+        for name, (uses_index, plan) in explain_check(engine).items():
+            ok &= uses_index
+            print(f"{'✅' if uses_index else '❌'} {name}\n    " + plan.replace("\n", "\n    "))
+        return 0 if ok else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
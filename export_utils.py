@@ -2,29 +2,16 @@ import pandas as pd
 from pptx import Presentation
 from pptx.util import Inches, Pt
 from pptx.dml.color import RGBColor
-import sqlalchemy
 from sqlalchemy import text
 import streamlit as st
 from datetime import datetime
+from db import get_engine
 
 
-# 1. 数据库连接函数 (同步 Main_app.py 的终极修复逻辑)
+# 1. 数据库连接函数：和 Main_app.py 共用 db.py 里的同一个连接池，导出时直接拿现成的连接
 def get_conn():
     try:
-        db_url = st.secrets["postgres_url"]
-        if db_url.startswith("postgres://"):
-            db_url = db_url.replace("postgres://", "postgresql://", 1)
-
-        # 必须加入 NullPool 和 connect_args 才能在 Supabase 连接池模式下稳定运行
-        engine = sqlalchemy.create_engine(
-            db_url,
-            poolclass=sqlalchemy.pool.NullPool,
-            connect_args={
-                "sslmode": "require",
-                "connect_timeout": 10
-            }
-        )
-        return engine.connect()
+        return get_engine().connect()
     except Exception as e:
         st.error(f"导出工具连接数据库失败: {e}")
         return None
@@ -1,33 +1,17 @@
 import sqlite3
+import sqlalchemy
+from db_migrations import migrate, LOCAL_DB_URL
 
 def init_database():
-    # 1. 连接数据库 (如果不存在则自动创建 ships.db 文件)
+    # 1. 建表、加列、建索引统一交给 db_migrations，和云端 Postgres 保持同一套表结构
+    # (如果不存在则自动创建 ships.db 文件)
+    migrate(sqlalchemy.create_engine(LOCAL_DB_URL))
+
+    # 2. 连接数据库
     conn = sqlite3.connect('ships.db')
     cursor = conn.cursor()
 
-    # 2. 创建“船舶表”：存储船名、谁管这艘船
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS ships (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ship_name TEXT NOT NULL,
-        manager_name TEXT NOT NULL
-    )
-    ''')
-
-    # 3. 创建“周报记录表”：存储每一周填写的具体问题
-    # ship_id 是用来关联上面那张表的（知道这行问题是哪艘船的）
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS reports (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ship_id INTEGER,
-        report_date DATE,
-        this_week_issue TEXT,
-        remarks TEXT,
-        FOREIGN KEY (ship_id) REFERENCES ships (id)
-    )
-    ''')
-
-    # 4. 预设一些基础数据 (模拟你们公司的实际情况)
+    # 3. 预设一些基础数据 (模拟你们公司的实际情况)
     # 先检查表里有没有数据，没数据再添加，防止重复添加
     cursor.execute("SELECT COUNT(*) FROM ships")
     if cursor.fetchone()[0] == 0:
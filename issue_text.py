@@ -0,0 +1,59 @@
+import re
+import numpy as np
+import pandas as pd
+
+# 每行去掉首尾空白和用户自己写的编号（"1." "2、" "3 " 等），相当于逐行 re.sub(r'^\d+[\.、\s]*', '', line.strip())。
+# 从换行符开始匹配、空白不跨过换行，整列拼成一个字符串后一次替换完；行尾空白切分后再去
+_LINE_START = re.compile(r'\n[^\S\n]*(?:\d+(?:[.、]|[^\S\n])*)?')
+# 拼接时标记一组结束的分隔符；Postgres 的 text 存不了 NUL，SQLite 里的也会先被去掉
+_GROUP_END = "\x00"
+
+
+def issue_lines(issues):
+    """
+    把一列问题文本拆成逐行的 Series，索引沿用原来的行号：
+    每行去掉首尾空白和原有编号，空行丢掉；空值和空字符串整条跳过
+    """
+    issues = issues.dropna()
+    issues = issues[issues.astype(bool)].astype(str)
+    if issues.empty:
+        return pd.Series([], dtype=object)
+    # 💡 不逐行调用 re.sub：整列拼成一个字符串，一次正则替换、一次切分，再按每条的行数把行号对回去
+    text = _LINE_START.sub("\n", "\n" + "\n".join(issues.to_numpy(dtype=object)).replace(_GROUP_END, ""))
+    line_counts = issues.str.count("\n").to_numpy() + 1
+    lines = pd.Series(list(map(str.rstrip, text.split("\n")[1:])),
+                      index=issues.index.repeat(line_counts), dtype=object)
+    return lines[lines != ""]
+
+
+def _join_numbered(lines, codes, n_groups):
+    """
+    codes 为每行所属的组号（0 到 n_groups - 1），组内按出现顺序重新编号为 "1. xxx"，再用换行拼成一段；
+    返回按组号排列的文本数组，没有任何行的组为空字符串
+    """
+    texts = np.full(n_groups, "", dtype=object)
+    if len(codes) == 0:
+        return texts
+    # 💡 不逐组 "\n".join：行按组号稳定排序后整体拼成一个字符串，组尾换成分隔符，再一次切开
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    position = np.arange(len(codes))
+    is_first = np.r_[True, codes[1:] != codes[:-1]]
+    is_last = np.r_[codes[1:] != codes[:-1], True]
+    numbers = position - np.maximum.accumulate(np.where(is_first, position, 0))
+    # 编号前缀、行文本、行尾交错排成一个数组，一次 join 拼完，中间不生成逐行的字符串
+    parts = np.empty((len(codes), 3), dtype=object)
+    parts[:, 0] = np.array([f"{i}. " for i in range(1, numbers.max() + 2)], dtype=object)[numbers]
+    parts[:, 1] = lines.to_numpy(dtype=object)[order]
+    parts[:, 2] = "\n"
+    parts[is_last, 2] = _GROUP_END
+    texts[codes[is_last]] = "".join(parts.ravel()).split(_GROUP_END)[:-1]
+    return texts
+
+
+def renumber_issues(issues):
+    """逐条记录重新编号（历史记录、报表中心按船合并后的问题、检索结果），返回与 issues 对齐的字符串 Series"""
+    lines = issue_lines(issues.reset_index(drop=True))
+    texts = _join_numbered(lines, lines.index.to_numpy(), len(issues))
+    return pd.Series(texts, index=issues.index, name=issues.name, dtype=object)
+
@@ -0,0 +1,39 @@
+import pandas as pd
+from sqlalchemy import text
+
+# 原来每次打开报表中心都要读的顺序表；现在只在建 meeting_order 表时导入一次，之后在管理员控制台维护
+MEETING_ORDER_FILE = "会议船舶顺序.xlsx"
+
+
+def vessel_key(name):
+    """顺序表和船名对应时忽略大小写和首尾空格，以防填错"""
+    return str(name).strip().upper()
+
+
+def read_order_file(file, file_name=None):
+    """读上传的或服务器上的顺序表（xlsx / csv），返回按顺序排列的船名列表"""
+    file_name = file_name or getattr(file, 'name', str(file))
+    order_df = pd.read_csv(file) if file_name.endswith('.csv') else pd.read_excel(file)
+    if 'Vessel Name' in order_df.columns:
+        return order_df['Vessel Name'].dropna().astype(str).tolist()
+    if len(order_df.columns) >= 2:
+        return order_df.iloc[:, 1].dropna().astype(str).tolist()
+    return []
+
+
+def load_meeting_order(conn):
+    return pd.read_sql_query(text("SELECT position, vessel_name FROM meeting_order ORDER BY position"), conn)
+
+
+def save_meeting_order(conn, names):
+    """整表替换为 names 的顺序（从 1 开始编号）；空名字丢掉，重复的船只保留第一次出现的位置。返回保存的条数"""
+    rows, seen = [], set()
+    for name in names:
+        key = vessel_key(name) if name is not None and not pd.isna(name) else ""
+        if key and key not in seen:
+            seen.add(key)
+            rows.append({"p": len(rows) + 1, "n": str(name).strip(), "k": key})
+    conn.execute(text("DELETE FROM meeting_order"))
+    if rows:
+        conn.execute(text("INSERT INTO meeting_order (position, vessel_name, vessel_key) VALUES (:p, :n, :k)"), rows)
+    return len(rows)
@@ -3,6 +3,8 @@ import sqlalchemy
 from sqlalchemy import text
 import pandas as pd
 import urllib.parse
+from db_migrations import migrate as migrate_schema
+from meeting_order import save_meeting_order
 
 # ================= 配置区 (请只修改密码) =================
 # 1. 你的项目 ID
@@ -39,16 +41,24 @@ def migrate():
             conn.execute(text("SELECT 1"))
         print("✅ 云端连接成功！(终于通了)")
 
+        # 1.5 两边都先升级到同一套表结构（含 users 表、软删除列和索引）
+        migrate_schema(engine)
+        migrate_schema(sqlalchemy.create_engine(f"sqlite:///{LOCAL_DB}"))
+        print("✅ 表结构已升级到最新版本")
+
         # 2. 连接本地
         local_conn = sqlite3.connect(LOCAL_DB)
         print("✅ 本地数据库已读取")
 
         # 3. 开始搬运
-        for table in ['ships', 'reports']:
+        for table in ['users', 'ships', 'reports']:
             print(f"📦 正在搬运表: {table} ...")
             try:
                 df = pd.read_sql_query(f"SELECT * FROM {table}", local_conn)
                 if not df.empty:
+                    # SQLite 里布尔值存成 0/1，Postgres 的 BOOLEAN 列不接受整数
+                    if 'is_deleted_by_user' in df.columns:
+                        df['is_deleted_by_user'] = df['is_deleted_by_user'].astype(bool)
                     df.to_sql(table, engine, if_exists='append', index=False)
                     print(f"   成功写入 {len(df)} 条数据")
                 else:
@@ -56,6 +66,16 @@ def migrate():
             except Exception as e:
                 print(f"   ⚠️ 搬运 {table} 时遇到小问题 (可能是表已存在): {e}")
 
+        # 3.5 会议顺序以本地为准整表替换：两边建表时都可能已经从顺序表导入过一份，直接追加会主键冲突
+        print("📦 正在搬运表: meeting_order ...")
+        order = pd.read_sql_query("SELECT vessel_name FROM meeting_order ORDER BY position", local_conn)
+        if not order.empty:
+            with engine.begin() as conn:
+                saved = save_meeting_order(conn, order['vessel_name'].tolist())
+            print(f"   成功写入 {saved} 条数据")
+        else:
+            print("   表 meeting_order 是空的，保留云端现有的顺序")
+
         # 4. 修复 ID
         with engine.begin() as conn:
             conn.execute(text("SELECT setval('ships_id_seq', (SELECT MAX(id) FROM ships))"))
@@ -0,0 +1,137 @@
+import os
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录和容量上限，可通过环境变量覆盖
+DEFAULT_CACHE_DIR = os.environ.get("PAYSLIP_CACHE_DIR", os.path.join(tempfile.gettempdir(), "tsm_payslip_cache"))
+DEFAULT_CACHE_MAX_BYTES = int(os.environ.get("PAYSLIP_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+DOCX = "docx"
+PDF = "pdf"
+
+
+def file_digest(path):
+    """文件内容的 sha256，用作模版在缓存键里的指纹"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def payslip_cache_key(emp, template_digest, renderer_version, engine):
+    """员工记录 + 模版内容 + 渲染器版本 + 引擎 -> 缓存键，任何一项变化都会得到新的键"""
+    h = hashlib.sha256()
+    for part in (renderer_version, engine, template_digest, sorted(emp.items())):
+        h.update(repr(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class PayslipCache:
+    """
+    按内容寻址的磁盘缓存，存放渲染好的工资单 Word 和 PDF：
+    <root>/<键前两位>/<键>.docx|.pdf。命中时刷新文件修改时间，
+    总大小超过 max_bytes 后按修改时间从旧到新淘汰
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    def _path(self, key, kind):
+        return os.path.join(self.root, key[:2], f"{key}.{kind}")
+
+    def lookup(self, key):
+        """Word 和 PDF 都在缓存里才算命中，返回 (docx 路径, pdf 路径)，否则返回 None"""
+        paths = (self._path(key, DOCX), self._path(key, PDF))
+        try:
+            for path in paths:
+                os.utime(path)
+        except OSError:
+            return None
+        return paths
+
+    def checkout(self, key, dest_dir):
+        """
+        命中时把 Word 和 PDF 硬链接（跨文件系统时复制）到 dest_dir，返回 (docx 路径, pdf 路径)，否则返回 None。
+        本次生成拿到的是自己的一份，其他会话同时淘汰缓存文件也不影响后面写 ZIP
+        """
+        paths = self.lookup(key)
+        if paths is None:
+            return None
+        copies = tuple(os.path.join(dest_dir, os.path.basename(path)) for path in paths)
+        created = []
+        try:
+            for path, dest in zip(paths, copies):
+                if os.path.exists(dest):  # 内容完全相同的两名船员，已经取过一份
+                    continue
+                try:
+                    os.link(path, dest)
+                except OSError:
+                    shutil.copyfile(path, dest)
+                created.append(dest)
+        except OSError:
+            # 查到之后、链接之前被淘汰了，当作没命中重新生成
+            for dest in created:
+                os.remove(dest)
+            return None
+        return copies
+
+    def store(self, key, kind, src_path):
+        """把生成好的文件复制进缓存；先写临时文件再改名，并发的会话不会读到半个文件"""
+        dest = self._path(key, kind)
+        try:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".tmp")
+            with os.fdopen(fd, "wb") as out, open(src_path, "rb") as src:
+                shutil.copyfileobj(src, out)
+            os.replace(tmp_path, dest)
+        except OSError as e:
+            # 缓存写不进去不影响本次生成
+            logger.warning("Payslip cache store failed for %s: %s", dest, e)
+
+    def evict(self):
+        """总大小超过上限时，从最久没用过的文件开始删除"""
+        with self._evict_lock:
+            entries = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+                    total += st.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_payslip_cache():
+    """整个服务进程共享的工资单缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PayslipCache()
+        return _default_cache
@@ -0,0 +1,84 @@
+import re
+import zipfile
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PyPdfError
+
+_BODY_RE = re.compile(rb"<w:body>(.*)(<w:sectPr\b.*</w:sectPr>)</w:body>", re.S)
+_DOCPR_ID_RE = re.compile(rb'(<wp:docPr\b[^>]*?\bid=")(\d+)(")')
+
+
+def _split_body(xml):
+    """document.xml -> (body 之前, 正文内容, 结尾的 sectPr, body 之后)"""
+    m = _BODY_RE.search(xml)
+    if m is None:
+        raise ValueError("Unexpected document.xml layout: no body-level section properties")
+    return xml[:m.start(1)], m.group(1), m.group(2), xml[m.end(2):]
+
+
+def _end_section_in_last_paragraph(content, sect_pr):
+    """
+    把 sectPr 放进正文最后一个段落的 pPr 里，让这份工资单自成一节（下一份从新的一页开始）。
+    不额外插入分页段落，每一页的版面和单独转换时完全一样
+    """
+    if not content.endswith(b"</w:p>"):
+        raise ValueError("Payslip body does not end with a paragraph")
+    p_start = max(content.rfind(b"<w:p>"), content.rfind(b"<w:p "))
+    open_end = content.index(b">", p_start) + 1
+    if content.startswith(b"<w:pPr>", open_end) or content.startswith(b"<w:pPr ", open_end):
+        close = content.index(b"</w:pPr>", open_end)
+        return content[:close] + sect_pr + content[close:]
+    return content[:open_end] + b"<w:pPr>" + sect_pr + b"</w:pPr>" + content[open_end:]
+
+
+def combine_docx(docx_paths, out_path):
+    """
+    把同一模版生成的多份 docx 拼成一份多节文档：每份工资单一节，节属性沿用各自的 sectPr。
+    其余部件（样式、图片、关系）都来自同一模版，直接沿用第一份的
+    """
+    bodies = []
+    head = tail = final_sect_pr = None
+    for n, path in enumerate(docx_paths):
+        with zipfile.ZipFile(path) as z:
+            xml = z.read("word/document.xml")
+        head, content, sect_pr, tail = _split_body(xml)
+        # 图片的 docPr id 在整份文档里必须唯一，每一份错开编号
+        content = _DOCPR_ID_RE.sub(lambda m: m.group(1) + str(n * 1000 + int(m.group(2))).encode() + m.group(3),
+                                   content)
+        if n < len(docx_paths) - 1:
+            content = _end_section_in_last_paragraph(content, sect_pr)
+        else:
+            final_sect_pr = sect_pr
+        bodies.append(content)
+
+    document_xml = head + b"".join(bodies) + final_sect_pr + tail
+    with zipfile.ZipFile(docx_paths[0]) as src, zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            dst.writestr(info, document_xml if info.filename == "word/document.xml" else src.read(info))
+
+
+def split_pdf_pages(pdf_path, out_paths):
+    """
+    合并 PDF 按页拆回每名船员的文件（每份工资单正好一页）。
+    页数对不上说明有工资单溢出到了第二页，此时什么都不写并返回 False，由调用方逐份转换兜底
+    """
+    try:
+        reader = PdfReader(pdf_path)
+        if len(reader.pages) != len(out_paths):
+            return False
+    except (OSError, PyPdfError):
+        return False
+    for page, out_path in zip(reader.pages, out_paths):
+        writer = PdfWriter()
+        writer.add_page(page)
+        with open(out_path, "wb") as f:
+            writer.write(f)
+    return True
+
+
+def merge_pdfs(pdf_paths, out_path):
+    """按顺序把多份 PDF 合成一份，用于打印整条船的工资单"""
+    writer = PdfWriter()
+    for path in pdf_paths:
+        writer.append(path)
+    with open(out_path, "wb") as f:
+        writer.write(f)
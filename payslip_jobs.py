@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+import tempfile
+import threading
+from payslip_utils import generate_payslip_zip, generate_advanced_payslips_zip, PROGRESS_STAGES
+from payslip_metrics import PayslipMetrics
+
+logger = logging.getLogger(__name__)
+
+# 任务表和上传 / 结果文件的存放位置，服务器重启后仍然保留，可通过环境变量覆盖
+DEFAULT_JOB_DIR = os.environ.get("PAYSLIP_JOB_DIR", os.path.join(tempfile.gettempdir(), "tsm_payslip_jobs"))
+# 完成的任务保留几天，过期后连同 ZIP 一起清理
+JOB_RETENTION_DAYS = 7
+# 进度写库的最小间隔（秒），避免每个船员都提交一次事务
+PROGRESS_FLUSH_INTERVAL = 0.5
+# 后台线程每隔多久（秒）清理一次过期任务，空闲时也会按这个间隔醒来
+CLEANUP_INTERVAL = 3600
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+PAYSLIP_JOB_KINDS = {
+    'in_port': generate_payslip_zip,
+    'out_port': generate_advanced_payslips_zip,
+}
+
+
+class PayslipJobQueue:
+    """
+    本地的工资单生成队列：任务记录在 SQLite 任务表里，一个后台线程按提交顺序逐个执行。
+    页面只负责提交和读取进度，浏览器断开或刷新都不影响正在跑的任务，
+    完成的 ZIP 按任务编号保存在磁盘上，随时可以再下载
+    """
+
+    def __init__(self, job_dir=DEFAULT_JOB_DIR):
+        self.job_dir = job_dir
+        os.makedirs(job_dir, exist_ok=True)
+        self.db_path = os.path.join(job_dir, "jobs.db")
+        self._wakeup = threading.Event()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS payslip_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    owner TEXT,
+                    file_name TEXT,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    parsed INTEGER NOT NULL DEFAULT 0,
+                    filled INTEGER NOT NULL DEFAULT 0,
+                    converted INTEGER NOT NULL DEFAULT 0,
+                    zipped INTEGER NOT NULL DEFAULT 0,
+                    warnings TEXT NOT NULL DEFAULT '[]',
+                    error TEXT,
+                    metrics TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            """)
+            # 旧版本建的任务表没有 metrics 列
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(payslip_jobs)")}
+            if "metrics" not in columns:
+                conn.execute("ALTER TABLE payslip_jobs ADD COLUMN metrics TEXT")
+            # 上次服务器退出时没跑完的任务重新排队（上传的文件还在磁盘上）
+            conn.execute("UPDATE payslip_jobs SET status = ? WHERE status = ?", (QUEUED, RUNNING))
+        threading.Thread(target=self._worker, name="payslip-jobs", daemon=True).start()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _path(self, job_id, suffix):
+        return os.path.join(self.job_dir, f"{job_id}{suffix}")
+
+    def submit(self, kind, uploaded_file, owner=None, workers=1, engine='docx', pdf_mode='single',
+               pdf_backend='soffice', instrument=False):
+        """保存上传的 Excel 并登记一个新任务，立即返回任务编号；instrument 为真时记录各阶段耗时和内存"""
+        if kind not in PAYSLIP_JOB_KINDS:
+            raise ValueError(f"Unknown payslip job kind: {kind}")
+        job_id = uuid.uuid4().hex[:12]
+        uploaded_file.seek(0)
+        with open(self._path(job_id, ".xlsx"), "wb") as f:
+            shutil.copyfileobj(uploaded_file, f)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO payslip_jobs (id, kind, owner, file_name, options, status, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, owner, getattr(uploaded_file, "name", None),
+                 json.dumps({"workers": workers, "engine": engine, "pdf_mode": pdf_mode,
+                             "pdf_backend": pdf_backend, "instrument": instrument}), QUEUED, time.time()))
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id, owner=None):
+        """
+        读取一个任务的状态和各阶段进度，不存在时返回 None。
+        给出 owner 时只返回这个人提交的任务（工资单是敏感数据，拿到别人的任务编号也看不到）
+        """
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if owner is None:
+                row = conn.execute("SELECT * FROM payslip_jobs WHERE id = ?", (job_id,)).fetchone()
+            else:
+                row = conn.execute("SELECT * FROM payslip_jobs WHERE id = ? AND owner = ?", (job_id, owner)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["warnings"] = json.loads(job["warnings"])
+        job["metrics"] = json.loads(job["metrics"]) if job["metrics"] else None
+        return job
+
+    def list_jobs(self, owner=None, limit=10):
+        """最近提交的任务，owner 为空时列出所有人的"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            if owner is None:
+                rows = conn.execute("SELECT * FROM payslip_jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+            else:
+                rows = conn.execute("SELECT * FROM payslip_jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?",
+                                    (owner, limit))
+            return [dict(row) for row in rows.fetchall()]
+
+    def result_path(self, job_id, owner=None):
+        """已完成任务的 ZIP 路径，还没完成、已被清理或不属于 owner 时返回 None"""
+        path = self._path(job_id, ".zip")
+        job = self.get(job_id, owner)
+        if job is None or job["status"] != DONE or not os.path.exists(path):
+            return None
+        return path
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE payslip_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _next_job(self):
+        with self._connect() as conn:
+            row = conn.execute("SELECT id, kind, options FROM payslip_jobs WHERE status = ? "
+                               "ORDER BY created_at LIMIT 1", (QUEUED,)).fetchone()
+        return row
+
+    def _worker(self):
+        next_cleanup = 0.0
+        while True:
+            # 服务器一直不重启时也要定期删掉过期的任务和 ZIP
+            if time.monotonic() >= next_cleanup:
+                next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+                try:
+                    self._cleanup()
+                except (OSError, sqlite3.Error):
+                    logger.exception("Payslip job cleanup failed")
+            row = self._next_job()
+            if row is None:
+                self._wakeup.wait(CLEANUP_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._run(*row)
+
+    def _run(self, job_id, kind, options):
+        self._update(job_id, status=RUNNING)
+        warnings = []
+        counts = dict.fromkeys(PROGRESS_STAGES, 0)
+        last_flush = [0.0]
+
+        def on_progress(stage, done, total):
+            counts[stage] = done
+            now = time.monotonic()
+            # 阶段完成时一定落库，其余按时间间隔节流
+            if done == total or now - last_flush[0] >= PROGRESS_FLUSH_INTERVAL:
+                last_flush[0] = now
+                self._update(job_id, total=total, **counts)
+
+        options = json.loads(options)
+        metrics = PayslipMetrics() if options.pop("instrument", False) else None
+        try:
+            with open(self._path(job_id, ".xlsx"), "rb") as f:
+                spool = PAYSLIP_JOB_KINDS[kind](f, on_warning=warnings.append, on_progress=on_progress,
+                                                metrics=metrics, **options)
+            with spool, open(self._path(job_id, ".zip.part"), "wb") as out:
+                shutil.copyfileobj(spool, out)
+            os.replace(self._path(job_id, ".zip.part"), self._path(job_id, ".zip"))
+            self._update(job_id, status=DONE, warnings=json.dumps(warnings), finished_at=time.time(),
+                         metrics=json.dumps(metrics.as_dict()) if metrics else None, **counts)
+        except Exception as e:
+            logger.exception("Payslip job %s failed", job_id)
+            self._update(job_id, status=FAILED, error=str(e), warnings=json.dumps(warnings),
+                         finished_at=time.time(), **counts)
+        finally:
+            if os.path.exists(self._path(job_id, ".xlsx")):
+                os.remove(self._path(job_id, ".xlsx"))
+
+    def _cleanup(self):
+        """删除超过保留期的任务记录和它们的文件"""
+        cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+        with self._connect() as conn:
+            expired = [r[0] for r in conn.execute(
+                "SELECT id FROM payslip_jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff))]
+            conn.executemany("DELETE FROM payslip_jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        for job_id in expired:
+            for suffix in (".zip", ".xlsx"):
+                if os.path.exists(self._path(job_id, suffix)):
+                    os.remove(self._path(job_id, suffix))
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """整个服务进程共享的任务队列，第一次调用时建表并启动后台线程"""
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            _default_queue = PayslipJobQueue()
+        return _default_queue
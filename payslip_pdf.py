@@ -0,0 +1,352 @@
+import io
+import os
+from docx.oxml.ns import qn
+from docx.table import _Cell
+from docx.text.paragraph import Paragraph
+from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from reportlab import rl_config
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.utils import ImageReader
+
+# Word 的单倍行距大约是字号的 1.17 倍；基线大约在行高的 80% 处
+LINE_HEIGHT = 1.17
+BASELINE = 0.8
+# Arial Narrow 没有内置字体，用 Helvetica 横向压缩到 82% 代替
+NARROW_SCALE = 82
+# 中文等非 Latin-1 文字：配置了 TTF 字体文件就嵌入它（任何阅读器都能显示），
+# 否则用 reportlab 内置的 CID 宋体（不嵌入，依赖阅读器自带的亚洲字体包）
+CJK_FONT_PATH = os.environ.get("PAYSLIP_PDF_CJK_FONT")
+CJK_FONT = 'PayslipCJK' if CJK_FONT_PATH else 'STSong-Light'
+EMU_PER_PT = 12700
+_DEFAULT_INSETS = (91440, 45720, 91440, 45720)  # 文本框默认内边距 (左, 上, 右, 下)，EMU
+
+# 图片数据直接以二进制写入，不做 ASCII85 编码（纯 Python 实现，占了每页一大半的时间）
+rl_config.useA85 = 0
+
+_cjk_registered = False
+
+
+def _font_for(text, bold):
+    """标准 Helvetica 只能写 Latin-1，含中文等字符时换成 CJK_FONT"""
+    global _cjk_registered
+    try:
+        text.encode('latin-1')
+    except UnicodeEncodeError:
+        if not _cjk_registered:
+            pdfmetrics.registerFont(TTFont(CJK_FONT, CJK_FONT_PATH) if CJK_FONT_PATH else UnicodeCIDFont(CJK_FONT))
+            _cjk_registered = True
+        return CJK_FONT
+    return 'Helvetica-Bold' if bold else 'Helvetica'
+
+
+def _text_width(text, bold, size, narrow):
+    width = pdfmetrics.stringWidth(text, _font_for(text, bold), size)
+    return width * NARROW_SCALE / 100 if narrow else width
+
+
+def _twips(value):
+    return int(value) / 20.0
+
+
+def _xpath_int(el, path, default=None):
+    found = el.xpath(path)
+    return int(found[0]) if found else default
+
+
+class PdfPayslipLayout:
+    """
+    从排好版的模版里一次性算出所有静态内容（文字、表格线、logo、文本框）的固定坐标，
+    以及每个字段单元格和 Remarks 的书写位置；之后每名船员只需在这些坐标上画字，
+    不经过 Word / LibreOffice 排版
+    """
+
+    def __init__(self, doc, slots, remarks_idx, top_margin):
+        section = doc.sections[0]
+        self.page_w, self.page_h = section.page_width.pt, section.page_height.pt
+        self.left = section.left_margin.pt
+        self.content_w = self.page_w - self.left - section.right_margin.pt
+        self.top = top_margin.pt
+
+        normal = doc.styles['Normal']
+        self._default_size = normal.font.size.pt if normal.font.size else 11.0
+        self._default_after = normal.paragraph_format.space_after.pt if normal.paragraph_format.space_after else 0.0
+        self._default_spacing = normal.paragraph_format.line_spacing or 1.0
+        self._part = doc.part
+        self._body = doc._body
+
+        self._text_ops = []    # (x, y, 对齐, 文字, 字号, 粗体, 窄体)，x 为对齐锚点，y 为基线（自页面顶部）
+        self._line_ops = []    # (x1, y1, x2, y2, 线宽)
+        self._image_ops = []   # (ImageReader, x, y 顶部, 宽, 高)
+        self._slot_boxes = {}  # (表, 行, 列) -> (左, 右, 基线, 字号)
+        self._remarks_at = None
+
+        slot_cells = {(t_idx, r_idx, c_idx): spacing for _, t_idx, r_idx, c_idx, spacing in slots}
+        y = self.top
+        t_idx = p_idx = 0
+        for el in doc.element.body.iterchildren():
+            if el.tag == qn('w:p'):
+                paragraph = Paragraph(el, doc._body)
+                self._anchored_drawings(el, y)
+                height, baseline = self._paragraph(paragraph, self.left, self.content_w, y)
+                if p_idx == remarks_idx:
+                    label_w = sum(_text_width(r.text, self._bold(r), self._size(paragraph, r), self._narrow(r))
+                                  for r in paragraph.runs)
+                    self._remarks_at = (self.left + label_w, baseline)
+                y += height
+                p_idx += 1
+            elif el.tag == qn('w:tbl'):
+                y += self._table(el, doc, t_idx, slot_cells, y)
+                t_idx += 1
+
+        self._slots = [(field, self._slot_boxes.get((t_idx, r_idx, c_idx)))
+                       for field, t_idx, r_idx, c_idx, _ in slots]
+
+    # --- 段落 ---
+
+    def _size(self, paragraph, run=None):
+        if run is not None and run.font.size is not None:
+            return run.font.size.pt
+        mark = _xpath_int(paragraph._p, './w:pPr/w:rPr/w:sz/@w:val')
+        if mark is not None:
+            return mark / 2.0
+        style_size = paragraph.style.font.size if paragraph.style is not None else None
+        return style_size.pt if style_size else self._default_size
+
+    @staticmethod
+    def _bold(run):
+        return bool(run.font.bold)
+
+    @staticmethod
+    def _narrow(run):
+        return 'Narrow' in (run.font.name or '')
+
+    def _line_height(self, paragraph, size):
+        spacing = paragraph.paragraph_format.line_spacing
+        natural = size * LINE_HEIGHT
+        if spacing is None:
+            return natural * self._default_spacing
+        if isinstance(spacing, float):
+            return natural * spacing
+        if paragraph.paragraph_format.line_spacing_rule == WD_LINE_SPACING.AT_LEAST:
+            return max(spacing.pt, natural)
+        return spacing.pt
+
+    def _paragraph(self, paragraph, x, width, top, override=None):
+        """
+        单行段落：记录文字位置并返回 (占用高度, 基线)。
+        override=(字号, 行距) 用于字段单元格，单元格的原有内容会被填写的值替换掉
+        """
+        fmt = paragraph.paragraph_format
+        before = fmt.space_before.pt if fmt.space_before is not None else 0.0
+        after = fmt.space_after.pt if fmt.space_after is not None else self._default_after
+
+        if override is not None:
+            size, spacing = override
+            line_h = size * LINE_HEIGHT * spacing
+            return before + line_h + after, top + before + line_h * BASELINE
+
+        runs = [(r.text, self._size(paragraph, r), self._bold(r), self._narrow(r))
+                for r in paragraph.runs if r.text.strip()]
+        size = max([s for _, s, _, _ in runs] + [self._size(paragraph)] +
+                   [self._size(paragraph, r) for r in paragraph.runs])
+        line_h = self._line_height(paragraph, size)
+        baseline = top + before + line_h * BASELINE
+
+        if runs:
+            total_w = sum(_text_width(t, b, s, n) for t, s, b, n in runs)
+            if paragraph.alignment == WD_ALIGN_PARAGRAPH.CENTER:
+                cursor = x + (width - total_w) / 2
+            elif paragraph.alignment == WD_ALIGN_PARAGRAPH.RIGHT:
+                cursor = x + width - total_w
+            else:
+                cursor = x
+            for text, s, b, n in runs:
+                self._text_ops.append((cursor, baseline, 'left', text, s, b, n))
+                cursor += _text_width(text, b, s, n)
+        return before + line_h + after, baseline
+
+    def _anchored_drawings(self, p_el, para_top):
+        """浮动的图片和文本框：按锚点相对于栏 / 段落 / 页面的偏移放到固定位置"""
+        for anchor in p_el.xpath('.//wp:anchor'):
+            off_x = _xpath_int(anchor, './wp:positionH/wp:posOffset/text()', 0) / EMU_PER_PT
+            off_y = _xpath_int(anchor, './wp:positionV/wp:posOffset/text()', 0) / EMU_PER_PT
+            rel_x = anchor.xpath('./wp:positionH/@relativeFrom')
+            rel_y = anchor.xpath('./wp:positionV/@relativeFrom')
+            x = off_x if rel_x and rel_x[0] == 'page' else self.left + off_x
+            y = off_y if rel_y and rel_y[0] == 'page' else (
+                self.top + off_y if rel_y and rel_y[0] in ('margin', 'topMargin') else para_top + off_y)
+            w = _xpath_int(anchor, './wp:extent/@cx', 0) / EMU_PER_PT
+            h = _xpath_int(anchor, './wp:extent/@cy', 0) / EMU_PER_PT
+
+            blips = anchor.xpath('.//a:blip/@r:embed')
+            if blips:
+                image = ImageReader(io.BytesIO(self._part.related_parts[blips[0]].blob))
+                self._image_ops.append((image, x, y, w, h))
+                continue
+
+            for body in anchor.xpath('.//w:txbxContent'):
+                insets = [_xpath_int(anchor, f'.//*[local-name()="bodyPr"]/@{name}', default) / EMU_PER_PT
+                          for name, default in zip(('lIns', 'tIns', 'rIns', 'bIns'), _DEFAULT_INSETS)]
+                inner_y = y + insets[1]
+                for p in body.iterchildren(qn('w:p')):
+                    height, _ = self._paragraph(Paragraph(p, self._body), x + insets[0], w - insets[0] - insets[2],
+                                                inner_y)
+                    inner_y += height
+
+    # --- 表格 ---
+
+    @staticmethod
+    def _border_width(border):
+        if border is None:
+            return None
+        val = border.get(qn('w:val'))
+        if val in (None, 'nil', 'none'):
+            return 0.0
+        return max(int(border.get(qn('w:sz'), 4)) / 8.0, 0.25)
+
+    def _table_borders(self, tbl, doc):
+        """表格级边框：表格自身的 tblBorders 优先，否则取表格样式里的"""
+        borders = {}
+        sources = tbl.xpath('./w:tblPr/w:tblBorders')
+        style_id = tbl.xpath('./w:tblPr/w:tblStyle/@w:val')
+        if style_id:
+            style = doc.styles.element.xpath(f'./w:style[@w:styleId="{style_id[0]}"]/w:tblPr/w:tblBorders')
+            sources = style + sources
+        for source in sources:
+            for edge in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV'):
+                found = source.find(qn(f'w:{edge}'))
+                if found is not None:
+                    borders[edge] = self._border_width(found)
+        return borders
+
+    def _table(self, tbl, doc, t_idx, slot_cells, top):
+        grid = [_twips(w) for w in tbl.xpath('./w:tblGrid/w:gridCol/@w:w')]
+        table_w = sum(grid)
+        if tbl.xpath('./w:tblPr/w:jc/@w:val') == ['center']:
+            x0 = self.left + (self.content_w - table_w) / 2
+        else:
+            x0 = self.left + _twips(_xpath_int(tbl, './w:tblPr/w:tblInd/@w:w', 0))
+        col_x = [x0]
+        for w in grid:
+            col_x.append(col_x[-1] + w)
+        mar_l = _twips(_xpath_int(tbl, './w:tblPr/w:tblCellMar/w:left/@w:w', 108))
+        mar_r = _twips(_xpath_int(tbl, './w:tblPr/w:tblCellMar/w:right/@w:w', 108))
+        table_borders = self._table_borders(tbl, doc)
+
+        rows = tbl.xpath('./w:tr')
+        y = top
+        for r_idx, tr in enumerate(rows):
+            cells = []
+            col = _xpath_int(tr, './w:trPr/w:gridBefore/@w:val', 0)
+            for tc in tr.xpath('./w:tc'):
+                span = _xpath_int(tc, './w:tcPr/w:gridSpan/@w:val', 1)
+                cells.append((tc, col, col + span))
+                col += span
+
+            # 先量出每个单元格内容的高度，行高取最高的那个（不低于模版规定的最小行高）
+            measured = []
+            for tc, c_start, c_end in cells:
+                spacing = next((slot_cells[(t_idx, r_idx, c)] for c in range(c_start, c_end)
+                                if (t_idx, r_idx, c) in slot_cells), None)
+                paragraphs = _Cell(tc, self._body).paragraphs
+                if spacing is not None:
+                    paragraphs = paragraphs[:1]
+                measured.append((paragraphs, spacing))
+            heights = []
+            for paragraphs, spacing in measured:
+                override = (9.0, spacing) if spacing is not None else None
+                heights.append(sum(self._measure(p, override) for p in paragraphs))
+            row_h = max(heights + [0.0])
+            min_h = _xpath_int(tr, './w:trPr/w:trHeight/@w:val')
+            rule = tr.xpath('./w:trPr/w:trHeight/@w:hRule')
+            if min_h is not None:
+                row_h = _twips(min_h) if rule == ['exact'] else max(row_h, _twips(min_h))
+
+            for (tc, c_start, c_end), (paragraphs, spacing), content_h in zip(cells, measured, heights):
+                x_left, x_right = col_x[min(c_start, len(grid))], col_x[min(c_end, len(grid))]
+                inner_l, inner_w = x_left + mar_l, x_right - x_left - mar_l - mar_r
+                v_align = tc.xpath('./w:tcPr/w:vAlign/@w:val')
+                cy = y + (row_h - content_h) / 2 if v_align == ['center'] else (
+                    y + row_h - content_h if v_align == ['bottom'] else y)
+                if spacing is not None:
+                    _, baseline = self._paragraph(paragraphs[0], inner_l, inner_w, cy, override=(9.0, spacing))
+                    for c in range(c_start, c_end):
+                        self._slot_boxes[(t_idx, r_idx, c)] = (inner_l, inner_l + inner_w, baseline, 9.0)
+                else:
+                    for p in paragraphs:
+                        height, _ = self._paragraph(p, inner_l, inner_w, cy)
+                        cy += height
+                self._cell_borders(tc, table_borders, x_left, x_right, y, y + row_h,
+                                   first_row=r_idx == 0, last_row=r_idx == len(rows) - 1,
+                                   first_col=c_start == 0, last_col=c_end >= len(grid))
+            y += row_h
+        return y - top
+
+    def _measure(self, paragraph, override):
+        ops = len(self._text_ops)
+        height, _ = self._paragraph(paragraph, 0, 0, 0, override=override)
+        del self._text_ops[ops:]
+        return height
+
+    def _cell_borders(self, tc, table_borders, x1, x2, y1, y2, first_row, last_row, first_col, last_col):
+        own = tc.find(qn('w:tcPr'))
+        own = own.find(qn('w:tcBorders')) if own is not None else None
+        edges = {
+            'top': ((x1, y1, x2, y1), 'top' if first_row else 'insideH'),
+            'bottom': ((x1, y2, x2, y2), 'bottom' if last_row else 'insideH'),
+            'left': ((x1, y1, x1, y2), 'left' if first_col else 'insideV'),
+            'right': ((x2, y1, x2, y2), 'right' if last_col else 'insideV'),
+        }
+        for edge, (coords, table_edge) in edges.items():
+            width = self._border_width(own.find(qn(f'w:{edge}'))) if own is not None else None
+            if width is None:
+                width = table_borders.get(table_edge) or 0.0
+            if width:
+                self._line_ops.append((*coords, width))
+
+    # --- 渲染 ---
+
+    def _draw_text(self, c, x, y, align, text, size, bold, narrow):
+        width = _text_width(text, bold, size, narrow)
+        if align == 'center':
+            x -= width / 2
+        text_obj = c.beginText(x, self.page_h - y)
+        text_obj.setFont(_font_for(text, bold), size)
+        if narrow:
+            text_obj.setHorizScale(NARROW_SCALE)
+        text_obj.textOut(text)
+        c.drawText(text_obj)
+
+    def render(self, values, remarks):
+        """values 为 {字段: 文字}；remarks 为空字符串表示不写备注。返回单页 PDF 的字节"""
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=(self.page_w, self.page_h), pageCompression=1)
+        for image, x, y, w, h in self._image_ops:
+            c.drawImage(image, x, self.page_h - y - h, w, h, mask='auto')
+        for x1, y1, x2, y2, width in self._line_ops:
+            c.setLineWidth(width)
+            c.line(x1, self.page_h - y1, x2, self.page_h - y2)
+        for op in self._text_ops:
+            self._draw_text(c, *op)
+
+        for field, box in self._slots:
+            text = values.get(field, "")
+            if box is None or not text:
+                continue
+            left, right, baseline, size = box
+            # 和 Word 版一样：9 号、加粗、Arial Narrow、居中；多行值只画第一行
+            text = text.splitlines()[0].replace("\t", " ") if text.strip() else ""
+            self._draw_text(c, (left + right) / 2, baseline, 'center', text, size, True, True)
+
+        if remarks and self._remarks_at is not None:
+            x, baseline = self._remarks_at
+            line_h = 9.0 * LINE_HEIGHT
+            for line in (" " + remarks).splitlines():
+                self._draw_text(c, x, baseline, 'left', line.replace("\t", " "), 9.0, False, True)
+                baseline += line_h
+        c.showPage()
+        c.save()
+        return buffer.getvalue()
@@ -0,0 +1,828 @@
+import math
+import time
+import copy
+import re
+import io
+import glob
+import os
+import zipfile
+import tempfile
+import logging
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pandas as pd
+from docx import Document
+from docx.shared import Pt, Cm
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+from pdf_converter import get_converter
+from pypdf.errors import PyPdfError
+from payslip_combine import combine_docx, split_pdf_pages, merge_pdfs
+from payslip_metrics import NULL_METRICS
+from payslip_cache import get_payslip_cache, payslip_cache_key, file_digest, DOCX, PDF
+from payslip_pdf import PdfPayslipLayout
+from payslip_xml import XmlPayslipTemplate, CELL_TOKEN, REMARKS_TOKEN, with_top_margin
+from sumsal_parser import normalize_key, read_sum_sal_sheet, parse_sum_sal, VESSEL_ROW_ABOVE, SN_ANY_COLUMN
+
+logger = logging.getLogger(__name__)
+
+# 内港 / 外港 各自专属的 Word 模版
+IN_PORT_TEMPLATE = 'payslip模版.docx'
+OUT_PORT_TEMPLATE = 'Out_port paylist 模版.docx'
+
+# 默认并行进程数：留一个核给 Streamlit 主进程
+DEFAULT_PAYSLIP_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+
+# ZIP 小于这个大小时留在内存里，超过后自动写到临时文件
+ZIP_SPOOL_THRESHOLD = 16 * 1024 * 1024
+
+# PDF 转换方式：逐份转换 / 每条船合并成一份转换后再按页拆开 / 同上并在 ZIP 里附上整船打印版
+PDF_MODES = {
+    "One file per payslip": 'single',
+    "Combined per vessel (fast)": 'vessel',
+    "Combined per vessel + print-ready vessel PDF": 'vessel_print',
+}
+
+# PDF 后端：LibreOffice 转换 Word 过渡文件 / 直接按模版坐标画 PDF（不需要安装 Office）
+PDF_BACKENDS = {
+    "LibreOffice": 'soffice',
+    "Built-in (no LibreOffice)": 'native',
+}
+
+# 后台任务汇报进度用的阶段名：解析 / 填写 Word / 转换 PDF / 打包
+PROGRESS_STAGES = ('parsed', 'filled', 'converted', 'zipped')
+
+# 渲染器版本：改动模版排版或填写逻辑后必须 +1，让旧的缓存工资单全部失效
+PAYSLIP_RENDERER_VERSION = 1
+
+# 渲染引擎：python-docx 对象模型 / 直接拼接 document.xml（输出一致，后者快得多）
+PAYSLIP_ENGINES = {
+    "python-docx": 'docx',
+    "Direct XML (fast)": 'xml',
+}
+
+
+# ---------------------------------------------------------
+# payslips Generator Logic (工资单生成逻辑)
+# ---------------------------------------------------------
+def clean_filename(name):
+    # 先转字符串，再去掉两端空格，再去掉 Windows/Linux 不允许的特殊字符
+    name = str(name).strip()
+    return re.sub(r'[\\/*?:"<>|]', "", name).strip()
+
+
+def get_rank_priority(rank_str):
+    """根据规定的职位顺序，将 Rank 转化为 1 到 99 的排序序号（仅供系统内部排序使用）"""
+    if not rank_str or pd.isna(rank_str): return 99
+    r = str(rank_str).upper().strip()
+
+    if 'MASTER' in r: return 1
+    if 'CHIEF OFFICER' in r: return 2
+    if '2ND OFFICER' in r or 'SECOND OFFICER' in r: return 3
+    if 'CHIEF ENGINEER' in r: return 4
+    if '2ND ENGINEER' in r or 'SECOND ENGINEER' in r: return 5
+    if '3RD ENGINEER' in r or 'THIRD ENGINEER' in r: return 6
+    if 'ASST BOSUN' in r or 'ASSISTANT BOSUN' in r: return 8
+    if 'BOSUN' in r and 'ASST' not in r: return 7
+    if 'COOK' in r: return 9
+    if r == 'AB' or ' A.B' in f" {r}" or 'ABLE SEAMAN' in r: return 10
+    if 'OILER' in r: return 11
+
+    return 99
+
+
+def format_currency(val):
+    if pd.isna(val) or val == "": return ""
+    try:
+        s_val = str(val).replace(',', '').strip()
+        if not s_val: return ""
+        return "{:,.2f}".format(float(s_val))
+    except (ValueError, TypeError):
+        return str(val)
+
+
+def format_date_custom(val):
+    if pd.isna(val) or val == "": return ""
+    try:
+        if hasattr(val, 'strftime'): return val.strftime('%d/%m/%Y')
+        s_val = str(val).split()[0].strip()
+        if '-' in s_val:
+            parts = s_val.split('-')
+            if len(parts) == 3 and len(parts[0]) == 4:
+                return f"{parts[2]}/{parts[1]}/{parts[0]}"
+        return s_val
+    except:
+        return str(val)
+
+
+def cell_text(text):
+    """单元格里实际显示的文字：None 变空串，去掉 Excel 浮点数末尾的 .0"""
+    if text is None: text = ""
+    text = str(text)
+    if text.endswith(".0"): text = text[:-2]
+    return text
+
+
+def remarks_text(remarks):
+    """需要追加到 Remarks: 后面的备注，无效备注返回空字符串"""
+    rem = str(remarks).strip()
+    if rem and rem.lower() != 'nan' and rem != '0':
+        return rem
+    return ""
+
+
+def set_cell_text(cell, text, custom_spacing=1.0):
+    text = cell_text(text)
+
+    cell.text = ""
+    p = cell.paragraphs[0]
+    run = p.add_run(text)
+
+    run.font.size = Pt(9)
+    run.font.name = 'Arial Narrow'
+    run.font.bold = True
+
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    p.paragraph_format.space_before = Pt(0)
+    p.paragraph_format.space_after = Pt(0)
+
+    # 接收传进来的行距参数（默认为 1.0）
+    p.paragraph_format.line_spacing = custom_spacing
+
+
+def shrink_empty_lines(doc):
+    for p in doc.paragraphs:
+        if not p.text.strip():
+            p_fmt = p.paragraph_format
+            p_fmt.space_before = Pt(0)
+            p_fmt.space_after = Pt(0)
+            p_fmt.line_spacing = 1.0
+            if p.runs:
+                for r in p.runs: r.font.size = Pt(1)
+            else:
+                p.add_run(" ").font.size = Pt(1)
+
+
+def insert_spacer_before_payslip(doc):
+    for p in doc.paragraphs:
+        if "PAY SLIP" in p.text:
+            spacer = p.insert_paragraph_before(" ")
+            spacer.paragraph_format.space_after = Pt(0)
+            spacer.paragraph_format.line_spacing = 1.0
+            # 💡 将字体大小从 Pt(12) 增大到 Pt(36)，利用这个隐藏的空行把标题往下挤
+            if spacer.runs:
+                spacer.runs[0].font.size = Pt(18)
+            else:
+                spacer.add_run(" ").font.size = Pt(18)
+            break
+
+
+def _prepare_template(path):
+    """打开模版并做完所有与员工无关的排版：插入标题空行、设置边距、压缩空行"""
+    doc = Document(path)
+    insert_spacer_before_payslip(doc)
+
+    section = doc.sections[0]
+    section.top_margin, section.bottom_margin = Cm(2.2), Cm(0.2)
+    section.left_margin, section.right_margin = Cm(1.0), Cm(1.0)
+
+    # 💡 空行只出现在正文段落里，填写表格和 Remarks 不会改变哪些段落是空的，所以可以提前压缩
+    shrink_empty_lines(doc)
+    return doc
+
+
+def _compile_in_port_slots(doc):
+    """按内港模版的标签定位每个字段要写入的单元格，返回 [(字段, 表, 行, 列, 行距)]"""
+    tables = doc.tables
+    slots = []
+
+    def find_simple(t_idx, label, field):
+        for r_idx, row in enumerate(tables[t_idx].rows):
+            for c, cell in enumerate(row.cells):
+                if label in cell.text and c + 1 < len(row.cells):
+                    spacing = 1.5 if label in ["Rank", "FROM", "TO", "Day on Board"] else 1.0
+                    slots.append((field, t_idx, r_idx, c + 1, spacing))
+                    return
+
+    find_simple(0, "Employee's Name", 'Name')
+    find_simple(0, "Vessel Name", 'Vessel Name')
+    find_simple(1, "Rank", 'Rank')
+    find_simple(1, "FROM", 'From')
+    find_simple(1, "TO", 'To')
+    find_simple(1, "Day on Board", 'Day on Board')
+
+    t2 = tables[2]
+    header_row_idx, col_earn, col_deduct = -1, -1, -1
+    for r_idx in range(min(5, len(t2.rows))):
+        amount_indices = [c_idx for c_idx, cell in enumerate(t2.rows[r_idx].cells) if 'Amount' in cell.text]
+        if len(amount_indices) >= 2:
+            header_row_idx, col_earn, col_deduct = r_idx, amount_indices[0], amount_indices[-1]
+            break
+
+    if col_earn != -1 and col_deduct != -1:
+        def find_left(label, field):
+            for r in range(header_row_idx + 1, len(t2.rows)):
+                if normalize_key(label) in normalize_key(
+                        "".join([c.text for c in t2.rows[r].cells[:col_earn]])):
+                    slots.append((field, 2, r, col_earn, 1.0))
+                    break
+
+        def find_right(label, field):
+            for r in range(header_row_idx + 1, len(t2.rows)):
+                if normalize_key(label) in normalize_key("".join([c.text for c in t2.rows[r].cells])):
+                    slots.append((field, 2, r, col_deduct, 1.0))
+                    break
+
+        find_left('Basic Salary', 'Basic Salary')
+        find_left('Fixed OT', 'Fixed OT')
+        find_left('Leave Pay', 'Leave Pay')
+        find_left('Allowance', 'Allowance')
+        find_left('Total Earnings', 'Net Salary')
+        find_left('Reimbursement', 'Reimbursement')
+        find_left('Net Amount', 'Subtotal')
+        find_right('Total Deductions', 'Deduction')
+        find_right('Release', 'Release')
+        find_right('Retaining', 'Retaining')
+        find_right('Remittance', 'Remittance')
+    return slots
+
+
+def _compile_out_port_slots(doc):
+    """按外港模版的标签定位每个字段要写入的单元格，返回 [(字段, 表, 行, 列, 行距)]"""
+    slots = []
+
+    def find_simple(t_idx, label, field):
+        for r_idx, row in enumerate(doc.tables[t_idx].rows):
+            for c, cell in enumerate(row.cells):
+                txt = cell.text.strip()
+                if label in ["TO", "FROM", "Rank"] and txt not in [label, f"{label}:",
+                                                                   f"{label} :"]: continue
+                if label in cell.text and c + 1 < len(row.cells):
+                    spacing = 1.5 if label in ["Rank", "FROM", "TO", "Day on Board"] else 1.0
+                    slots.append((field, t_idx, r_idx, c + 1, spacing))
+                    return
+
+    for t_idx in range(min(2, len(doc.tables))):
+        find_simple(t_idx, "Employee's Name", 'Name')
+        find_simple(t_idx, "Vessel Name", 'Vessel Name')
+        find_simple(t_idx, "Rank", 'Rank')
+        find_simple(t_idx, "FROM", 'From')
+        find_simple(t_idx, "TO", 'To')
+        find_simple(t_idx, "Day on Board", 'Day on Board')
+
+    if len(doc.tables) >= 3:
+        t_fin = doc.tables[2]
+        col_earn, col_deduct = 4, 9
+        for r in range(min(5, len(t_fin.rows))):
+            amts = [idx for idx, c in enumerate(t_fin.rows[r].cells) if 'Amount' in c.text]
+            if len(amts) >= 2:
+                col_earn, col_deduct = amts[0], amts[-1]
+                break
+
+        earn_labels = [("Basic Salary",), ("Fixed OT",), ("Leave Pay",), ("Bonus", "Incentive"),
+                       ("Total Earnings",), ("Reimbursement",), ("Net Amount",)]
+        earn_fields = ['Basic Salary', 'Fixed OT', 'Leave Pay', 'Bonus/Incentive',
+                       'Total Earnings', 'Reimbursement', 'Net Amount']
+        deduct_labels = [("Total Deductions", 'Total Deductions'), ("Release", 'Release'),
+                         ("Retaining", 'Retaining'), ("Remittance - Bank", 'Remittance')]
+
+        for r_idx, row in enumerate(t_fin.rows):
+            cells = row.cells
+            label = cells[0].text.strip()
+            if col_earn < len(cells):
+                for keys, field in zip(earn_labels, earn_fields):
+                    if any(k in label for k in keys):
+                        slots.append((field, 2, r_idx, col_earn, 1.0))
+                        break
+
+            if col_deduct < len(cells):
+                for cell in cells:
+                    c_txt = cell.text.strip()
+                    for key, field in deduct_labels:
+                        if key in c_txt:
+                            slot = (field, 2, r_idx, col_deduct, 1.0)
+                            if slot not in slots:
+                                slots.append(slot)
+                            break
+    return slots
+
+
+class PayslipTemplate:
+    """解析一次的模版：排好版的 Document + 每个字段对应的单元格坐标"""
+
+    def __init__(self, path, compile_slots):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.digest = file_digest(path)
+        prepared = _prepare_template(path)
+        self.slots = compile_slots(prepared)
+        self.remarks_idx = next((i for i, p in enumerate(prepared.paragraphs) if "Remarks:" in p.text), None)
+
+        # 💡 python-docx 会缓存访问过的正文对象，深拷贝这种 Document 后缓存仍指向旧正文，
+        # 所以存一份从未访问过正文的干净副本专门用来克隆
+        buffer = io.BytesIO()
+        prepared.save(buffer)
+        self._prepared = buffer.getvalue()
+        self.doc = Document(io.BytesIO(self._prepared))
+
+        self._xml_template = None
+        self._pdf_layout = None
+
+    def fill(self, emp):
+        """克隆模版并把员工数据直接写入预先算好的单元格，返回新的 Document"""
+        return self._fill([emp[field] for field, *_ in self.slots], remarks_text(emp['Remarks']))
+
+    def _fill(self, values, rem):
+        doc = copy.deepcopy(self.doc)
+        tables = doc.tables
+        for (field, t_idx, r_idx, c_idx, spacing), value in zip(self.slots, values):
+            set_cell_text(tables[t_idx].rows[r_idx].cells[c_idx], value, custom_spacing=spacing)
+
+        if self.remarks_idx is not None and rem:
+            p = doc.paragraphs[self.remarks_idx]
+            run = p.add_run(" " + rem)
+            run.font.size, run.font.name, run.font.bold = Pt(9), 'Arial Narrow', False
+            p.paragraph_format.line_spacing = 1.0
+        return doc
+
+    @property
+    def xml_template(self):
+        """第一次使用 XML 引擎时，用占位符填一遍模版，编译成字节模版"""
+        if self._xml_template is None:
+            tokens = [CELL_TOKEN.format(i) for i in range(len(self.slots))]
+            blobs = []
+            for rem in (REMARKS_TOKEN, ""):
+                buffer = io.BytesIO()
+                self._fill(tokens, rem).save(buffer)
+                blobs.append(buffer.getvalue())
+            self._xml_template = XmlPayslipTemplate(*blobs)
+        return self._xml_template
+
+    @property
+    def pdf_layout(self):
+        """第一次使用内置 PDF 后端时，按 PDF 版的上边距算出整页的固定坐标（用单独的副本，不碰 self.doc）"""
+        if self._pdf_layout is None:
+            self._pdf_layout = PdfPayslipLayout(Document(io.BytesIO(self._prepared)), self.slots, self.remarks_idx,
+                                                Cm(1.5))
+        return self._pdf_layout
+
+    def render_pdf(self, emp):
+        """内置 PDF 后端：直接画出这名船员的单页 PDF 字节"""
+        values = {field: cell_text(emp[field]) for field, *_ in self.slots}
+        return self.pdf_layout.render(values, remarks_text(emp['Remarks']))
+
+    def render_xml(self, emp, top_margin, compression=zipfile.ZIP_DEFLATED):
+        """XML 引擎：直接拼出 docx 字节，top_margin 为 Length"""
+        values = [cell_text(emp[field]) for field, *_ in self.slots]
+        return self.xml_template.render(values, remarks_text(emp['Remarks']), top_margin.twips, compression)
+
+
+PAYSLIP_TEMPLATES = {
+    # ⚠️ 内港使用内港专属的模版，外港确保服务器里上传了新模版文件
+    'in_port': (IN_PORT_TEMPLATE, _compile_in_port_slots),
+    'out_port': (OUT_PORT_TEMPLATE, _compile_out_port_slots),
+}
+
+# 每个进程各自缓存一份，模版文件的修改时间变了就重新解析
+_template_cache = {}
+
+
+def load_template(kind):
+    path, compile_slots = PAYSLIP_TEMPLATES[kind]
+    cached = _template_cache.get(kind)
+    if cached is None or cached.mtime != os.path.getmtime(path):
+        cached = PayslipTemplate(path, compile_slots)
+        _template_cache[kind] = cached
+    return cached
+
+
+def payslip_file_base(emp):
+    safe_vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
+    safe_emp = clean_filename(emp['Name'])
+    # 给临时文件加个前缀，防止同名同姓的员工发生文件覆盖冲突
+    return f"{safe_vessel}===SEP==={safe_emp}"
+
+
+# 过渡 docx 只给 LibreOffice 读一次就删掉，不压缩，省掉 deflate 的时间
+PDF_DOCX_COMPRESSION = zipfile.ZIP_STORED
+
+
+def render_payslip(kind, emp, temp_dir, engine='docx', pdf_backend='soffice'):
+    """
+    填好一名船员的工资单，并在 temp_dir 中保存 Word 版和 PDF 过渡版两个 docx；
+    pdf_backend 为 'native' 时不需要过渡 docx，直接画出最终的 _for_pdf.pdf。返回这名船员的渲染耗时（秒）
+    """
+    start = time.perf_counter()
+    _write_payslip_files(kind, emp, temp_dir, engine, pdf_backend)
+    return time.perf_counter() - start
+
+
+def _write_payslip_files(kind, emp, temp_dir, engine, pdf_backend):
+    temp_file_base = payslip_file_base(emp)
+    template = load_template(kind)
+    if pdf_backend == 'native':
+        with open(os.path.join(temp_dir, f"{temp_file_base}_for_pdf.pdf"), 'wb') as f:
+            f.write(template.render_pdf(emp))
+
+    if engine == 'xml':
+        with open(os.path.join(temp_dir, f"{temp_file_base}.docx"), 'wb') as f:
+            f.write(template.render_xml(emp, Cm(2.2)))
+        if pdf_backend != 'native':
+            with open(os.path.join(temp_dir, f"{temp_file_base}_for_pdf.docx"), 'wb') as f:
+                f.write(template.render_xml(emp, Cm(1.5), PDF_DOCX_COMPRESSION))
+        return
+
+    # 1. 保存正常排版的 Word（python-docx 只序列化这一次）
+    buffer = io.BytesIO()
+    template.fill(emp).save(buffer)
+    with open(os.path.join(temp_dir, f"{temp_file_base}.docx"), 'wb') as f:
+        f.write(buffer.getvalue())
+    if pdf_backend == 'native':
+        return
+
+    # 2. 在保存好的字节上直接改上边距，作为专供 PDF 渲染的过渡 Word（控制 PDF 的整体高度）
+    with open(os.path.join(temp_dir, f"{temp_file_base}_for_pdf.docx"), 'wb') as f:
+        f.write(with_top_margin(buffer.getvalue(), Cm(1.5).twips, PDF_DOCX_COMPRESSION))
+
+
+def _pool_context():
+    # 💡 不能直接 fork：Streamlit 服务进程（以及后台任务线程）是多线程的，fork 出来的子进程可能卡死在
+    # 继承来的锁上（logging、sqlite 等）。forkserver 的服务进程是单线程新起的，先导入好本模块，
+    # 之后每个工作进程都从它 fork，不用各自重新导入；没有 forkserver 的平台（Windows）用 spawn。
+    # streamlit run 时 __main__ 是 Streamlit 的命令行入口，子进程不会把页面脚本再跑一遍
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def iter_render_payslips(kind, employees, temp_dir, workers=1, engine='docx', pdf_backend='soffice'):
+    """
+    阶段一：生成所有 Word 过渡文件，每完成一名船员就按原顺序 yield (船员, 渲染耗时秒数)，方便边生成边打包。
+    workers > 1 时分发到进程池并行填写，进程池起不来（或中途崩溃）时自动退回单进程串行，输出文件完全一致
+    """
+    # 先在主进程解析好模版（串行和兜底时用）；工作进程各自解析一次，之后留在进程内的缓存里
+    template = load_template(kind)
+    if engine == 'xml':
+        template.xml_template
+    if pdf_backend == 'native':
+        template.pdf_layout
+
+    done = 0
+    if workers and workers > 1 and len(employees) > 1:
+        workers = min(workers, len(employees))
+        # 每个进程分到几批任务，减少进程间来回传参的开销
+        chunksize = max(1, len(employees) // (workers * 4))
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                for seconds in pool.map(render_payslip, repeat(kind), employees, repeat(temp_dir), repeat(engine),
+                                        repeat(pdf_backend), chunksize=chunksize):
+                    yield employees[done], seconds
+                    done += 1
+            return
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning("Payslip process pool failed (%s), falling back to serial rendering", e)
+
+    # 串行兜底：进程池中途崩溃时只补做剩下的人
+    for emp in employees[done:]:
+        yield emp, render_payslip(kind, emp, temp_dir, engine=engine, pdf_backend=pdf_backend)
+
+
+def payslip_zip_names(emp):
+    """返回 (船名文件夹, 员工名, ZIP 内的文件名)"""
+    safe_vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
+    safe_emp = clean_filename(emp['Name'])
+
+    # 💡 核心修改：获取职位对应的数字序号，并加到文件名前面
+    rank_prio = get_rank_priority(emp['Rank'])
+    # 格式例如：01_张三 (数字在前，保证 Windows/Mac 乖乖按数字大小排序)
+    final_filename = f"{rank_prio:02d}_{safe_emp}"
+    return safe_vessel, safe_emp, final_filename
+
+
+def _convert_by_vessel(employees, temp_dir, on_converted):
+    """
+    每条船的 _for_pdf 文档拼成一份多节文档，只启动一次 LibreOffice 转换，再把 PDF 按页拆回每名船员的文件。
+    拼接失败或拆分时页数对不上（有工资单溢出到第二页）的船退回逐份转换
+    """
+    groups = {}
+    for emp in employees:
+        vessel = clean_filename(emp['Vessel Name']) or "Uncategorized"
+        groups.setdefault(vessel, []).append(os.path.join(temp_dir, f"{payslip_file_base(emp)}_for_pdf.docx"))
+
+    combined, leftovers = {}, []
+    for vessel, docx_paths in groups.items():
+        # 同船同名的船员共用同一个临时文件，只转换一次
+        docx_paths = [p for p in dict.fromkeys(docx_paths) if os.path.exists(p)]
+        if len(docx_paths) < 2:
+            leftovers += docx_paths
+            continue
+        combined_path = os.path.join(temp_dir, f"{vessel}===VESSEL.docx")
+        try:
+            combine_docx(docx_paths, combined_path)
+        except ValueError as e:
+            logger.warning("Cannot combine payslips of %s (%s), converting them one by one", vessel, e)
+            leftovers += docx_paths
+            continue
+        combined[combined_path] = docx_paths
+
+    converter = get_converter()
+    converter.convert(list(combined), temp_dir)
+    for combined_path, docx_paths in combined.items():
+        pdf_paths = [p[:-len(".docx")] + ".pdf" for p in docx_paths]
+        if split_pdf_pages(combined_path[:-len(".docx")] + ".pdf", pdf_paths):
+            on_converted(len(docx_paths))
+        else:
+            logger.warning("Combined PDF of %s does not split into one page per payslip, converting one by one",
+                           combined_path)
+            leftovers += docx_paths
+    converter.convert(leftovers, temp_dir, on_shard_done=on_converted)
+
+
+def _no_progress(stage, done, total):
+    pass
+
+
+def _pack_payslip_zip(kind, employees, workers=1, engine='docx', on_warning=None, use_cache=True,
+                      on_progress=None, pdf_mode='single', pdf_backend='soffice', metrics=None):
+    """
+    启动临时安全屋生成 Word / PDF 双版本文档，并边生成边写入 ZIP。
+    use_cache 时内容没变的船员直接复用磁盘缓存里上一次的 Word / PDF，只渲染和转换有变化的人。
+    pdf_mode 取 PDF_MODES 里的值；'vessel_print' 会额外写入 Print_Ready/<船名>.pdf。
+    pdf_backend 取 PDF_BACKENDS 里的值；'native' 时 PDF 在阶段一直接画出来，跳过 LibreOffice 转换。
+    on_progress(阶段, 已完成数, 总数) 按 PROGRESS_STAGES 汇报进度；metrics 为 PayslipMetrics 时记录各阶段的耗时和内存。
+    ZIP 超过 ZIP_SPOOL_THRESHOLD 后自动落盘，返回指针在开头的临时文件对象
+    """
+    if on_warning is None:
+        on_warning = logger.warning
+    if on_progress is None:
+        on_progress = _no_progress
+    if metrics is None:
+        metrics = NULL_METRICS
+    total = len(employees)
+
+    cache = get_payslip_cache() if use_cache else None
+    zip_spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_THRESHOLD)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with metrics.stage('cache_lookup'):
+            keys, cached = [None] * len(employees), [None] * len(employees)
+            if cache is not None:
+                digest = load_template(kind).digest
+                # 命中的文件先链接到本次的临时目录，打包时不会被别的会话淘汰掉
+                hits_dir = os.path.join(temp_dir, "cache_hits")
+                os.makedirs(hits_dir)
+                for i, emp in enumerate(employees):
+                    keys[i] = payslip_cache_key(emp, digest, PAYSLIP_RENDERER_VERSION, (engine, pdf_backend))
+                    cached[i] = cache.checkout(keys[i], hits_dir)
+            to_render = [i for i, hit in enumerate(cached) if hit is None]
+            # 同船同名的船员共用临时文件名，互相覆盖，这些人的文件不写进缓存
+            bases = [payslip_file_base(employees[i]) for i in to_render]
+            for i, base in zip(to_render, bases):
+                if bases.count(base) > 1:
+                    keys[i] = None
+
+        with zipfile.ZipFile(zip_spool, "w", zipfile.ZIP_DEFLATED) as zip_file:
+
+            with metrics.stage('fill'):
+                # --- 阶段一：按原来的船员顺序逐个写入 ZIP：缓存命中的直接写，其余每生成好一份 Word 就从磁盘流式写进去 ---
+                # 渲染结果按 to_render 的顺序（也就是原顺序）陆续产出，和命中的交替取用，ZIP 里的顺序与是否命中无关
+                rendered = zip(to_render, iter_render_payslips(kind, [employees[i] for i in to_render], temp_dir,
+                                                               workers=workers, engine=engine,
+                                                               pdf_backend=pdf_backend))
+                for filled, (emp, hit) in enumerate(zip(employees, cached), 1):
+                    safe_vessel, safe_emp, final_filename = payslip_zip_names(emp)
+                    if hit is not None:
+                        zip_file.write(hit[0], f"Word_Version/{safe_vessel}/{final_filename}.docx")
+                    else:
+                        i, (emp, seconds) = next(rendered)
+                        metrics.add_render_time(seconds)
+                        temp_docx_path = os.path.join(temp_dir, f"{payslip_file_base(emp)}.docx")
+                        if os.path.exists(temp_docx_path):
+                            zip_file.write(temp_docx_path, f"Word_Version/{safe_vessel}/{final_filename}.docx")
+                            if keys[i] is not None:
+                                cache.store(keys[i], DOCX, temp_docx_path)
+                    on_progress('filled', filled, total)
+                # 取完最后一份后让生成器走到结尾，进程池随之关闭
+                for _ in rendered:
+                    pass
+
+            with metrics.stage('convert'):
+                # 🚀 第二阶段：交给常驻的 LibreOffice 转换池，按 CPU 核数分片并行转换（只转换本次新生成的）
+                # ==========================================
+                docs_to_convert = glob.glob(os.path.join(temp_dir, "*_for_pdf.docx"))
+                converted = [total - len(to_render)]
+                on_progress('converted', converted[0], total)
+
+                def shard_done(n):
+                    converted[0] += n
+                    on_progress('converted', converted[0], total)
+
+                if pdf_backend == 'native':
+                    # 内置后端的 PDF 在阶段一已经画好了
+                    shard_done(len(to_render))
+                elif pdf_mode == 'single':
+                    get_converter().convert(docs_to_convert, temp_dir, on_shard_done=shard_done)
+                else:
+                    _convert_by_vessel([employees[i] for i in to_render], temp_dir, shard_done)
+
+            with metrics.stage('zip'):
+                # ==========================================
+                # 🚀 第三阶段：打包 PDF (增加文件完整性检查)
+                vessel_pdfs = {}
+                for i, emp in enumerate(employees):
+                    on_progress('zipped', i + 1, total)
+                    safe_vessel, safe_emp, final_filename = payslip_zip_names(emp)
+                    if cached[i] is not None:
+                        zip_file.write(cached[i][1], f"PDF_Version/{safe_vessel}/{final_filename}.pdf",
+                                       compress_type=zipfile.ZIP_STORED)
+                        vessel_pdfs.setdefault(safe_vessel, []).append(cached[i][1])
+                        continue
+
+                    # 写入 PDF 版本（带防损坏空文件检查）；PDF 本身已压缩，直接存储不再 deflate
+                    temp_pdf_path = os.path.join(temp_dir, f"{payslip_file_base(emp)}_for_pdf.pdf")
+                    if os.path.exists(temp_pdf_path):
+                        if os.path.getsize(temp_pdf_path) > 100:
+                            zip_file.write(temp_pdf_path, f"PDF_Version/{safe_vessel}/{final_filename}.pdf",
+                                           compress_type=zipfile.ZIP_STORED)
+                            # 损坏的 PDF 不进缓存，下次还会重新生成
+                            if keys[i] is not None:
+                                cache.store(keys[i], PDF, temp_pdf_path)
+                            vessel_pdfs.setdefault(safe_vessel, []).append(temp_pdf_path)
+                        else:
+                            on_warning(f"Warning: PDF for {safe_emp} generated but appears corrupted (too small).")
+
+                # 整船打印版：按 ZIP 里的顺序（职位从高到低）把每个人的 PDF 合成一份
+                if pdf_mode == 'vessel_print':
+                    for safe_vessel, pdf_paths in vessel_pdfs.items():
+                        print_path = os.path.join(temp_dir, f"{safe_vessel}===PRINT.pdf")
+                        try:
+                            merge_pdfs(pdf_paths, print_path)
+                        except (OSError, PyPdfError) as e:
+                            on_warning(f"Warning: print-ready PDF for {safe_vessel} could not be built: {e}")
+                            continue
+                        zip_file.write(print_path, f"Print_Ready/{safe_vessel}.pdf")
+
+    if cache is not None:
+        cache.evict()
+    zip_spool.seek(0)
+    return zip_spool
+
+
+# 内港 SUM-SAL 表：{输出字段: 表头关键字}
+IN_PORT_COLUMNS = {
+    'Name': 'Name', 'Rank': 'Rank', 'From': 'From(Date)', 'To': 'To(Date)', 'Day on Board': 'Day on Board',
+    'Basic Salary': 'Basic Salary', 'Fixed OT': 'Fixed OT', 'Leave Pay': 'Leave Pay', 'Allowance': 'Allowance',
+    'Net Salary': 'Net Salary', 'Reimbursement': 'Reimbursement', 'Subtotal': 'Subtotal',
+    'Deduction': 'Deduction', 'Release': 'Release', 'Retaining': 'Retaining',
+    'Remittance - Foreign': 'Remittance - Foreign', 'Remittance - Singapore': 'Remittance - Singapore',
+    'Remarks': 'Remarks',
+}
+
+# 外港 SUM-SAL 表：{输出字段: 表头关键字}，部分字段有备用表头
+OUT_PORT_COLUMNS = {
+    'Name': 'Name', 'Rank': 'Rank', 'FromDate': 'FromDate', 'From': 'From', 'ToDate': 'ToDate', 'To': 'To',
+    'DayonBoard': 'DayonBoard', 'MonthlySalary': 'MonthlySalary', 'Incentive': 'Incentive',
+    'Reimbursement': 'Reimbursement', 'ReleaseofSalary': 'ReleaseofSalary', 'Retaining': 'Retaining',
+    'RemittanceForeignBank': 'RemittanceForeignBank', 'Remittance': 'Remittance', 'Remarks': 'Remarks',
+}
+
+
+def _use_foreign_remittance(rem_foreign):
+    try:
+        return bool(rem_foreign and float(str(rem_foreign).replace(',', '')) > 0)
+    except:
+        return False
+
+
+def _to_amount(val):
+    try:
+        s_val = str(val).replace(',', '').strip()
+        return float(s_val) if s_val else 0.0
+    except:
+        return 0.0
+
+
+def parse_in_port_employees(df_raw):
+    """解析内港 SUM-SAL 表，返回排好序的员工数据字典列表"""
+    crew = parse_sum_sal(df_raw, VESSEL_ROW_ABOVE, IN_PORT_COLUMNS)
+
+    # 保留内港专属的清洗逻辑，整列处理
+    for col in ['From', 'To']:
+        crew[col] = crew[col].map(format_date_custom)
+    for col in ['Basic Salary', 'Fixed OT', 'Leave Pay', 'Allowance', 'Net Salary', 'Reimbursement',
+                'Subtotal', 'Deduction', 'Release', 'Retaining']:
+        crew[col] = crew[col].map(format_currency)
+    crew['Remittance'] = [format_currency(foreign if _use_foreign_remittance(foreign) else sg)
+                          for foreign, sg in zip(crew['Remittance - Foreign'], crew['Remittance - Singapore'])]
+    employees = crew.drop(columns=['Remittance - Foreign', 'Remittance - Singapore']).to_dict('records')
+
+    # 💡 核心修改：在开始生成 Word/PDF 之前，在内存中直接对人员名单进行排序
+    # 规则：先按“船名”分组，然后按“职位优先级”从高到低排列
+    employees.sort(key=lambda x: (x['Vessel Name'], get_rank_priority(x['Rank'])))
+    return employees
+
+
+def parse_out_port_employees(df_raw):
+    """解析外港 SUM-SAL 表，动态计算薪资，返回排好序的员工数据字典列表"""
+    crew = parse_sum_sal(df_raw, SN_ANY_COLUMN, OUT_PORT_COLUMNS)
+
+    employees = []
+    for row in crew.to_dict('records'):
+        # 💡 1. 提取并清洗数据
+        m_val = _to_amount(row['MonthlySalary'])
+        inc_val = _to_amount(row['Incentive'])
+        reim_val = _to_amount(row['Reimbursement'])
+
+        # 💡 2. 应用进位/退位数学规则
+        # 58% 正常计算
+        basic_val = m_val * 0.58
+        # 37% 进一位 (ceil: 向上取整)
+        fixed_ot = math.ceil(m_val * 0.37) if m_val > 0 else 0.0
+        # 5% 退一位 (floor: 向下取整)
+        leave_pay = math.floor(m_val * 0.05) if m_val > 0 else 0.0
+
+        total_earnings = m_val + inc_val
+        net_amount = total_earnings + reim_val
+        total_deductions = 0.0  # 恒为零
+        # 💡 3. 构建规范化的员工数据字典
+        employees.append({
+            'Vessel Name': row['Vessel Name'], 'Name': row['Name'], 'Rank': row['Rank'],
+            'From': format_date_custom(row['FromDate'] or row['From']),
+            'To': format_date_custom(row['ToDate'] or row['To']),
+            'Day on Board': str(row['DayonBoard']),
+
+            'Basic Salary': format_currency(basic_val),
+            'Fixed OT': format_currency(fixed_ot),
+            'Leave Pay': format_currency(leave_pay),
+            'Bonus/Incentive': format_currency(inc_val),
+            'Total Earnings': format_currency(total_earnings),
+            'Reimbursement': format_currency(reim_val),
+            'Net Amount': format_currency(net_amount),
+            'Total Deductions': format_currency(total_deductions),
+
+            'Release': format_currency(row['ReleaseofSalary']),
+            'Retaining': format_currency(row['Retaining']),
+            'Remittance': format_currency(row['RemittanceForeignBank'] or row['Remittance']),
+            'Remarks': row['Remarks']
+        })
+
+    # 💡 核心修改：在开始生成 Word/PDF 之前，在内存中直接对人员名单进行排序
+    # 规则：先按“船名”分组，然后按“职位优先级”从高到低排列
+    employees.sort(key=lambda x: (x['Vessel Name'], get_rank_priority(x['Rank'])))
+    return employees
+
+
+def generate_payslip_zip(uploaded_excel, workers=1, engine='docx', on_warning=None, use_cache=True,
+                         on_progress=None, pdf_mode='single', pdf_backend='soffice', metrics=None):
+    """读取上传的 Excel，生成包含内港 Word 和 PDF 工资单的双版本 ZIP 压缩包"""
+    uploaded_excel.seek(0)
+
+    # 1. 智能查找目标 Sheet，2. 一次性提取全部船员数据
+    if metrics is None:
+        metrics = NULL_METRICS
+    with metrics.stage('parse'):
+        employees = parse_in_port_employees(read_sum_sal_sheet(uploaded_excel))
+    if on_progress is not None:
+        on_progress('parsed', len(employees), len(employees))
+
+    # 3. 启动临时安全屋生成双版本文档 (引入批量 PDF 提速逻辑)
+    try:
+        spool = _pack_payslip_zip('in_port', employees, workers=workers, engine=engine,
+                                  on_warning=on_warning, use_cache=use_cache, on_progress=on_progress,
+                                  pdf_mode=pdf_mode, pdf_backend=pdf_backend, metrics=metrics)
+    finally:
+        metrics.stop()
+    metrics.log(kind='in_port', crew=len(employees), workers=workers, engine=engine,
+                pdf_mode=pdf_mode, pdf_backend=pdf_backend)
+    return spool
+
+
+# =========================================================
+# 新增功能：进阶版 payslips 生成逻辑 (动态计算 + Word + PDF 双版本)
+# =========================================================
+def generate_advanced_payslips_zip(uploaded_excel, workers=1, engine='docx', on_warning=None, use_cache=True,
+                                   on_progress=None, pdf_mode='single', pdf_backend='soffice', metrics=None):
+    """读取上传的 Excel，动态计算薪资，并在安全屋中生成 Word 和 PDF 双版本 ZIP 压缩包"""
+    # 每次调用时将指针重置到开头
+    uploaded_excel.seek(0)
+
+    # 1. 智能查找目标 Sheet，2. 一次性提取并计算全部船员数据
+    if metrics is None:
+        metrics = NULL_METRICS
+    with metrics.stage('parse'):
+        employees = parse_out_port_employees(read_sum_sal_sheet(uploaded_excel))
+    if on_progress is not None:
+        on_progress('parsed', len(employees), len(employees))
+
+    # 开启安全屋，利用 LibreOffice 生成 PDF
+    try:
+        spool = _pack_payslip_zip('out_port', employees, workers=workers, engine=engine,
+                                  on_warning=on_warning, use_cache=use_cache, on_progress=on_progress,
+                                  pdf_mode=pdf_mode, pdf_backend=pdf_backend, metrics=metrics)
+    finally:
+        metrics.stop()
+    metrics.log(kind='out_port', crew=len(employees), workers=workers, engine=engine,
+                pdf_mode=pdf_mode, pdf_backend=pdf_backend)
+    return spool
@@ -0,0 +1,140 @@
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+# 编译模版时写进单元格 / Remarks 的占位文本
+CELL_TOKEN = "@@{}@@"
+REMARKS_TOKEN = "@@R@@"
+
+_CELL_TOKEN_RE = re.compile(rb"<w:t>@@(\d+)@@</w:t>")
+_TOP_MARGIN_RE = re.compile(rb'(<w:pgMar\b[^>]*?\bw:top=")(\d+)(")')
+_REMARKS_RUN = b'<w:t xml:space="preserve"> ' + REMARKS_TOKEN.encode() + b"</w:t>"
+# lxml 拒绝写入的控制字符，遇到时和 python-docx 一样直接报错
+_INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_REMARKS = -1
+_TOP_MARGIN = -2
+
+
+def run_content_xml(text):
+    """把字符串转换成 w:r 里面的内容，规则与 python-docx 的 run.text 完全一致"""
+    if _INVALID_XML_CHARS.search(text):
+        raise ValueError("All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters")
+    parts = []
+    for segment in re.split(r"([\t\r\n])", text):
+        if segment == "\t":
+            parts.append("<w:tab/>")
+        elif segment in ("\r", "\n"):
+            parts.append("<w:br/>")
+        elif segment:
+            space = ' xml:space="preserve"' if len(segment.strip()) < len(segment) else ""
+            parts.append(f"<w:t{space}>{escape(segment)}</w:t>")
+    return "".join(parts).encode("utf-8")
+
+
+def _tokenize(xml):
+    """把 document.xml 切成 [字节片段, 槽位编号, 字节片段, ...]"""
+    chunks = []
+    pos = 0
+    for m in _CELL_TOKEN_RE.finditer(xml):
+        chunks.append(xml[pos:m.start()])
+        chunks.append(int(m.group(1)))
+        pos = m.end()
+    chunks.append(xml[pos:])
+    return chunks
+
+
+def _split_top_margin(chunks):
+    out = []
+    for chunk in chunks:
+        m = _TOP_MARGIN_RE.search(chunk) if isinstance(chunk, bytes) else None
+        if m:
+            out += [chunk[:m.end(1)], _TOP_MARGIN, chunk[m.start(3):]]
+        else:
+            out.append(chunk)
+    return out
+
+
+def with_top_margin(docx_bytes, top_margin, compression=zipfile.ZIP_DEFLATED):
+    """
+    已保存的 docx 字节里只改第一节的上边距（twips），其余成员按原顺序原样写回，
+    各成员的内容与 python-docx 改完 top_margin 再保存一次得到的完全一致。
+    只给 LibreOffice 读的过渡文件可以用 ZIP_STORED，省掉重新压缩的时间
+    """
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(docx_bytes)) as src, zipfile.ZipFile(out, "w", compression) as dst:
+        for info in src.infolist():
+            blob = src.read(info)
+            if info.filename == "word/document.xml":
+                blob, found = _TOP_MARGIN_RE.subn(lambda m: m.group(1) + str(top_margin).encode() + m.group(3),
+                                                  blob, count=1)
+                if not found:
+                    raise ValueError("Page margins not found in document.xml")
+            dst.writestr(info.filename, blob)
+    return out.getvalue()
+
+
+class XmlPayslipTemplate:
+    """
+    预编译的 word/document.xml 字节模版：
+    单元格的值、Remarks 段落和上边距都是槽位，渲染时只做字节拼接再重新打包成 docx，
+    完全不经过 python-docx 的对象树
+    """
+
+    def __init__(self, docx_with_remarks, docx_without_remarks):
+        with zipfile.ZipFile(io.BytesIO(docx_with_remarks)) as z:
+            # 保留原来的成员顺序，document.xml 的位置用 None 占位
+            self._members = [(info.filename, None if info.filename == "word/document.xml" else z.read(info))
+                             for info in z.infolist()]
+            xml_with = z.read("word/document.xml")
+        with zipfile.ZipFile(io.BytesIO(docx_without_remarks)) as z:
+            xml_without = z.read("word/document.xml")
+
+        # 两份 XML 只有 Remarks 段落不同：公共前缀和公共后缀之外的部分就是 Remarks 槽位
+        limit = min(len(xml_with), len(xml_without))
+        head = 0
+        while head < limit and xml_with[head] == xml_without[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and xml_with[-1 - tail] == xml_without[-1 - tail]:
+            tail += 1
+
+        # 公共后缀可能吃掉占位 run 的结尾标签，把差异区间扩大到完整包住占位文本
+        token_at = xml_with.find(_REMARKS_RUN)
+        if token_at < 0:
+            raise ValueError("Remarks placeholder not found in payslip template")
+        head = min(head, token_at)
+        tail = min(tail, len(xml_with) - token_at - len(_REMARKS_RUN))
+
+        self._remarks_off = xml_without[head:len(xml_without) - tail]
+        self._remarks_on = xml_with[head:len(xml_with) - tail].split(_REMARKS_RUN)
+
+        self._chunks = _split_top_margin(
+            _tokenize(xml_with[:head]) + [_REMARKS] + _tokenize(xml_with[len(xml_with) - tail:]))
+
+    def render_xml(self, cell_texts, remarks, top_margin):
+        """cell_texts 按槽位顺序排列；remarks 为空字符串表示不写备注；top_margin 单位是 twips"""
+        out = []
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                out.append(chunk)
+            elif chunk == _REMARKS:
+                if remarks:
+                    out += [self._remarks_on[0], run_content_xml(" " + remarks), self._remarks_on[1]]
+                else:
+                    out.append(self._remarks_off)
+            elif chunk == _TOP_MARGIN:
+                out.append(str(top_margin).encode())
+            else:
+                out.append(run_content_xml(cell_texts[chunk]))
+        return b"".join(out)
+
+    def render(self, cell_texts, remarks, top_margin, compression=zipfile.ZIP_DEFLATED):
+        """渲染并打包成完整的 docx 字节"""
+        document_xml = self.render_xml(cell_texts, remarks, top_margin)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression) as z:
+            for name, blob in self._members:
+                z.writestr(name, document_xml if blob is None else blob)
+        return buffer.getvalue()
@@ -0,0 +1,129 @@
+import os
+import queue
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger(__name__)
+
+# 同时运行的 soffice 实例数，可通过环境变量覆盖
+DEFAULT_SOFFICE_INSTANCES = int(os.environ.get("PAYSLIP_SOFFICE_INSTANCES", os.cpu_count() or 1))
+# 常驻 profile 的存放位置：进程退出之前一直复用，省掉每次新建 profile 的冷启动。
+# 目录名带上进程号，另一个服务进程或同时运行的基准测试不会和这里共用同一个 UserInstallation
+PROFILE_ROOT_PREFIX = os.path.join(tempfile.gettempdir(), "tsm_soffice_profiles")
+
+
+def process_profile_root():
+    return f"{PROFILE_ROOT_PREFIX}_{os.getpid()}"
+
+
+def find_soffice():
+    """优先使用 libreoffice 命令，找不到再试 soffice"""
+    return shutil.which("libreoffice") or shutil.which("soffice") or "libreoffice"
+
+
+class PdfConverterPool:
+    """
+    常驻的 LibreOffice 转换服务：
+    N 个槽位各自拥有独立的 UserInstallation profile（首次使用时预热），
+    转换时把文件切成 N 份，每个槽位同时跑一个 headless soffice 处理一份。
+    同一个 profile 同一时刻只允许一个 soffice 使用，防止 LibreOffice 崩溃或生成损坏文件
+    """
+
+    def __init__(self, size=DEFAULT_SOFFICE_INSTANCES, binary=None, profile_root=None, timeout=None):
+        self.size = max(1, int(size))
+        self.binary = binary or find_soffice()
+        if profile_root is None:
+            # 本进程专用的 profile，进程退出时删掉
+            profile_root = process_profile_root()
+            atexit.register(shutil.rmtree, profile_root, ignore_errors=True)
+        self.profile_root = profile_root
+        self.timeout = timeout
+        self._slots = queue.Queue()
+        for slot in range(self.size):
+            self._slots.put(slot)
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="soffice")
+        self._warm_lock = threading.Lock()
+        self._warmed = set()
+
+    def _profile_url(self, slot):
+        path = Path(self.profile_root, f"slot_{slot}").resolve()
+        return path.as_uri()
+
+    def _base_cmd(self, slot):
+        return [
+            self.binary,
+            f"-env:UserInstallation={self._profile_url(slot)}",  # 每个槽位一个独立环境
+            "--headless", "--invisible", "--norestore", "--nologo", "--nodefault",
+        ]
+
+    def _warm_slot(self, slot):
+        # 第一次启动会在 profile 目录里初始化用户配置，这是冷启动最慢的部分，只做一次
+        if slot in self._warmed:
+            return
+        os.makedirs(self.profile_root, exist_ok=True)
+        subprocess.run(self._base_cmd(slot) + ["--terminate_after_init"],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout)
+        with self._warm_lock:
+            self._warmed.add(slot)
+
+    def warm_up(self):
+        """在后台把所有槽位的 profile 都预热好，不阻塞调用方"""
+        for _ in range(self.size):
+            self._executor.submit(self._run_on_free_slot, self._warm_slot)
+
+    def _run_on_free_slot(self, fn, *args):
+        slot = self._slots.get()
+        try:
+            return fn(slot, *args)
+        finally:
+            self._slots.put(slot)
+
+    def _convert_shard(self, slot, files, outdir):
+        try:
+            self._warm_slot(slot)
+            cmd = self._base_cmd(slot) + ["--convert-to", "pdf", "--outdir", outdir] + files
+            process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout)
+            if process.returncode != 0:
+                logger.warning("soffice slot %s exited with %s: %s", slot, process.returncode,
+                               process.stderr.decode(errors="ignore"))
+        except (OSError, subprocess.TimeoutExpired) as e:
+            # 单个分片失败不影响其他分片，缺失的 PDF 由打包阶段跳过
+            logger.warning("soffice slot %s failed on %d files: %s", slot, len(files), e)
+
+    def convert(self, docx_paths, outdir, on_shard_done=None):
+        """
+        把一批 docx 分片并行转换为 PDF，输出到 outdir（文件名与 LibreOffice 默认一致），阻塞直到全部完成。
+        on_shard_done(n) 在每个分片结束时被调用，n 为该分片的文件数
+        """
+        docx_paths = list(docx_paths)
+        if not docx_paths:
+            return
+        n_shards = min(self.size, len(docx_paths))
+        # 交错切分，保证每个分片的文件数最多相差 1
+        shards = [docx_paths[i::n_shards] for i in range(n_shards)]
+        futures = {self._executor.submit(self._run_on_free_slot, self._convert_shard, shard, outdir): len(shard)
+                   for shard in shards}
+        for future in as_completed(futures):
+            future.result()
+            if on_shard_done is not None:
+                on_shard_done(futures[future])
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_converter():
+    """整个服务进程共享的转换池，第一次调用时创建并在后台预热"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = PdfConverterPool()
+            _default_pool.warm_up()
+        return _default_pool
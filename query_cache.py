@@ -0,0 +1,98 @@
+import time
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+# 最多缓存多少条查询结果，超出后淘汰最久没用过的
+DEFAULT_MAX_ENTRIES = 256
+# 兜底过期时间（秒）：不经过本系统的改动（比如直接改数据库）最晚这么久后也能看到
+DEFAULT_MAX_AGE = 600
+
+SHIPS, REPORTS, MEETING_ORDER = 'ships', 'reports', 'meeting_order'
+
+
+def _as_date(value):
+    """数据库返回的日期可能是 date、datetime 或 'YYYY-MM-DD' 字符串（SQLite），统一成 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+class QueryCache:
+    """
+    整个服务进程共享的查询结果缓存，所有会话共用。
+    每条结果属于一张表（SHIPS / REPORTS / MEETING_ORDER），报表结果还记下查询的日期范围；
+    写入时按表、按改动的日期精确作废，不用等 TTL 到期
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_age=DEFAULT_MAX_AGE):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()  # key -> (表, 日期范围, 写入时间, 结果)
+        self._generation = 0
+        self._versions = dict.fromkeys((SHIPS, REPORTS, MEETING_ORDER), 0)
+        self._lock = threading.Lock()
+
+    def get(self, table, key, loader, date_range=None):
+        """
+        命中时返回结果副本；否则调用 loader() 查询并缓存。
+        date_range 为 (开始, 结束) 时，只有落在这个范围里的写入才会让这条结果作废
+        """
+        key = (table, *key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[2] < self.max_age:
+                self._entries.move_to_end(key)
+                return entry[3].copy()
+            generation = self._generation
+
+        result = loader()
+        with self._lock:
+            # 查询期间有写入发生，这份结果可能已经过时，只返回不缓存
+            if generation == self._generation:
+                if date_range is not None:
+                    date_range = (_as_date(date_range[0]), _as_date(date_range[1]))
+                self._entries[key] = (table, date_range, time.monotonic(), result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return result.copy()
+
+    def version(self, table):
+        """这张表被写过几次；各会话自己保存的数据可以用它判断是否已经过时"""
+        with self._lock:
+            return self._versions[table]
+
+    def invalidate(self, table, dates=None):
+        """作废一张表的缓存；给出 dates 时只作废日期范围覆盖这些日期的结果"""
+        dates = None if dates is None else [_as_date(d) for d in dates]
+        with self._lock:
+            self._generation += 1
+            self._versions[table] += 1
+            for key, (entry_table, date_range, _, _) in list(self._entries.items()):
+                if entry_table != table:
+                    continue
+                if dates is None or date_range is None or any(date_range[0] <= d <= date_range[1] for d in dates):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            for table in self._versions:
+                self._versions[table] += 1
+            self._entries.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_query_cache():
+    """整个服务进程共享的查询缓存"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = QueryCache()
+        return _default_cache
@@ -0,0 +1,282 @@
+import io
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import openpyxl
+from pptx import Presentation
+from pptx.util import Inches, Pt as Ppt_Pt
+from pptx.enum.text import PP_ALIGN
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, Border, Side, NamedStyle
+from openpyxl.worksheet.cell_range import CellRange
+
+# 报表中心导出的 Excel：日期范围内的记录超过这么多条时改用 openpyxl 的只写模式，
+# 逐行写进压缩流，不在内存里保留整张表的单元格对象
+EXCEL_STREAMING_REPORTS = 5000
+
+_THIN = Side(style='thin', color='000000')
+_BLACK_BORDER = Border(top=_THIN, left=_THIN, right=_THIN, bottom=_THIN)
+_CENTER = Alignment(horizontal='center', vertical='center')
+
+# 💡 共用的命名样式：每个单元格只记一个样式编号，不用逐格组合字体 / 边框 / 对齐
+EXCEL_STYLES = {
+    'tsm_title': dict(font=Font(name='微软雅黑', size=12, bold=True), alignment=_CENTER),
+    'tsm_header': dict(font=Font(name='微软雅黑', size=10, bold=True), alignment=_CENTER, border=_BLACK_BORDER),
+    'tsm_cell': dict(font=Font(name='微软雅黑', size=10), alignment=_CENTER, border=_BLACK_BORDER),
+    'tsm_issue': dict(font=Font(name='微软雅黑', size=10), border=_BLACK_BORDER,
+                      alignment=Alignment(wrap_text=True, horizontal='left', vertical='center')),
+    # 合并区域里被盖住的格子只保留边框，和 merge_cells 的效果一致
+    'tsm_merged': dict(border=_BLACK_BORDER),
+}
+EXCEL_HEADERS = ['Manager Name', 'Vessel Name', 'Issue']
+EXCEL_COLUMN_WIDTHS = {'A': 20, 'B': 25, 'C': 70}
+# 导出用的行：每条船一行，问题已经合并并重新编号
+EXPORT_COLUMNS = ['manager_name', 'ship_name', 'this_week_issue']
+
+
+def manager_merge_runs(managers, first_row):
+    """
+    一次游程扫描排好序的负责人列：相邻且相同的负责人合成一段，
+    返回需要合并的 (起始行, 结束行) 列表（只有一行的段不合并）
+    """
+    runs = []
+    start, prev = first_row, None
+    for row, manager in enumerate(managers, first_row):
+        if manager != prev:
+            if prev is not None and row - 1 > start:
+                runs.append((start, row - 1))
+            start, prev = row, manager
+    end = first_row + len(managers) - 1
+    if prev is not None and end > start:
+        runs.append((start, end))
+    return runs
+
+
+def _new_workbook(write_only):
+    wb = openpyxl.Workbook(write_only=write_only)
+    for name, attrs in EXCEL_STYLES.items():
+        wb.add_named_style(NamedStyle(name=name, **attrs))
+    ws = wb.create_sheet("Ship Report") if write_only else wb.active
+    ws.title = "Ship Report"
+    for col, width in EXCEL_COLUMN_WIDTHS.items():
+        ws.column_dimensions[col].width = width
+    return wb, ws
+
+
+def _write_standard(df_grouped, runs, title):
+    wb, ws = _new_workbook(write_only=False)
+    ws.merge_cells('A1:C1')
+    ws['A1'] = title
+    ws['A1'].style = 'tsm_title'
+    for col_num, header in enumerate(EXCEL_HEADERS, 1):
+        ws.cell(row=2, column=col_num, value=header).style = 'tsm_header'
+
+    for row, (manager, ship, issue) in enumerate(
+            zip(df_grouped['manager_name'], df_grouped['ship_name'], df_grouped['this_week_issue']), 3):
+        ws.cell(row=row, column=1, value=manager).style = 'tsm_cell'
+        ws.cell(row=row, column=2, value=ship).style = 'tsm_cell'
+        ws.cell(row=row, column=3, value=issue).style = 'tsm_issue'
+
+    for start, end in runs:
+        ws.merge_cells(start_row=start, start_column=1, end_row=end, end_column=1)
+    return wb
+
+
+def _write_streaming(df_grouped, runs, title):
+    """只写模式：行按顺序直接写进压缩流，合并区域提前算好，最后随工作表结尾一起写出"""
+    wb, ws = _new_workbook(write_only=True)
+
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    ws.merged_cells.add(CellRange('A1:C1'))
+    ws.append([styled(title, 'tsm_title')])
+    ws.append([styled(header, 'tsm_header') for header in EXCEL_HEADERS])
+
+    covered = set()
+    for start, end in runs:
+        ws.merged_cells.add(CellRange(min_col=1, min_row=start, max_col=1, max_row=end))
+        covered.update(range(start + 1, end + 1))
+
+    for row, (manager, ship, issue) in enumerate(
+            zip(df_grouped['manager_name'], df_grouped['ship_name'], df_grouped['this_week_issue']), 3):
+        first = styled(None, 'tsm_merged') if row in covered else styled(manager, 'tsm_cell')
+        ws.append([first, styled(ship, 'tsm_cell'), styled(issue, 'tsm_issue')])
+    return wb
+
+
+def render_excel(rows, streaming=False):
+    """把已经按船合并、排好序的 (manager_name, ship_name, this_week_issue) 逐行写成 Excel，返回 xlsx 字节"""
+    runs = manager_merge_runs(rows['manager_name'].tolist(), 3)
+    title = f"Report Date: {datetime.now().strftime('%Y-%m-%d')}"
+    wb = (_write_streaming if streaming else _write_standard)(rows, runs, title)
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+# 最近生成过的几份 Excel / PPT 按内容指纹缓存，同样的数据再要一次直接返回
+EXPORT_CACHE_ENTRIES = 16
+PPT_LOGO = "TSM_Logo.png"
+
+
+class MeetingDeckTemplate:
+    """
+    预先做好的 PPT 骨架：封面（含 Logo）和结束页只做一次并存成字节，
+    每次生成时从字节打开，插入各船的页面，再把结束页移到最后
+    """
+
+    def __init__(self, logo_path=PPT_LOGO):
+        prs = Presentation()
+
+        slide_layout_title = prs.slide_layouts[0]
+        slide = prs.slides.add_slide(slide_layout_title)
+
+        try:
+            slide.shapes.add_picture(logo_path, left=Inches(4.25), top=Inches(1.2), width=Inches(1.8))
+        except:
+            pass
+
+        title = slide.shapes.title
+        subtitle = slide.placeholders[1]
+        title.top = Inches(3.5)
+        title.text = "TSM Summary of Weekly Ship Reports"
+        subtitle.top = Inches(4.5)
+
+        slide_layout_blank = prs.slide_layouts[6]
+        end_slide = prs.slides.add_slide(slide_layout_blank)
+        tx_box = end_slide.shapes.add_textbox(Inches(3), Inches(3.5), Inches(4), Inches(2))
+        tf_end = tx_box.text_frame
+        tf_end.text = "Thank you for watching."
+        p_end = tf_end.paragraphs[0]
+        p_end.alignment = PP_ALIGN.CENTER
+        p_end.font.size = Ppt_Pt(44)
+        p_end.font.bold = True
+        p_end.font.name = '微软雅黑'
+
+        # 问题段落的样板（24 号微软雅黑），每行复制一份再填文字，不用逐段设置字体
+        tf_proto = prs.slides.add_slide(prs.slide_layouts[1]).placeholders[1].text_frame
+        p_proto = tf_proto.add_paragraph()
+        p_proto.font.size = Ppt_Pt(24)
+        p_proto.font.name = '微软雅黑'
+        self._issue_paragraph = copy.deepcopy(p_proto._p)
+        _drop_slide(prs, 2)
+
+        buffer = io.BytesIO()
+        prs.save(buffer)
+        self._blob = buffer.getvalue()
+
+    def render(self, df_ppt, creation_date):
+        """df_ppt 为排好序的 (manager_name, ship_name, this_week_issue)，返回 pptx 字节"""
+        prs = Presentation(io.BytesIO(self._blob))
+        prs.slides[0].placeholders[1].text = f"Creation Date: {creation_date}"
+
+        slide_layout_content = prs.slide_layouts[1]
+        for manager, ship, issue_content in zip(df_ppt['manager_name'], df_ppt['ship_name'],
+                                                df_ppt['this_week_issue']):
+            slide = prs.slides.add_slide(slide_layout_content)
+
+            slide.shapes.title.text = f" {ship} ({manager})"
+            tf = slide.placeholders[1].text_frame
+            tf.word_wrap = True
+
+            if issue_content:
+                tx_body = tf._txBody
+                for line in issue_content.split('\n'):
+                    p = copy.deepcopy(self._issue_paragraph)
+                    p.append_text(line)
+                    tx_body.append(p)
+
+        # 结束页在模版里排第二，挪到最后
+        sld_ids = prs.slides._sldIdLst
+        sld_ids.append(sld_ids[1])
+
+        ppt_out = io.BytesIO()
+        prs.save(ppt_out)
+        return ppt_out.getvalue()
+
+
+def _drop_slide(prs, index):
+    sld_ids = prs.slides._sldIdLst
+    sld_id = sld_ids[index]
+    prs.part.drop_rel(sld_id.rId)
+    sld_ids.remove(sld_id)
+
+
+class ExportCache:
+    """按指纹缓存生成好的文件字节，超过容量时淘汰最久没用过的；各会话共用"""
+
+    def __init__(self, max_entries=EXPORT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob is not None:
+                self._blobs.move_to_end(key)
+            return blob
+
+    def put(self, key, blob):
+        with self._lock:
+            self._blobs[key] = blob
+            while len(self._blobs) > self.max_entries:
+                self._blobs.popitem(last=False)
+
+
+def export_fingerprint(rows, report_day):
+    """导出行的内容（按行顺序，顺序本身就体现了会议顺序）+ 表头 / 封面日期的指纹，相同即生成的文件相同"""
+    payload = json.dumps([rows[EXPORT_COLUMNS].astype(str).values.tolist(), report_day], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+_excel_cache = ExportCache()
+_deck_cache = ExportCache()
+_deck_template = None
+_deck_lock = threading.Lock()
+
+
+def get_deck_template():
+    """整个服务进程共享的 PPT 骨架，第一次用时生成"""
+    global _deck_template
+    with _deck_lock:
+        if _deck_template is None:
+            _deck_template = MeetingDeckTemplate()
+        return _deck_template
+
+
+def build_meeting_deck(rows):
+    """
+    用已经按船合并、排好序的行生成会议 PPT，返回 (pptx 字节, 耗时秒数, 是否命中缓存)。
+    相同的行在同一天内再次生成时直接返回缓存的结果
+    """
+    start = time.perf_counter()
+    creation_date = datetime.now().strftime('%Y-%m-%d')
+    key = export_fingerprint(rows, creation_date)
+    blob = _deck_cache.get(key)
+    if blob is not None:
+        return blob, time.perf_counter() - start, True
+
+    blob = get_deck_template().render(rows, creation_date)
+    _deck_cache.put(key, blob)
+    return blob, time.perf_counter() - start, False
+
+
+def get_custom_excel(rows):
+    """
+    带缓存的 render_excel：rows 为报表中心查出的导出行（带 report_count），按内容算指纹，
+    数据和顺序没变就直接返回上次生成的文件，不再重新跑 openpyxl
+    """
+    key = export_fingerprint(rows, datetime.now().strftime('%Y-%m-%d'))
+    blob = _excel_cache.get(key)
+    if blob is None:
+        blob = render_excel(rows, streaming=int(rows['report_count'].sum()) > EXCEL_STREAMING_REPORTS)
+        _excel_cache.put(key, blob)
+    return blob
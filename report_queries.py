@@ -0,0 +1,59 @@
+import pandas as pd
+from sqlalchemy import text
+from issue_text import renumber_issues
+
+# Main_app 和基准测试、db_migrations --check 共用的热点查询，改查询时只改这里
+
+# 历史记录：一条窗口函数查询取回多条船（:sids 为展开的列表参数）各自最近 :n 条未删除的记录
+HISTORY_QUERY = """
+    SELECT id, ship_id, report_date, this_week_issue, remarks FROM (
+        SELECT id, ship_id, report_date, this_week_issue, remarks,
+               ROW_NUMBER() OVER (PARTITION BY ship_id ORDER BY report_date DESC, id DESC) AS rn
+        FROM reports
+        WHERE ship_id IN :sids AND is_deleted_by_user = FALSE
+    ) latest
+    WHERE rn <= :n
+    ORDER BY ship_id, report_date DESC, id DESC
+"""
+
+# 报表中心按船合并问题：Postgres 直接在聚合里排序；SQLite 的 group_concat 按子查询排好的顺序拼接
+REPORT_ISSUE_AGG = {
+    'postgresql': "string_agg(rc.this_week_issue, E'\\n' ORDER BY rc.report_date DESC, rc.id DESC)",
+    'sqlite': "group_concat(rc.this_week_issue, char(10))",
+}
+REPORT_CENTER_QUERY = """
+    SELECT rc.manager_name, rc.ship_name, {issue_agg} AS this_week_issue, COUNT(*) AS report_count
+    FROM (
+        SELECT s.manager_name, s.ship_name, r.id, r.report_date, r.this_week_issue
+        FROM reports r
+        JOIN ships s ON r.ship_id = s.id
+        WHERE r.report_date BETWEEN :s AND :e
+        AND r.is_deleted_by_user = FALSE
+        {manager_filter}
+        ORDER BY r.report_date DESC, r.id DESC
+    ) rc
+    LEFT JOIN meeting_order mo ON mo.vessel_key = UPPER(TRIM(rc.ship_name))
+    GROUP BY rc.manager_name, rc.ship_name, mo.position
+    ORDER BY mo.position IS NULL, mo.position,
+             CASE WHEN NOT EXISTS (SELECT 1 FROM meeting_order) THEN rc.manager_name END, rc.ship_name
+"""
+
+
+def report_center_sql(dialect, manager=False):
+    """按数据库类型拼出报表中心的查询；manager 为 True 时只查 :u 名下的船"""
+    return REPORT_CENTER_QUERY.format(issue_agg=REPORT_ISSUE_AGG[dialect],
+                                      manager_filter="AND s.manager_name = :u" if manager else "")
+
+
+def report_center_rows(conn, start_d, end_d, manager=None):
+    """
+    报表中心的导出行：每条船一行，问题在 SQL 里按日期倒序合并，并按会议顺序排好
+    （顺序表里没有的船排在最后按船名排；没有顺序表时按负责人、船名排），Python 这边只重新编号。
+    给出 manager 时只查这个船舶管理人名下的船
+    """
+    params = {"s": start_d, "e": end_d}
+    if manager is not None:
+        params["u"] = manager
+    rows = pd.read_sql_query(text(report_center_sql(conn.dialect.name, manager is not None)), conn, params=params)
+    rows['this_week_issue'] = renumber_issues(rows['this_week_issue'])
+    return rows
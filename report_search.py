@@ -0,0 +1,99 @@
+import re
+import pandas as pd
+from sqlalchemy import text
+from issue_text import renumber_issues
+
+# 全文检索最多返回多少条
+SEARCH_LIMIT = 50
+# 结果排序：按相关度，或者按日期（找某个问题最早什么时候出现）；写法对两种数据库的输出列都适用
+SEARCH_ORDERS = {
+    'relevance': "rank DESC, report_date DESC, id DESC",
+    'oldest': "report_date, id",
+    'newest': "report_date DESC, id DESC",
+}
+# 命中词前后加的标记，显示前再换成 Markdown 加粗；用控制字符以免和周报内容本身冲突
+HIGHLIGHT_START, HIGHLIGHT_STOP = "\x02", "\x03"
+
+# 💡 Postgres：reports.search_vector 是生成列（问题权重 A、备注权重 B），由 GIN 索引支撑，
+# 先按排序只取前 :n 条的 id，再对这几条做 ts_headline，不对所有命中的记录生成高亮。
+# 文本检索配置必须和迁移 6 里建生成列时用的 'english' 一致
+_POSTGRES_SEARCH = """
+    WITH q AS (SELECT websearch_to_tsquery('english', :q) AS query),
+    hits AS (
+        SELECT r.id AS id, r.report_date AS report_date, ts_rank_cd(r.search_vector, q.query) AS rank
+        FROM reports r JOIN ships s ON r.ship_id = s.id, q
+        WHERE r.search_vector @@ q.query AND r.is_deleted_by_user = FALSE {manager_filter}
+        ORDER BY {order_by}
+        LIMIT :n
+    )
+    SELECT r.id AS id, r.report_date AS report_date, s.ship_name, s.manager_name,
+           ts_headline('english', COALESCE(r.this_week_issue, ''), q.query, :options) AS this_week_issue,
+           ts_headline('english', COALESCE(r.remarks, ''), q.query, :options) AS remarks,
+           hits.rank
+    FROM hits JOIN reports r ON r.id = hits.id JOIN ships s ON r.ship_id = s.id, q
+    ORDER BY {order_by}
+"""
+_POSTGRES_HEADLINE_OPTIONS = f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", HighlightAll=true'
+
+# SQLite：reports_fts 是 reports 的外部内容 FTS5 表，由触发器同步；bm25 越小越相关（取负数作为 rank），问题列权重是备注的两倍
+_SQLITE_SEARCH = """
+    SELECT r.id AS id, r.report_date AS report_date, s.ship_name, s.manager_name,
+           highlight(reports_fts, 0, :hl_start, :hl_stop) AS this_week_issue,
+           highlight(reports_fts, 1, :hl_start, :hl_stop) AS remarks,
+           -bm25(reports_fts, 2.0, 1.0) AS rank
+    FROM reports_fts JOIN reports r ON r.id = reports_fts.rowid JOIN ships s ON r.ship_id = s.id
+    WHERE reports_fts MATCH :q AND r.is_deleted_by_user = FALSE {manager_filter}
+    ORDER BY {order_by}
+    LIMIT :n
+"""
+
+_SEARCH_TERM = re.compile(r'"([^"]*)"|(\S+)')
+_MARKDOWN_SPECIAL = re.compile(r'([\\`*_{}\[\]()#+\-.!|<>~$:])')
+
+
+def fts5_query(query):
+    """
+    把搜索框里的内容转成安全的 FTS5 查询：引号里的是短语，其余每个词都必须出现（和 websearch_to_tsquery 一致）。
+    每一项都加上引号，用户输入的标点不会被当成 FTS5 语法
+    """
+    terms = []
+    for phrase, word in _SEARCH_TERM.findall(query):
+        tokens = re.findall(r'\w+', phrase or word)
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"')
+    return " ".join(terms)
+
+
+def search_reports(conn, query, manager=None, order='relevance', limit=SEARCH_LIMIT):
+    """
+    在所有未删除的周报的问题和备注里全文检索，按 order（SEARCH_ORDERS）取前 limit 条，返回 DataFrame
+    （id, report_date, ship_name, manager_name, this_week_issue, remarks, rank），命中词用 HIGHLIGHT_* 标出。
+    给出 manager 时只搜这个船舶管理人名下的船
+    """
+    dialect = conn.dialect.name
+    params = {"n": limit}
+    manager_filter = ""
+    if manager is not None:
+        manager_filter = "AND s.manager_name = :u"
+        params["u"] = manager
+
+    if dialect == 'postgresql':
+        sql, params["q"], params["options"] = _POSTGRES_SEARCH, query, _POSTGRES_HEADLINE_OPTIONS
+    else:
+        sql, params["q"] = _SQLITE_SEARCH, fts5_query(query)
+        params["hl_start"], params["hl_stop"] = HIGHLIGHT_START, HIGHLIGHT_STOP
+    if not params["q"].strip():
+        return pd.DataFrame(columns=['id', 'report_date', 'ship_name', 'manager_name', 'this_week_issue', 'remarks',
+                                     'rank'])
+
+    results = pd.read_sql_query(text(sql.format(manager_filter=manager_filter, order_by=SEARCH_ORDERS[order])), conn, params=params)
+    results['this_week_issue'] = renumber_issues(results['this_week_issue'])
+    return results
+
+
+def highlighted_markdown(value):
+    """把带命中标记的文本转成 Markdown：先转义内容里的 Markdown 符号，命中词加粗，保留换行"""
+    if value is None or pd.isna(value):
+        return ""
+    escaped = _MARKDOWN_SPECIAL.sub(r'\\\1', str(value))
+    return escaped.replace(HIGHLIGHT_START, "**").replace(HIGHLIGHT_STOP, "**").replace("\n", "  \n")
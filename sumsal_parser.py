@@ -0,0 +1,134 @@
+import re
+import numpy as np
+import pandas as pd
+
+# 两种表格布局：
+# VESSEL_ROW_ABOVE —— 内港：船名独占一行，下一行第一格是 S/N 表头
+# SN_ANY_COLUMN   —— 外港：任意一格是 S/N 的行就是表头，船名取表头上一行第一个非空值
+VESSEL_ROW_ABOVE = 'vessel_row_above'
+SN_ANY_COLUMN = 'sn_any_column'
+
+
+def normalize_key(key):
+    if pd.isna(key): return ""
+    return re.sub(r'\s+', '', str(key)).lower()
+
+
+def read_sum_sal_sheet(uploaded_excel):
+    """智能查找目标 Sheet (无视大小写和空格防报错)，不带表头原样读出"""
+    xl = pd.ExcelFile(uploaded_excel)
+    target_sheet = None
+    for sheet in xl.sheet_names:
+        if 'SUM-SAL' in sheet.upper().replace(' ', ''):
+            target_sheet = sheet
+            break
+
+    if not target_sheet:
+        # 如果连名字都不对，直接强行读取第一个 Sheet 兜底
+        return pd.read_excel(xl, sheet_name=0, header=None)
+    return pd.read_excel(xl, sheet_name=target_sheet, header=None)
+
+
+def _cell_strings(df):
+    """逐格 str(x).strip()，与原来逐行读取时的写法结果一致"""
+    return df.astype(object).astype(str).apply(lambda col: col.str.strip())
+
+
+def _vessel_row_above_blocks(values, first_col):
+    """内港布局：返回 [(表头行号, 船名, 表头列表)]"""
+    next_is_sn = first_col.shift(-1).eq('S/N').to_numpy()
+    blocks = []
+    current_vessel = "Unknown Vessel"
+    consumed = -1
+    for i in np.flatnonzero(next_is_sn):
+        # 被上一块当作表头吃掉的行不能再当船名行
+        if i <= consumed:
+            continue
+        row = values[i]
+        first_cell = str(row[0]).strip() if pd.notna(row[0]) else ""
+        if "Vessel Name:" in first_cell:
+            current_vessel = row[1]
+        elif first_cell and first_cell.lower() != 'nan':
+            current_vessel = first_cell
+        raw_headers = values[i + 1]
+        headers_map = {normalize_key(h): idx for idx, h in enumerate(raw_headers) if pd.notna(h)}
+        blocks.append((i + 1, current_vessel, headers_map))
+        consumed = i + 1
+    skip_rows = {h for h, _, _ in blocks} | {h - 1 for h, _, _ in blocks}
+    return blocks, skip_rows
+
+
+def _sn_any_column_blocks(values, cells):
+    """外港布局：返回 [(表头行号, 船名, 表头列表)]"""
+    blocks = []
+    current_vessel = "Unknown Vessel"
+    for i in np.flatnonzero(cells.eq('S/N').any(axis=1).to_numpy()):
+        if i > 0:
+            prev_row = [str(x).strip() for x in values[i - 1] if
+                        pd.notna(x) and str(x).strip() not in ['', 'nan']]
+            if prev_row:
+                v_name = prev_row[0]
+                current_vessel = v_name.split(":", 1)[1].strip() if "Vessel Name:" in v_name else v_name
+        row_vals = cells.iloc[i].tolist()
+        headers_map = {normalize_key(h): idx for idx, h in enumerate(row_vals) if h not in ['nan', '']}
+        blocks.append((i, current_vessel, headers_map))
+    return blocks, {h for h, _, _ in blocks}
+
+
+def _resolve_column(headers_map, keyword):
+    """表头里第一个包含关键字的列号（与逐格扫描 headers_map 的结果一致），找不到返回 None"""
+    norm_key = normalize_key(keyword)
+    for key, idx in headers_map.items():
+        if norm_key in key:
+            return idx
+    return None
+
+
+def parse_sum_sal(df_raw, layout, columns):
+    """
+    一次性解析整张 SUM-SAL 表：
+    用整列的掩码找出所有船舶分块和船员行，每个分块只解析一次表头、把每个字段解析成列号，
+    再按列整块取值。columns 为 {输出列名: 表头关键字}；返回按原表顺序排列的 DataFrame，
+    含 'Vessel Name' 列，空单元格为 ""
+    """
+    out_columns = ['Vessel Name'] + list(columns)
+    if df_raw.empty:
+        return pd.DataFrame(columns=out_columns)
+
+    values = df_raw.to_numpy(dtype=object)
+    if layout == VESSEL_ROW_ABOVE:
+        first_col = _cell_strings(df_raw.iloc[:, [0]]).iloc[:, 0]
+        blocks, skip_rows = _vessel_row_above_blocks(values, first_col)
+    else:
+        cells = _cell_strings(df_raw)
+        first_col = cells.iloc[:, 0]
+        blocks, skip_rows = _sn_any_column_blocks(values, cells)
+
+    if not blocks:
+        return pd.DataFrame(columns=out_columns)
+
+    # 船员行：第一格是纯数字、不是表头/船名行、并且位于第一个表头之后
+    header_rows = np.array([h for h, _, _ in blocks])
+    crew_mask = first_col.str.isdigit().to_numpy(dtype=bool, copy=True)
+    crew_mask[:header_rows[0] + 1] = False
+    if skip_rows:
+        crew_mask[list(skip_rows)] = False
+    crew_rows = np.flatnonzero(crew_mask)
+    block_of_row = np.searchsorted(header_rows, crew_rows, side='right') - 1
+
+    # 每个分块把字段解析成列号，再用一次花式索引整块取值；
+    # 末尾补一列 NaN，表头里找不到的字段都指向这一列
+    missing = values.shape[1]
+    col_of_block = np.array([[_resolve_column(headers_map, keyword) for keyword in columns.values()]
+                             for _, _, headers_map in blocks], dtype=object)
+    col_of_block[pd.isna(col_of_block)] = missing
+    col_of_block = col_of_block.astype(np.intp)
+    vessels = np.empty(len(blocks), dtype=object)
+    vessels[:] = [vessel for _, vessel, _ in blocks]
+    padded = np.concatenate([values, np.full((len(values), 1), np.nan, dtype=object)], axis=1)
+    picked = padded[crew_rows[:, None], col_of_block[block_of_row]]
+    picked[pd.isna(picked)] = ""
+
+    result = pd.DataFrame(picked, columns=list(columns), dtype=object)
+    result.insert(0, 'Vessel Name', vessels[block_of_row])
+    return result